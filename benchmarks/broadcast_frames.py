@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""CPU per broadcast, serializing per client vs. one shared `Frame`
+
+LOG_DIR=/tmp/tangram python benchmarks/broadcast_frames.py --aircraft 3000 --clients 1,10,100,1000,5000
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from typing import Any, List
+
+from tangram.channels import Frame
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+log = logging.getLogger(__name__)
+
+
+class NullWebSocket:
+    """accepts frames and throws them away, so only the server side cost is measured"""
+
+    def __init__(self) -> None:
+        self.sent = 0
+
+    async def send_text(self, text: str) -> None:
+        self.sent += 1
+
+
+def snapshot(aircraft: int) -> List[dict[str, Any]]:
+    return [
+        {
+            "icao24": f"{random.getrandbits(24):06x}",
+            "last": time.time(),
+            "latitude": random.uniform(40, 50),
+            "longitude": random.uniform(-5, 10),
+            "altitude": random.randint(0, 40000),
+            "groundspeed": random.uniform(100, 500),
+            "track": random.uniform(0, 360),
+        }
+        for _ in range(aircraft)
+    ]
+
+
+async def per_client(sockets: List[NullWebSocket], payload: Any) -> None:
+    for websocket in sockets:
+        await websocket.send_text(json.dumps([None, None, "streaming", "new-data", payload]))
+
+
+async def encode_once(sockets: List[NullWebSocket], payload: bytes) -> None:
+    frame = Frame.from_payload_bytes("streaming", "new-data", payload)
+    for websocket in sockets:
+        await frame.send(websocket)
+
+
+async def main(aircraft: int, clients: List[int], rounds: int) -> None:
+    payload = snapshot(aircraft)
+    raw = json.dumps(payload).encode("utf-8")  # what a plugin publishes on `to:streaming:new-data`
+    log.info("payload: %s aircraft, %s bytes", aircraft, len(raw))
+
+    print(f"{'clients':>8} {'per-client ms':>14} {'encode-once ms':>15} {'speedup':>8}")
+    for n in clients:
+        sockets = [NullWebSocket() for _ in range(n)]
+
+        started = time.process_time()
+        for _ in range(rounds):
+            await per_client(sockets, payload)
+        baseline = (time.process_time() - started) / rounds
+
+        started = time.process_time()
+        for _ in range(rounds):
+            await encode_once(sockets, raw)
+        shared = (time.process_time() - started) / rounds
+
+        print(f"{n:>8} {baseline * 1000:>14.3f} {shared * 1000:>15.3f} {baseline / max(shared, 1e-9):>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--aircraft", type=int, default=3000)
+    parser.add_argument("--clients", type=str, default="1,10,100,1000", help="client counts in CSV format")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(main(args.aircraft, [int(n) for n in args.clients.split(",")], args.rounds))
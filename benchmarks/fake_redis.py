@@ -0,0 +1,340 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""A Redis stand-in speaking RESP over TCP, for benchmarks on machines without redis-server
+
+It implements what the channel layer uses: pub/sub (with patterns), strings, hashes, sorted sets,
+key expiry, SCAN and MULTI/EXEC, in a single asyncio task with no persistence.
+
+    python benchmarks/fake_redis.py --port 6380
+"""
+
+import asyncio
+import fnmatch
+import logging
+import time
+from typing import Any, List
+
+log = logging.getLogger(__name__)
+
+
+class Raw(bytes):
+    """a reply that is already encoded"""
+
+
+OK = Raw(b"+OK\r\n")
+QUEUED = Raw(b"+QUEUED\r\n")
+
+
+class Error(Exception):
+    pass
+
+
+class SortedSet(dict):
+    """member -> score, sorted when read"""
+
+
+def score_bound(value: bytes) -> tuple[float, bool]:
+    """`1.5`, `(1.5` (exclusive), `-inf` or `+inf`"""
+    if value.startswith(b"("):
+        return float(value[1:]), True
+    return float(value), False
+
+
+def in_range(score: float, low: tuple[float, bool], high: tuple[float, bool]) -> bool:
+    return (score > low[0] if low[1] else score >= low[0]) and (score < high[0] if high[1] else score <= high[0])
+
+
+def encode(value: Any) -> bytes:
+    if isinstance(value, Raw):
+        return value
+    if value is None:
+        return b"$-1\r\n"
+    if isinstance(value, bool):
+        return b":%d\r\n" % int(value)
+    if isinstance(value, int):
+        return b":%d\r\n" % value
+    if isinstance(value, str):
+        value = value.encode("utf-8")
+    if isinstance(value, bytes):
+        return b"$%d\r\n%s\r\n" % (len(value), value)
+    if isinstance(value, Error):
+        return b"-ERR %s\r\n" % str(value).encode("utf-8")
+    if isinstance(value, (list, tuple)):
+        return b"*%d\r\n" % len(value) + b"".join(encode(item) for item in value)
+    raise TypeError(f"cannot encode {type(value)}")
+
+
+async def read_command(reader: asyncio.StreamReader) -> List[bytes] | None:
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b"*"):  # inline command, e.g. from telnet
+        return line.split()
+    arguments = []
+    for _ in range(int(line[1:])):
+        size = int((await reader.readline())[1:])
+        arguments.append((await reader.readexactly(size + 2))[:-2])
+    return arguments
+
+
+class Connection:
+    def __init__(self, server: "FakeRedis", writer: asyncio.StreamWriter) -> None:
+        self.server = server
+        self.writer = writer
+        self.channels: set[bytes] = set()
+        self.patterns: set[bytes] = set()
+        self.transaction: List[List[bytes]] | None = None
+
+    def push(self, data: bytes) -> None:
+        self.writer.write(data)
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self.data: dict[bytes, Any] = {}
+        self.expires: dict[bytes, float] = {}  # key -> monotonic deadline
+        self.connections: set[Connection] = set()
+        self.published = 0
+
+    # keyspace
+
+    def _alive(self, key: bytes) -> bool:
+        if (deadline := self.expires.get(key)) is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            del self.expires[key]
+        return key in self.data
+
+    def _get(self, key: bytes, kind: type) -> Any:
+        if not self._alive(key):
+            return None
+        value = self.data[key]
+        if type(value) is not kind:  # a sorted set is a dict too
+            raise Error("WRONGTYPE Operation against a key holding the wrong kind of value")
+        return value
+
+    def _delete(self, key: bytes) -> int:
+        self.expires.pop(key, None)
+        return int(self.data.pop(key, None) is not None)
+
+    # commands, `cmd_<name>(connection, *arguments)`
+
+    def cmd_ping(self, connection: Connection, *args: bytes) -> Any:
+        return args[0] if args else b"PONG"
+
+    def cmd_hello(self, connection: Connection, *args: bytes) -> Any:
+        if args and args[0] not in (b"2",):
+            raise Error("NOPROTO this fake only speaks RESP2, connect with `?protocol=2`")
+        return [b"server", b"redis", b"version", b"7.2.0", b"proto", 2, b"mode", b"standalone", b"role", b"master", b"modules", []]
+
+    def cmd_client(self, connection: Connection, *args: bytes) -> Any:
+        return OK  # SETINFO, SETNAME
+
+    def cmd_select(self, connection: Connection, *args: bytes) -> Any:
+        return OK
+
+    def cmd_get(self, connection: Connection, key: bytes) -> Any:
+        return self._get(key, bytes)
+
+    def cmd_mget(self, connection: Connection, *keys: bytes) -> Any:
+        return [self.data[key] if self._alive(key) and isinstance(self.data[key], bytes) else None for key in keys]
+
+    def cmd_set(self, connection: Connection, key: bytes, value: bytes, *options: bytes) -> Any:
+        self._delete(key)
+        self.data[key] = value
+        names = [option.upper() for option in options]
+        if b"EX" in names:
+            self.expires[key] = time.monotonic() + int(options[names.index(b"EX") + 1])
+        elif b"PX" in names:
+            self.expires[key] = time.monotonic() + int(options[names.index(b"PX") + 1]) / 1000
+        return OK
+
+    def cmd_del(self, connection: Connection, *keys: bytes) -> Any:
+        return sum(self._delete(key) for key in keys if self._alive(key))
+
+    def cmd_exists(self, connection: Connection, *keys: bytes) -> Any:
+        return sum(self._alive(key) for key in keys)
+
+    def cmd_expire(self, connection: Connection, key: bytes, seconds: bytes) -> Any:
+        if not self._alive(key):
+            return 0
+        self.expires[key] = time.monotonic() + int(seconds)
+        return 1
+
+    def cmd_hset(self, connection: Connection, key: bytes, *pairs: bytes) -> Any:
+        if len(pairs) % 2:
+            raise Error("wrong number of arguments for 'hset' command")
+        mapping = self._get(key, dict)
+        if mapping is None:
+            mapping = self.data[key] = {}
+        added = sum(field not in mapping for field in pairs[::2])
+        mapping.update(zip(pairs[::2], pairs[1::2]))
+        return added
+
+    def cmd_hdel(self, connection: Connection, key: bytes, *fields: bytes) -> Any:
+        mapping = self._get(key, dict) or {}
+        removed = sum(mapping.pop(field, None) is not None for field in fields)
+        if key in self.data and not mapping:
+            self._delete(key)
+        return removed
+
+    def cmd_hgetall(self, connection: Connection, key: bytes) -> Any:
+        mapping = self._get(key, dict) or {}
+        return [item for pair in mapping.items() for item in pair]
+
+    def cmd_zadd(self, connection: Connection, key: bytes, *arguments: bytes) -> Any:
+        options = []
+        while arguments and arguments[0].upper() in (b"NX", b"XX", b"GT", b"LT", b"CH"):
+            options.append(arguments[0].upper())
+            arguments = arguments[1:]
+        if not arguments or len(arguments) % 2:
+            raise Error("wrong number of arguments for 'zadd' command")
+        members = self._get(key, SortedSet)
+        if members is None:
+            members = self.data[key] = SortedSet()
+        added = changed = 0
+        for score, member in zip(map(float, arguments[::2]), arguments[1::2]):
+            exists = member in members
+            if (b"NX" in options and exists) or (b"XX" in options and not exists):
+                continue
+            if exists and ((b"GT" in options and score <= members[member]) or (b"LT" in options and score >= members[member])):
+                continue
+            added += not exists
+            changed += not exists or members[member] != score
+            members[member] = score
+        return changed if b"CH" in options else added
+
+    def cmd_zrem(self, connection: Connection, key: bytes, *members: bytes) -> Any:
+        scores = self._get(key, SortedSet) or {}
+        removed = sum(scores.pop(member, None) is not None for member in members)
+        if key in self.data and not scores:
+            self._delete(key)
+        return removed
+
+    def cmd_zrangebyscore(self, connection: Connection, key: bytes, low: bytes, high: bytes, *options: bytes) -> Any:
+        names = [option.upper() for option in options]
+        bounds = score_bound(low), score_bound(high)
+        scores = sorted(((score, member) for member, score in (self._get(key, SortedSet) or {}).items() if in_range(score, *bounds)))
+        if b"LIMIT" in names:
+            offset, count = (int(value) for value in options[names.index(b"LIMIT") + 1 : names.index(b"LIMIT") + 3])
+            scores = scores[offset:] if count < 0 else scores[offset : offset + count]
+        if b"WITHSCORES" in names:
+            return [item for score, member in scores for item in (member, repr(score).encode("utf-8"))]
+        return [member for _, member in scores]
+
+    def cmd_zremrangebyscore(self, connection: Connection, key: bytes, low: bytes, high: bytes) -> Any:
+        bounds = score_bound(low), score_bound(high)
+        scores = self._get(key, SortedSet) or {}
+        removed = [member for member, score in scores.items() if in_range(score, *bounds)]
+        for member in removed:
+            del scores[member]
+        if key in self.data and not scores:
+            self._delete(key)
+        return len(removed)
+
+    def cmd_scan(self, connection: Connection, cursor: bytes, *options: bytes) -> Any:
+        names = [option.upper() for option in options]
+        pattern = options[names.index(b"MATCH") + 1].decode("utf-8") if b"MATCH" in names else "*"
+        keys = [key for key in list(self.data) if self._alive(key) and fnmatch.fnmatchcase(key.decode("utf-8"), pattern)]
+        return [b"0", keys]  # everything in one round
+
+    def cmd_publish(self, connection: Connection, channel: bytes, message: bytes) -> Any:
+        self.published += 1
+        receivers = 0
+        name = channel.decode("utf-8")
+        for other in self.connections:
+            if channel in other.channels:
+                other.push(encode([b"message", channel, message]))
+                receivers += 1
+            for pattern in other.patterns:
+                if fnmatch.fnmatchcase(name, pattern.decode("utf-8")):
+                    other.push(encode([b"pmessage", pattern, channel, message]))
+                    receivers += 1
+        return receivers
+
+    def _subscription(self, connection: Connection, kind: bytes, names: tuple[bytes, ...], subscribed: set[bytes], adding: bool) -> Any:
+        if not names and not adding:
+            names = tuple(subscribed)
+        replies = []
+        for name in names:
+            (subscribed.add if adding else subscribed.discard)(name)
+            replies.append(encode([kind, name, len(connection.channels) + len(connection.patterns)]))
+        if not replies:  # unsubscribing from nothing
+            replies.append(encode([kind, None, 0]))
+        return Raw(b"".join(replies))
+
+    def cmd_subscribe(self, connection: Connection, *channels: bytes) -> Any:
+        return self._subscription(connection, b"subscribe", channels, connection.channels, True)
+
+    def cmd_unsubscribe(self, connection: Connection, *channels: bytes) -> Any:
+        return self._subscription(connection, b"unsubscribe", channels, connection.channels, False)
+
+    def cmd_psubscribe(self, connection: Connection, *patterns: bytes) -> Any:
+        return self._subscription(connection, b"psubscribe", patterns, connection.patterns, True)
+
+    def cmd_punsubscribe(self, connection: Connection, *patterns: bytes) -> Any:
+        return self._subscription(connection, b"punsubscribe", patterns, connection.patterns, False)
+
+    # protocol
+
+    def execute(self, connection: Connection, command: List[bytes]) -> bytes:
+        name = command[0].decode("utf-8").lower()
+        if name == "multi":
+            connection.transaction = []
+            return OK
+        if name == "exec":
+            queued, connection.transaction = connection.transaction or [], None
+            return b"*%d\r\n" % len(queued) + b"".join(self.execute(connection, each) for each in queued)
+        if name == "discard":
+            connection.transaction = None
+            return OK
+        if connection.transaction is not None:
+            connection.transaction.append(command)
+            return QUEUED
+
+        handler = getattr(self, f"cmd_{name}", None)
+        if handler is None:
+            return encode(Error(f"unknown command '{name}'"))
+        try:
+            reply = handler(connection, *command[1:])
+        except Error as exc:
+            return encode(exc)
+        except (TypeError, ValueError, IndexError) as exc:
+            return encode(Error(f"syntax error in '{name}': {exc}"))
+        return encode(reply)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        connection = Connection(self, writer)
+        self.connections.add(connection)
+        try:
+            while (command := await read_command(reader)) is not None:
+                if command:
+                    writer.write(self.execute(connection, command))
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.connections.discard(connection)
+            writer.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.Server:
+        """listening, port 0 picks a free one, see `server.sockets[0].getsockname()`"""
+        return await asyncio.start_server(self.handle, host, port)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    args = parser.parse_args()
+
+    async def main() -> None:
+        server = await FakeRedis().serve(args.host, args.port)
+        log.info("fake redis listening on %s:%s", args.host, args.port)
+        async with server:
+            await server.serve_forever()
+
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""Box and time window queries on the history, R*Tree indices vs. a scan of the partitions
+
+Rows are synthetic aircraft flying straight lines over Europe during the last two hours, written
+through `HistoryDB`, so with the triggers maintaining the indices.
+
+    LOG_DIR=/tmp/tangram python benchmarks/history_rtree.py --rows 2000000 --queries 50
+"""
+
+import logging
+import math
+import random
+import tempfile
+import time
+from typing import Any, Callable, List
+
+from tangram.plugins.history import TRAJECTORIES, HistoryDB
+from tangram.util.spatial import BoundingBox
+
+logging.basicConfig(level=logging.WARNING, format="%(asctime)s - %(message)s")
+log = logging.getLogger(__name__)
+
+
+def flights(rows: int, aircraft: int, seconds: float) -> List[dict[str, Any]]:
+    """one position per aircraft and step, aircraft at 450 kts in random directions"""
+    now = time.time()
+    steps = rows // aircraft
+    items = []
+    for i in range(aircraft):
+        icao24 = f"{i:06x}"
+        latitude, longitude = random.uniform(40, 55), random.uniform(-5, 15)
+        heading = math.radians(random.uniform(0, 360))
+        speed = 450 / 60 / 3600  # degrees per second, roughly
+        interval = seconds / steps
+        for step in range(steps):
+            t = step * interval
+            items.append(
+                {
+                    "icao24": icao24,
+                    "last": now - seconds + t,
+                    "latitude": latitude + speed * t * math.cos(heading),
+                    "longitude": longitude + speed * t * math.sin(heading),
+                    "altitude": 35000.0,
+                }
+            )
+    return items
+
+
+def scan(db: HistoryDB, bbox: BoundingBox, since: float) -> List[dict[str, Any]]:
+    """the same answer as `list_aircraft_in`, without the indices"""
+    with db.readers.connection() as conn:
+        partitions = db._partitions(conn, TRAJECTORIES, since)
+        sql = " UNION ALL ".join(
+            f"SELECT icao24, last FROM {name} WHERE latitude BETWEEN {bbox.south!r} AND {bbox.north!r} "
+            f"AND longitude BETWEEN {bbox.west!r} AND {bbox.east!r} AND last >= {since!r}"
+            for _, name in partitions
+        )
+        rows = conn.execute(f"SELECT icao24, min(last), max(last), count(*) FROM ({sql}) GROUP BY icao24 ORDER BY icao24").fetchall()
+    return [dict(zip(["icao24", "first", "last", "count"], row)) for row in rows]
+
+
+def measure(query: Callable[[], Any], queries: int) -> tuple[float, Any]:
+    started = time.perf_counter()
+    for _ in range(queries):
+        result = query()
+    return (time.perf_counter() - started) / queries, result
+
+
+def main(rows: int, aircraft: int, queries: int, size: float, minutes: float) -> None:
+    db = HistoryDB(use_memory=False, directory=tempfile.mkdtemp(), commit_rows=50000)
+    items = flights(rows, aircraft, 2 * 3600)
+    started = time.perf_counter()
+    for i in range(0, len(items), 10000):
+        db.insert_many_tracks(items[i : i + 10000])
+    db.flush()
+    print(f"{len(items)} rows inserted in {time.perf_counter() - started:.1f}s, with the indices")
+
+    since = time.time() - minutes * 60
+    print(f"{'box':>24} {'aircraft':>9} {'rtree ms':>9} {'scan ms':>9} {'speedup':>8}")
+    for _ in range(5):
+        west, south = random.uniform(-5, 15 - size), random.uniform(40, 55 - size)
+        bbox = BoundingBox(west, south, west + size, south + size)
+        indexed, found = measure(lambda bbox=bbox: db.list_aircraft_in(bbox, since), queries)
+        scanned, expected = measure(lambda bbox=bbox: scan(db, bbox, since), max(queries // 10, 1))
+        assert {row["icao24"] for row in expected} <= {row["icao24"] for row in found}
+        name = f"{west:.1f},{south:.1f} +{size}°"
+        print(f"{name:>24} {len(found):>9} {indexed * 1000:>9.2f} {scanned * 1000:>9.2f} {scanned / max(indexed, 1e-9):>8.1f}")
+    db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--aircraft", type=int, default=4000)
+    parser.add_argument("--queries", type=int, default=20, help="per box")
+    parser.add_argument("--size", type=float, default=1.0, help="degrees, box side")
+    parser.add_argument("--minutes", type=float, default=30, help="time window")
+    args = parser.parse_args()
+    main(args.rows, args.aircraft, args.queries, args.size, args.minutes)
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""CPU per `/all` and `/track` response, pydantic `Jet1090Data` vs. msgspec `Jet1090Record`
+
+LOG_DIR=/tmp/tangram python benchmarks/rs1090_decoding.py --aircraft 3000 --points 600
+"""
+
+import json
+import logging
+import random
+import time
+from typing import Any, Callable, List
+
+from tangram.plugins.common import rs1090
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+log = logging.getLogger(__name__)
+
+
+def all_response(aircraft: int) -> bytes:
+    """like jet1090 `/all`"""
+    now = time.time()
+    return json.dumps(
+        [
+            {
+                "icao24": f"{random.getrandbits(24):06x}",
+                "first": now - 600,
+                "last": now,
+                "callsign": "AFR1234",
+                "squawk": "7000",
+                "latitude": random.uniform(40, 50),
+                "longitude": random.uniform(-5, 10),
+                "altitude": random.randint(0, 40000),
+                "selected_altitude": 26000,
+                "groundspeed": random.uniform(100, 500),
+                "vertical_rate": random.choice([-64, 0, 64]),
+                "track": random.uniform(0, 360),
+                "IAS": 300,
+                "TAS": None,
+                "Mach": 0.728,
+                "roll": None,
+                "heading": random.uniform(0, 360),
+                "nacp": 9,
+            }
+            for _ in range(aircraft)
+        ]
+    ).encode("utf-8")
+
+
+def track_response(points: int) -> bytes:
+    """like jet1090 `/track?icao24=...`, with nested BDS 5,0 and 6,0 reports"""
+    now = time.time()
+    items: List[dict[str, Any]] = []
+    for i in range(points):
+        item: dict[str, Any] = {"icao24": "39c902", "df": random.choice([17, 20, 21]), "timestamp": now - points + i, "idx": i}
+        if i % 3 == 0:
+            item |= {"latitude": random.uniform(40, 50), "longitude": random.uniform(-5, 10), "altitude": random.randint(0, 40000)}
+        elif i % 3 == 1:
+            item["bds50"] = {"roll": random.uniform(-5, 5), "track": random.uniform(0, 360), "groundspeed": 420, "TAS": 430, "track_rate": 0.1}
+        else:
+            item["bds60"] = {"heading": random.uniform(0, 360), "IAS": 280, "Mach": 0.78, "vrate_barometric": 0, "vrate_inertial": 32}
+        items.append(item)
+    return json.dumps(items).encode("utf-8")
+
+
+pydantic_client = rs1090.Rs1090Client(decoder="pydantic")
+
+
+def pydantic_path(content: bytes) -> list:
+    """what `Rs1090Client` did before: JSON to dicts, flattened in place, then validated"""
+    return [pydantic_client.flatten(item) for item in json.loads(content)]
+
+
+def msgspec_path(content: bytes) -> list:
+    return rs1090.records_decoder.decode(content)
+
+
+def measure(decode: Callable[[bytes], list], content: bytes, rounds: int) -> float:
+    started = time.process_time()
+    for _ in range(rounds):
+        decode(content)
+    return (time.process_time() - started) / rounds
+
+
+def main(aircraft: int, points: int, rounds: int) -> None:
+    print(f"{'response':>10} {'bytes':>9} {'pydantic ms':>12} {'msgspec ms':>11} {'speedup':>8}")
+    for name, content in [("/all", all_response(aircraft)), ("/track", track_response(points))]:
+        assert rs1090.encode_records(pydantic_path(content)) == rs1090.encode_records(msgspec_path(content))
+        baseline, fast = measure(pydantic_path, content, rounds), measure(msgspec_path, content, rounds)
+        print(f"{name:>10} {len(content):>9} {baseline * 1000:>12.3f} {fast * 1000:>11.3f} {baseline / max(fast, 1e-9):>8.1f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--aircraft", type=int, default=3000, help="items in `/all`")
+    parser.add_argument("--points", type=int, default=600, help="items in `/track`")
+    parser.add_argument("--rounds", type=int, default=20)
+    args = parser.parse_args()
+    main(args.aircraft, args.points, args.rounds)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""Bytes per point and throughput of compressed track chunks, vs. dicts (`list_tracks`) and float64 arrays
+
+Tracks are synthetic aircraft reporting positions every ~0.5s, climbing, cruising and turning, with
+a few missing altitudes, like the rows of the track store.
+
+    LOG_DIR=/tmp/tangram python benchmarks/track_compression.py --aircraft 100 --hours 2
+"""
+
+import sys
+import time
+from typing import Any, List
+
+import numpy as np
+
+from tangram.util import trackcodec
+
+
+def track(points: int, start: float) -> np.ndarray:
+    """(n, 4) rows"""
+    rng = np.random.default_rng()
+    timestamps = start + np.cumsum(rng.uniform(0.4, 0.6, points))
+    heading = np.cumsum(rng.normal(0, 0.002, points)) + rng.uniform(0, 2 * np.pi)
+    speed = 450 / 60 / 3600 * 0.5  # degrees per report, roughly
+    latitudes = rng.uniform(40, 55) + np.cumsum(speed * np.cos(heading))
+    longitudes = rng.uniform(-5, 15) + np.cumsum(speed * np.sin(heading))
+    altitudes = np.minimum(np.arange(points) * 10.0, 36000.0) // 25 * 25
+    altitudes[rng.random(points) < 0.05] = np.nan
+    return np.column_stack((timestamps, latitudes, longitudes, altitudes))
+
+
+def dict_size(rows: List[dict[str, Any]]) -> int:
+    """deep size of `list_tracks` results, floats shared by nothing"""
+    size = sys.getsizeof(rows)
+    for row in rows:
+        size += sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row.values())
+    return size
+
+
+def main(aircraft: int, hours: float, chunk_points: int) -> None:
+    points = int(hours * 3600 / 0.5)
+    tracks = [track(points, time.time() - hours * 3600) for _ in range(aircraft)]
+    total = aircraft * points
+
+    sample = [
+        dict(zip(["id", "icao24", "timestamp", "latitude", "longitude", "altitude"], (i, "abc123", *row))) for i, row in enumerate(tracks[0][:10000].tolist())
+    ]
+    dicts = dict_size(sample) / len(sample)
+
+    started = time.perf_counter()
+    compressed = []
+    for rows in tracks:
+        compressed_track = trackcodec.CompressedTrack(chunk_points)
+        compressed_track.extend(rows)
+        compressed.append(compressed_track)
+    encode = time.perf_counter() - started
+    nbytes = sum(compressed_track.nbytes for compressed_track in compressed)
+
+    started = time.perf_counter()
+    decoded = 0
+    for compressed_track in compressed:
+        for chunk in compressed_track.iter_chunks():  # streaming, one chunk in memory at a time
+            decoded += len(chunk)
+    decode = time.perf_counter() - started
+
+    error = np.nanmax(np.abs(compressed[0].array() - tracks[0]), axis=0)
+    print(f"{aircraft} aircraft, {hours}h, {total} points, chunks of {chunk_points}")
+    print(f"{'format':>12} {'bytes/point':>12} {'MB':>9}")
+    for name, size in [("dicts", dicts), ("float64", 32.0), ("compressed", nbytes / total)]:
+        print(f"{name:>12} {size:>12.1f} {size * total / 1e6:>9.1f}")
+    print(f"encode {total / encode / 1e6:.2f} M points/s, decode {decoded / decode / 1e6:.2f} M points/s")
+    print(f"largest error: {error[0]:.4f}s, {error[1]:.2e}° latitude, {error[2]:.2e}° longitude, {error[3]:.1f}ft")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--aircraft", type=int, default=100)
+    parser.add_argument("--hours", type=float, default=2)
+    parser.add_argument("--chunk-points", dest="chunk_points", type=int, default=1024)
+    args = parser.parse_args()
+    main(args.aircraft, args.hours, args.chunk_points)
@@ -0,0 +1,276 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""Load test of the `/websocket` endpoint: N phoenix clients joining `streaming`, fed with synthetic snapshots
+
+The app runs in its own process (uvicorn), against `--redis-url` or an in-process fake redis, clients and the
+snapshot publisher run here. For every N, it reports delivery latency (publish to client receive), server CPU per
+delivered message, and server memory per connection (Linux, from /proc).
+
+    LOG_DIR=/tmp/tangram python benchmarks/websocket_fanout.py --clients 10,100,1000,5000 --output fanout.json
+    LOG_DIR=/tmp/tangram python benchmarks/websocket_fanout.py --clients 10,100,1000,5000 --baseline fanout.json
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import socket
+import statistics
+import sys
+import time
+from typing import Any, List
+
+import httpx
+import redis.asyncio as aioredis
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from fake_redis import FakeRedis  # noqa: E402
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
+log = logging.getLogger(__name__)
+
+SEQ_PATTERN = re.compile(rb'"seq":\s*(\d+)')
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK")
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def cpu_seconds(pid: int) -> float:
+    """user and system time of a process"""
+    with open(f"/proc/{pid}/stat") as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / CLOCK_TICKS
+
+
+def rss_bytes(pid: int) -> int:
+    with open(f"/proc/{pid}/statm") as f:
+        return int(f.read().split()[1]) * PAGE_SIZE
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def snapshot(aircraft: int, seq: int) -> bytes:
+    """what the streaming plugin publishes, the first record carries the sequence number"""
+    records = [
+        {
+            "icao24": f"{i:06x}",
+            "lastseen": time.time(),
+            "latitude": random.uniform(40, 50),
+            "longitude": random.uniform(-5, 10),
+            "altitude": random.randint(0, 40000),
+            "groundspeed": random.uniform(100, 500),
+            "track": random.uniform(0, 360),
+        }
+        for i in range(aircraft)
+    ]
+    records[0]["seq"] = seq
+    return json.dumps(records).encode("utf-8")
+
+
+class SimulatedClient:
+    """a browser: joins the channel, heartbeats, and timestamps every snapshot it receives"""
+
+    def __init__(self, url: str, channel: str, heartbeat: float, published: dict[int, float], latencies: List[float]) -> None:
+        self.url = url
+        self.channel = channel
+        self.heartbeat = heartbeat
+        self.published = published  # seq -> perf_counter when published
+        self.latencies = latencies
+        self.received: set[int] = set()
+        self.websocket: Any = None
+        self.tasks: List[asyncio.Task] = []
+
+    async def join(self) -> None:
+        self.websocket = await websockets.connect(self.url, max_size=None, ping_interval=None)
+        await self.websocket.send(json.dumps(["1", "1", self.channel, "phx_join", {}]))
+        while True:  # the reply may follow snapshots already fanned out
+            message = json.loads(await self.websocket.recv())
+            if message[3] == "phx_reply" and message[1] == "1":
+                break
+        self.tasks = [asyncio.create_task(self._listen()), asyncio.create_task(self._heartbeat())]
+
+    async def _listen(self) -> None:
+        try:
+            async for message in self.websocket:
+                received = time.perf_counter()
+                data = message if isinstance(message, bytes) else message.encode("utf-8")
+                if (match := SEQ_PATTERN.search(data, 0, 512)) is not None and (seq := int(match.group(1))) in self.published:
+                    self.received.add(seq)
+                    self.latencies.append(received - self.published[seq])
+        except websockets.ConnectionClosed:
+            pass
+
+    async def _heartbeat(self) -> None:
+        for ref in range(2, sys.maxsize):
+            await asyncio.sleep(self.heartbeat)
+            await self.websocket.send(json.dumps([None, str(ref), "phoenix", "heartbeat", {}]))
+
+    async def close(self) -> None:
+        for task in self.tasks:
+            task.cancel()
+        if self.websocket is not None:
+            await self.websocket.close()
+
+
+class Server:
+    """tangram.app served by uvicorn in a child process"""
+
+    def __init__(self, redis_url: str, port: int) -> None:
+        self.redis_url = redis_url
+        self.port = port
+        self.process: asyncio.subprocess.Process | None = None
+
+    async def start(self, timeout: float = 30) -> None:
+        env = {**os.environ, "REDIS_URL": self.redis_url}
+        command = [sys.executable, "-m", "uvicorn", "tangram.app:app", "--host", "127.0.0.1", "--port", str(self.port), "--log-level", "warning"]
+        self.process = await asyncio.create_subprocess_exec(*command, env=env)
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                try:
+                    if (await client.get(f"http://127.0.0.1:{self.port}/uptime")).status_code == 200:
+                        return
+                except httpx.TransportError:
+                    pass
+                await asyncio.sleep(0.2)
+        raise RuntimeError(f"tangram.app is not ready after {timeout}s")
+
+    @property
+    def pid(self) -> int:
+        assert self.process is not None
+        return self.process.pid
+
+    async def stop(self, timeout: float = 10) -> None:
+        """without blocking the loop, the app shuts down through the fake redis served by this process"""
+        if self.process is None:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.wait_for(self.process.wait(), timeout)
+        except asyncio.TimeoutError:
+            self.process.kill()
+            await self.process.wait()
+
+
+async def run(n: int, redis_url: str, args: Any) -> dict[str, Any]:
+    server = Server(redis_url, free_port())
+    await server.start()
+    redis_client = aioredis.from_url(redis_url)
+    published: dict[int, float] = {}
+    latencies: List[float] = []
+    clients = [SimulatedClient(f"ws://127.0.0.1:{server.port}/websocket", args.channel, args.heartbeat, published, latencies) for _ in range(n)]
+    try:
+        rss_idle = rss_bytes(server.pid)
+        connecting = asyncio.Semaphore(args.connect_concurrency)
+
+        async def join(client: SimulatedClient) -> None:
+            async with connecting:
+                await client.join()
+
+        await asyncio.gather(*(join(client) for client in clients))
+        await asyncio.sleep(1)
+        rss_connected = rss_bytes(server.pid)
+
+        payloads = [snapshot(args.aircraft, seq) for seq in range(args.messages)]
+        cpu_before = cpu_seconds(server.pid)
+        for seq, payload in enumerate(payloads):
+            published[seq] = time.perf_counter()
+            await redis_client.publish(f"to:{args.channel}:new-data", payload)
+            await asyncio.sleep(1 / args.rate)
+
+        deadline = time.monotonic() + args.drain
+        while time.monotonic() < deadline and any(len(client.received) < args.messages for client in clients):
+            await asyncio.sleep(0.1)
+        cpu = cpu_seconds(server.pid) - cpu_before
+    finally:
+        await asyncio.gather(*(client.close() for client in clients), return_exceptions=True)
+        await redis_client.aclose()
+        await server.stop()
+
+    delivered = len(latencies)
+    return {
+        "clients": n,
+        "expected": n * args.messages,
+        "delivered": delivered,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else float("nan"),
+        "cpu_us_per_message": cpu / delivered * 1e6 if delivered else float("nan"),
+        "rss_kb_per_connection": (rss_connected - rss_idle) / n / 1024,
+        "payload_bytes": len(payloads[0]),
+    }
+
+
+def report(results: List[dict[str, Any]], baseline: List[dict[str, Any]] | None = None) -> None:
+    previous = {result["clients"]: result for result in baseline or []}
+    print(f"{'clients':>8} {'delivered':>10} {'p50 ms':>9} {'p99 ms':>9} {'cpu us/msg':>11} {'rss KB/conn':>12}")
+    for result in results:
+        print(
+            f"{result['clients']:>8} {result['delivered'] / max(result['expected'], 1):>10.1%} {result['p50_ms']:>9.2f} {result['p99_ms']:>9.2f}"
+            f" {result['cpu_us_per_message']:>11.1f} {result['rss_kb_per_connection']:>12.1f}"
+        )
+        if (before := previous.get(result["clients"])) is not None:
+            changes = [
+                f"{name} {(result[name] - before[name]) / before[name]:+.1%}"
+                for name in ("p50_ms", "p99_ms", "cpu_us_per_message", "rss_kb_per_connection")
+                if before[name]
+            ]
+            print(f"{'':>8} vs. baseline: {', '.join(changes)}")
+
+
+async def main(args: Any) -> None:
+    fake_server = None
+    redis_url = args.redis_url
+    if redis_url is None:
+        fake_server = await FakeRedis().serve()
+        redis_url = "redis://127.0.0.1:%s?protocol=2" % fake_server.sockets[0].getsockname()[1]  # recent redis-py defaults to RESP3
+        log.info("using the in-process fake redis at %s", redis_url)
+
+    results = []
+    for n in args.clients:
+        log.info("%s clients, %s messages of %s aircraft at %s/s ...", n, args.messages, args.aircraft, args.rate)
+        results.append(await run(n, redis_url, args))
+
+    if fake_server is not None:
+        fake_server.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", dest="redis_url", default=None, help="an in-process fake redis when not set")
+    parser.add_argument("--clients", type=lambda value: [int(n) for n in value.split(",")], default=[10, 100, 1000], help="client counts in CSV format")
+    parser.add_argument("--channel", default="streaming")
+    parser.add_argument("--aircraft", type=int, default=200, help="aircraft per snapshot")
+    parser.add_argument("--messages", type=int, default=20, help="snapshots published per run")
+    parser.add_argument("--rate", type=float, default=5, help="snapshots per second")
+    parser.add_argument("--heartbeat", type=float, default=30, help="seconds between client heartbeats")
+    parser.add_argument("--drain", type=float, default=10, help="seconds to wait for the last deliveries")
+    parser.add_argument("--connect-concurrency", dest="connect_concurrency", type=int, default=100)
+    parser.add_argument("--output", help="write results as JSON, to be used as a baseline")
+    parser.add_argument("--baseline", help="results of a previous run to compare with")
+    asyncio.run(main(parser.parse_args()))
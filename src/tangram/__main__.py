@@ -26,6 +26,7 @@ def main():
     parser.add_argument(
         "--reload", action="store_true", default=False, help=f"hot reload (default: {tangram_settings.reload})"
     )
+    parser.add_argument("--workers", type=int, help=f"worker processes serving websockets (default: {tangram_settings.workers})")
     args = parser.parse_args()
 
     if args.command == "dump-config":
@@ -33,19 +34,32 @@ def main():
         return
 
     log.info("working dir: %s", pathlib.Path.cwd())
-    uvicorn_config = uvicorn.Config(
+    workers = args.workers or tangram_settings.workers
+    reload = args.reload or tangram_settings.reload
+    if workers > 1 and reload:
+        log.warning("hot reload is not available with %s workers, disabled", workers)
+        reload = False
+
+    uvicorn_options = dict(
         app="tangram.app:app",
         ws="websockets",
         host=args.host or tangram_settings.host,
         port=args.port or tangram_settings.port,
-        reload=args.reload or tangram_settings.reload,
+        reload=reload,
+        workers=workers,
         # reload_dirs=[str(TANGRAM_PACKAGE_ROOT)],
         log_config=tangram_settings.log_config,
     )
+    uvicorn_config = uvicorn.Config(**uvicorn_options)
     log.error("uvicorn config: %s", uvicorn_config)
-    log.info("should reload: %s", uvicorn_config.should_reload)
+    log.info("should reload: %s, workers: %s", uvicorn_config.should_reload, uvicorn_config.workers)
     try:
-        uvicorn.Server(uvicorn_config).run()
+        if uvicorn_config.workers > 1:
+            # uvicorn supervises the worker processes, channel membership is shared
+            # between them through redis, see `tangram.channels.PresenceRegistry`
+            uvicorn.run(**uvicorn_options)
+        else:
+            uvicorn.Server(uvicorn_config).run()
     except KeyboardInterrupt:
         print("\ruser interrupted, bye.")
 
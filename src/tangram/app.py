@@ -5,20 +5,26 @@ import contextlib
 import logging
 import os
 import pathlib
+import sqlite3
 import uuid
 from datetime import datetime
-from typing import Any
+from typing import TYPE_CHECKING, Any
 
 # import anyio
 import httpx
 import redis.asyncio as redis
-from fastapi import FastAPI, Request, WebSocket
+from fastapi import FastAPI, HTTPException, Request, WebSocket
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from starlette.responses import HTMLResponse
+from starlette.responses import HTMLResponse, Response
 
-from tangram import channels
+from tangram import channels, metrics
+from tangram.plugins import rs1090_source
 from tangram.plugins.common import rs1090
+from tangram.util.spatial import BoundingBox
+
+if TYPE_CHECKING:
+    from tangram.plugins.history import HistoryDB
 
 # from tangram.plugins import coordinate, web_event
 
@@ -26,8 +32,11 @@ log = logging.getLogger("tangram")
 
 REDIS_URL = os.getenv("REDIS_URL", "redis://redis:6379")
 JET1090_URL = os.getenv("JET1090_URL", "http://jet1090:8080")
+JET1090_PUSH = os.getenv("TANGRAM_JET1090_PUSH", "").lower() in ("1", "true", "yes")  # ingest jet1090 websocket feed in this process
 
 jet1090_restful_client = rs1090.Rs1090Client()
+track_cache = rs1090.TrackCache(jet1090_restful_client)  # `/data` of a popular flight is one jet1090 request
+history_db: None | HistoryDB = None  # the database written by the history plugin, opened read only on first use
 jet1090_websocket_task: None | asyncio.Task[None] = None
 jet1090_client_task: None | asyncio.Task[None] = None
 
@@ -56,6 +65,13 @@ async def lifespan(app: FastAPI):
     app.redis_connection_pool = redis.ConnectionPool.from_url(REDIS_URL)
 
     await channels.broadcast.connect()  # initialize the websocket broadcast
+    await channels.fanout.start()  # one redis subscription per channel, fanned out to local websockets
+    await channels.publisher.start()  # client events, published to redis in batches
+    await channels.presence.start()  # channel membership, shared with the other workers
+
+    global jet1090_websocket_task
+    if JET1090_PUSH:  # timed messages pushed by jet1090, to `jet1090-full`
+        jet1090_websocket_task = await rs1090_source.startup(REDIS_URL, JET1090_URL)
 
     # listen for web UI events
     # await web_event.startup(REDIS_URL)
@@ -70,6 +86,12 @@ async def lifespan(app: FastAPI):
     yield  # The application is now running and serving requests
 
     log.debug("shutting down...")
+    await channels.fanout.stop()
+    await channels.publisher.stop()
+    await channels.presence.stop()
+    if jet1090_websocket_task:
+        await rs1090_source.shutdown()
+
     # TODO: task for cleanup, they are disabled for now
     #
     # await trajectory.shutdown()
@@ -89,6 +111,15 @@ async def lifespan(app: FastAPI):
 
 app = FastAPI(lifespan=lifespan)
 
+metrics.registry.counter(
+    "tangram_track_cache_lookups_total",
+    "Track lookups by result: hit, miss (a jet1090 request), or coalesced with a request in flight",
+    ["result"],
+    function=lambda: {("hit",): track_cache.hits, ("miss",): track_cache.misses, ("coalesced",): track_cache.coalesced},
+)
+metrics.registry.counter("tangram_track_cache_evictions_total", "Tracks evicted from the cache", function=lambda: {(): track_cache.evictions})
+metrics.registry.gauge("tangram_track_cache_size", "Tracks in the cache", function=lambda: {(): track_cache.stats()["size"]})
+
 # working directory is $PROJECT/service/src
 tangram_module_root = pathlib.Path(__file__).resolve().parent
 app.mount("/static", StaticFiles(directory=tangram_module_root / "static"), name="static")
@@ -106,6 +137,30 @@ async def uptime() -> dict[str, float]:
     return {"uptime": get_uptime_seconds()}
 
 
+@app.get("/clients")
+async def clients() -> dict[str, dict[str, Any]]:
+    """websocket clients of this process, with their send queue depth and counters"""
+    return channels.hub.client_stats()
+
+
+@app.get("/channels")
+async def channel_clients() -> dict[str, int]:
+    """client count per channel, over all workers"""
+    return {channel: len(clients) for channel, clients in channels.presence.channel_clients().items()}
+
+
+@app.get("/publisher")
+async def publisher() -> dict[str, Any]:
+    """client events published to redis by this process, with publish latency in seconds"""
+    return channels.publisher.stats()
+
+
+@app.get("/metrics")
+async def prometheus_metrics() -> Response:
+    """channel layer metrics of this process, in the Prometheus text format"""
+    return Response(metrics.registry.render(), media_type=metrics.CONTENT_TYPE)
+
+
 @app.get("/")
 async def home(request: Request, history: int = 0) -> HTMLResponse:
     log.info("index, history: %s", history)
@@ -118,10 +173,27 @@ async def home(request: Request, history: int = 0) -> HTMLResponse:
     return templates.TemplateResponse(request=request, name="index.html", context=context)
 
 
-@app.get("/data/{icao24}")
-async def data(icao24: str) -> list[rs1090.Jet1090Data]:
-    records = await jet1090_restful_client.icao24_track(icao24) or []
-    return [r for r in records if r.df in [17, 18, 20, 21]]
+@app.get("/data/{icao24}", response_model=list[rs1090.Jet1090Data])
+async def data(icao24: str) -> Response:
+    records = await track_cache.icao24_track(icao24) or []
+    return Response(rs1090.encode_records([r for r in records if r.df in [17, 18, 20, 21]]), media_type="application/json")
+
+
+@app.get("/history/box")
+async def history_box(west: float, south: float, east: float, north: float, minutes: float = 30, positions: bool = False) -> Any:
+    """aircraft which flew through a box in the last minutes, or their positions in the box"""
+    global history_db
+    if history_db is None:
+        from tangram.plugins.history import HistoryDB  # not at the top, the module configures logging for the history plugin
+
+        try:
+            history_db = HistoryDB(use_memory=False, read_only=True)
+        except sqlite3.Error as exc:  # the history plugin has not created it yet
+            raise HTTPException(status_code=503, detail=f"history is not available: {exc}") from exc
+    bbox = BoundingBox.from_list([west, south, east, north])
+    since = datetime.now().timestamp() - minutes * 60
+    method = history_db.list_positions_in if positions else history_db.list_aircraft_in
+    return await history_db.read(method, bbox, since)
 
 
 @app.websocket("/websocket")
@@ -1,18 +1,30 @@
 from __future__ import annotations
 
+import asyncio
+import enum
+import itertools
 import json
 import logging
 import os
-from typing import Any, List
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Hashable, List
 
+import msgspec
 import redis
+import redis.asyncio as aioredis
 import redis.exceptions
 from broadcaster import Broadcast
 from fastapi import WebSocket
 from pydantic import BaseModel
 from starlette.concurrency import run_until_first_complete
 
+from tangram import metrics
+from tangram.publisher import RedisPublisher
+from tangram.util import delta as snapshot_delta
 from tangram.util import logging as tangram_logging
+from tangram.util import spatial
 
 # log = logging.getLogger(__name__)
 tangram_log = logging.getLogger("tangram")
@@ -21,29 +33,485 @@ log = tangram_logging.getPluginLogger(__package__, __name__, "/tmp/tangram/", lo
 redis_url = os.getenv("REDIS_URL", "redis://127.0.0.1:6379")
 tangram_log.info("websocket is using redis_url: %s", redis_url)
 
+
+class SlowConsumerPolicy(enum.StrEnum):
+    DROP_OLDEST = "drop-oldest"  # discard the oldest pending frame
+    COALESCE = "coalesce"  # keep only the newest pending frame per key (icao24, or channel event)
+    DISCONNECT = "disconnect"  # close the websocket
+
+
+SEND_QUEUE_SIZE = int(os.getenv("TANGRAM_SEND_QUEUE_SIZE", "256"))
+SLOW_CONSUMER_POLICY = SlowConsumerPolicy(os.getenv("TANGRAM_SLOW_CONSUMER_POLICY", SlowConsumerPolicy.DROP_OLDEST))
+
+# snapshot events (lists of aircraft) that clients may receive filtered by viewport, or as keyframes plus deltas
+# `<channel>:<event>` in CSV format
+SNAPSHOT_EVENTS = set(os.getenv("TANGRAM_SNAPSHOT_EVENTS", "streaming:new-data").split(","))
+KEYFRAME_INTERVAL = int(os.getenv("TANGRAM_KEYFRAME_INTERVAL", "30"))  # a full keyframe every N frames, for resync
+VIEWPORT_MARGIN = float(os.getenv("TANGRAM_VIEWPORT_MARGIN", "0.2"))  # fraction of the viewport size added on each side
+
+# channel membership is shared between workers through redis, under a lease renewed every few seconds
+WORKER_ID = metrics.WORKER_ID
+PRESENCE_LEASE_SECONDS = int(os.getenv("TANGRAM_PRESENCE_LEASE_SECONDS", "30"))
+PRESENCE_REFRESH_SECONDS = float(os.getenv("TANGRAM_PRESENCE_REFRESH_SECONDS", "5"))
+
+# the latest messages of every channel are replayed in the join reply, a copy is kept in redis for workers joining cold
+REPLAY_TAIL = int(os.getenv("TANGRAM_REPLAY_TAIL", "1"))  # messages kept per (channel, event)
+REPLAY_MIRROR_SECONDS = float(os.getenv("TANGRAM_REPLAY_MIRROR_SECONDS", "5"))  # at most one redis write per interval and event
+REPLAY_TTL_SECONDS = int(os.getenv("TANGRAM_REPLAY_TTL_SECONDS", "60"))  # older copies are not worth a first paint
+
+
+class Encoding(enum.StrEnum):
+    JSON = "json"  # text frames
+    MSGPACK = "msgpack"  # binary frames, numbers stay binary floats and ints
+
+
 broadcast = Broadcast(redis_url)
 redis_client = redis.from_url(redis_url)
 pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+aredis_client = aioredis.from_url(redis_url)
+
+
+def channel_topic(channel: str, event: str) -> str:
+    """redis topic where backend plugins publish to a channel, `to:<channel>:<event>`"""
+    return f"to:{channel}:{event}"
+
+
+def channel_pattern(channel: str) -> str:
+    return f"to:{channel}:*"
+
+
+json_encoder = msgspec.json.Encoder()
+msgpack_encoder = msgspec.msgpack.Encoder()
+header_decoder = msgspec.json.Decoder(tuple[Any, Any, str, str, msgspec.Raw])  # the payload is left undecoded
+
+DIRECT = "(direct)"  # channel label of messages relayed as they are, i.e. replies and broadcasts
+messages_out = metrics.registry.counter("tangram_channel_messages_out_total", "Messages sent to websockets", ["channel"])
+bytes_out = metrics.registry.counter("tangram_channel_bytes_out_total", "Bytes sent to websockets", ["channel"])
+messages_dropped = metrics.registry.counter("tangram_channel_messages_dropped_total", "Messages dropped or superseded in full send queues", ["channel"])
+delivery_latency = metrics.registry.histogram(
+    "tangram_channel_delivery_latency_seconds", "From the message timestamp to the websocket send, for messages with a timestamp", ["channel"]
+)
+publish_latency = metrics.registry.histogram("tangram_redis_publish_latency_seconds", "From a client event received to redis acknowledging its publication")
+channel_metrics: List[metrics.Metric] = [messages_out, bytes_out, messages_dropped, delivery_latency]  # series pruned when a channel empties
+
+
+class Frame:
+    """A phoenix message `[join_ref, ref, topic, event, payload]`, serialized once.
+
+    The same immutable bytes, and the text decoded from them, are handed to every websocket it is sent to,
+    so the cost of a broadcast does not grow with the number of clients.
+    """
+
+    __slots__ = ("topic", "event", "key", "_data", "_text", "_packed", "_payload_data", "_payload")
+
+    def __init__(self, topic: str, event: str, data: bytes | None = None, text: str | None = None, key: Hashable | None = None) -> None:
+        self.topic = topic
+        self.event = event
+        self.key = key  # frames sharing a key supersede each other in a coalescing queue
+        self._data = data
+        self._text = text
+        self._packed: bytes | None = None
+        self._payload_data: bytes | None = None
+        self._payload: Any = None
+
+    @classmethod
+    def encode(cls, join_ref: str | None, ref: str | None, topic: str, event: str, payload: Any) -> Frame:
+        return cls(topic, event, json_encoder.encode([join_ref, ref, topic, event, payload]))
+
+    @classmethod
+    def from_payload_bytes(cls, topic: str, event: str, payload: bytes) -> Frame:
+        """wraps an already serialized JSON payload, as published by plugins, without decoding it"""
+        data = b"".join([b"[null,null,", json_encoder.encode(topic), b",", json_encoder.encode(event), b",", payload, b"]"])
+        frame = cls(topic, event, data, key=(topic, event))
+        frame._payload_data = payload
+        return frame
+
+    @classmethod
+    def from_text(cls, text: str) -> Frame:
+        """a message that is already serialized, e.g. coming through the broadcaster
+
+        The topic and event are read from it, the payload is skipped over, so that the frame is encoded
+        as the client subscribed to its channel.
+        """
+        try:
+            _, _, topic, event, _ = header_decoder.decode(text)
+        except (msgspec.DecodeError, msgspec.ValidationError):
+            log.warning("not a phoenix message: %s", text[:100])
+            topic, event = "", ""
+        return cls(topic, event, text=text)
+
+    @property
+    def data(self) -> bytes:
+        if self._data is None:
+            self._data = (self._text or "").encode("utf-8")
+        return self._data
+
+    @property
+    def text(self) -> str:
+        if self._text is None:
+            self._text = self.data.decode("utf-8")
+        return self._text
+
+    @property
+    def payload(self) -> Any:
+        """the decoded payload, decoded at most once whatever the number of clients"""
+        if self._payload is None:
+            self._payload = msgspec.json.decode(self._payload_data if self._payload_data is not None else self.data)
+            if self._payload_data is None:
+                self._payload = self._payload[-1]
+        return self._payload
+
+    @property
+    def timestamp(self) -> float | None:
+        """`timestamp` of a single object payload, snapshots (lists) are not decoded for it"""
+        if self._payload is None and (self._payload_data is None or self._payload_data[:1] != b"{"):
+            return None
+        payload = self.payload
+        timestamp = payload.get("timestamp") if isinstance(payload, dict) else None
+        return float(timestamp) if isinstance(timestamp, (int, float)) else None
+
+    @property
+    def payload_data(self) -> bytes:
+        """the payload as JSON, without decoding when it was published by a plugin"""
+        if self._payload_data is None:
+            self._payload_data = json_encoder.encode(self.payload)
+        return self._payload_data
+
+    @property
+    def packed(self) -> bytes:
+        """the message as MessagePack, packed at most once"""
+        if self._packed is None:
+            if self._payload_data is not None:
+                message = [None, None, self.topic, self.event, self.payload]
+            else:
+                message = msgspec.json.decode(self.data)
+            self._packed = msgpack_encoder.encode(message)
+        return self._packed
+
+    async def send(self, websocket: WebSocket, encoding: Encoding = Encoding.JSON) -> int:
+        """returns the number of bytes sent"""
+        if encoding is Encoding.MSGPACK:
+            await websocket.send_bytes(self.packed)
+            return len(self.packed)
+        await websocket.send_text(self.text)
+        return len(self.data)
+
+    def __repr__(self) -> str:
+        return f"Frame({self.topic}:{self.event}, {len(self.data)} bytes)"
+
+
+@dataclass
+class Viewport:
+    """the part of the map a client looks at"""
+
+    bbox: spatial.BoundingBox  # with the margin
+    zoom: float | None = None
+
+    @classmethod
+    def from_payload(cls, payload: Any) -> Viewport | None:
+        """`{"bbox": [west, south, east, north], "zoom": 7}`"""
+        if not isinstance(payload, dict) or payload.get("bbox") is None:
+            return None
+        try:
+            bbox = spatial.BoundingBox.from_list(payload["bbox"]).expanded(VIEWPORT_MARGIN)
+        except (TypeError, ValueError):
+            log.warning("invalid viewport %s", payload)
+            return None
+        return cls(bbox, payload.get("zoom"))
+
+
+@dataclass
+class Subscription:
+    """options a client gave when joining a channel"""
+
+    channel: str
+    encoding: Encoding = Encoding.JSON  # wire format of the frames sent on this channel
+    delta: bool = False  # snapshot events as keyframes plus deltas
+    viewport: Viewport | None = None  # snapshot events restricted to what is on screen
+    delta_seq: dict[str, int] = field(default_factory=dict)  # event -> seq last sent to the client
+    delta_count: dict[str, int] = field(default_factory=dict)  # event -> frames sent since the last keyframe
+    delta_keys: dict[str, set[str]] = field(default_factory=dict)  # event -> icao24 last sent, with a viewport
+
+    @classmethod
+    def from_join(cls, channel: str, payload: Any) -> Subscription:
+        options = payload if isinstance(payload, dict) else {}
+        try:
+            encoding = Encoding(options.get("encoding", Encoding.JSON))
+        except ValueError:
+            log.warning("unknown encoding %s for %s, falling back to json", options.get("encoding"), channel)
+            encoding = Encoding.JSON
+        return cls(channel, encoding=encoding, delta=bool(options.get("delta", False)), viewport=Viewport.from_payload(options))
+
+    @property
+    def transformed(self) -> bool:
+        """whether snapshot events are tailored to this client"""
+        return self.delta or self.viewport is not None
+
+    def resync(self) -> None:
+        """the next snapshot goes out in full"""
+        self.delta_seq.clear()
+        self.delta_count.clear()
+        self.delta_keys.clear()
+
+
+class SnapshotStream:
+    """Successive snapshots of one channel event keyed by icao24, tailored to each client.
+
+    Clients get either the snapshot restricted to their viewport, or keyframes and deltas.
+    Frames that do not depend on a viewport are built once per snapshot and shared by every client in sync.
+    A client that missed a snapshot, e.g. dropped by its send queue, gets a keyframe.
+
+    keyframe: {"type": "keyframe", "seq": n, "data": [...]}
+    delta: {"type": "delta", "seq": n, "base": n - 1, "added": [...], "removed": [icao24, ...], "changed": {icao24: {field: value}}}
+    """
+
+    def __init__(self, channel: str, event: str, keyframe_interval: int = KEYFRAME_INTERVAL) -> None:
+        self.channel = channel
+        self.event = event
+        self.keyframe_interval = keyframe_interval
+
+        self.seq = 0
+        self.frame: Frame | None = None  # latest snapshot as published
+        self.snapshot: dict[str, snapshot_delta.Record] = {}
+        self.delta = snapshot_delta.SnapshotDelta()
+        self.differ = snapshot_delta.SnapshotDiffer(key="icao24", version="last")
+        self._index: spatial.GridIndex | None = None
+        self._keyframe: Frame | None = None
+        self._delta_frame: Frame | None = None
+        self._viewport_frames: dict[spatial.BoundingBox, Frame] = {}
+
+    def push(self, frame: Frame) -> bool:
+        """returns False if the payload is not a snapshot"""
+        if not isinstance(frame.payload, list):
+            return False
+        snapshot = snapshot_delta.index_snapshot(frame.payload)
+        self.delta = self.differ.update(snapshot.values())
+        self.snapshot = snapshot
+        self.frame = frame
+        self.seq += 1
+        self._index = self._keyframe = self._delta_frame = None
+        self._viewport_frames.clear()
+        return True
+
+    @property
+    def index(self) -> spatial.GridIndex:
+        if self._index is None:
+            self._index = spatial.GridIndex(self.snapshot)
+        return self._index
+
+    def _encode(self, payload: Any) -> Frame:
+        return Frame.encode(None, None, self.channel, self.event, payload)
+
+    def keyframe(self) -> Frame:
+        if self._keyframe is None:
+            self._keyframe = self._encode({"type": "keyframe", "seq": self.seq, "data": list(self.snapshot.values())})
+        return self._keyframe
+
+    def delta_frame(self) -> Frame:
+        if self._delta_frame is None:
+            self._delta_frame = self._encode(
+                {
+                    "type": "delta",
+                    "seq": self.seq,
+                    "base": self.seq - 1,
+                    "added": list(self.delta.added.values()),
+                    "removed": self.delta.removed,
+                    "changed": self.delta.changed,
+                }
+            )
+        return self._delta_frame
+
+    def viewport_frame(self, bbox: spatial.BoundingBox) -> Frame:
+        """the snapshot inside the box, shared by clients looking at the same box"""
+        if (frame := self._viewport_frames.get(bbox)) is None:
+            frame = self._viewport_frames[bbox] = self._encode([self.snapshot[key] for key in self.index.query(bbox)])
+        return frame
+
+    def frame_for(self, subscription: Subscription) -> Frame | None:
+        """the frame bringing the client to the current snapshot, None if it is already there"""
+        last_seq = subscription.delta_seq.get(self.event)
+        if last_seq == self.seq:
+            return None
+        subscription.delta_seq[self.event] = self.seq
+
+        viewport = subscription.viewport
+        if not subscription.delta:
+            return self.viewport_frame(viewport.bbox) if viewport is not None else self.frame
+
+        count = subscription.delta_count.get(self.event, 0)
+        in_sync = last_seq == self.seq - 1 and count < self.keyframe_interval
+        subscription.delta_count[self.event] = count + 1 if in_sync else 0
+
+        if viewport is None:
+            return self.delta_frame() if in_sync else self.keyframe()
+
+        visible = self.index.query(viewport.bbox)
+        sent = subscription.delta_keys.get(self.event)
+        subscription.delta_keys[self.event] = visible
+        if not in_sync or sent is None:
+            return self._encode({"type": "keyframe", "seq": self.seq, "data": [self.snapshot[key] for key in visible]})
+        return self._encode(
+            {
+                "type": "delta",
+                "seq": self.seq,
+                "base": self.seq - 1,
+                "added": [self.snapshot[key] for key in visible - sent],
+                "removed": list(sent - visible),
+                "changed": {key: self.delta.changed[key] for key in visible & sent if key in self.delta.changed},
+            }
+        )
+
+
+class ClientConnection:
+    """A websocket with a bounded outbound queue, drained by a single writer task.
+
+    When the queue is full, the slow consumer policy decides what to give up, so that one stalled
+    client never builds up backlog for the others.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        websocket: WebSocket,
+        maxsize: int = SEND_QUEUE_SIZE,
+        policy: SlowConsumerPolicy = SLOW_CONSUMER_POLICY,
+        prepare: Callable[[Frame], tuple[Frame, Encoding] | None] | None = None,
+        label: Callable[[Frame], str] | None = None,
+    ) -> None:
+        self.client_id = client_id
+        self.websocket = websocket
+        self.maxsize = maxsize
+        self.policy = policy
+        self.prepare = prepare  # turns a queued frame into what this client gets, when it is about to be sent
+        self.label = label or (lambda frame: frame.topic or DIRECT)  # channel label of the metrics of a frame
+
+        self.sent = 0
+        self.dropped = 0
+        self.closed = False
+
+        self._queue: OrderedDict[Hashable, Frame] = OrderedDict()
+        self._ready = asyncio.Event()
+        self._sequence = itertools.count()
+
+    @property
+    def depth(self) -> int:
+        return len(self._queue)
+
+    def put(self, frame: Frame) -> bool:
+        """enqueue without waiting, returns False if the frame is not going to be sent"""
+        if self.closed:
+            return False
+
+        coalescing = self.policy is SlowConsumerPolicy.COALESCE and frame.key is not None
+        key = frame.key if coalescing else next(self._sequence)
+        if key in self._queue:
+            self._queue[key] = frame  # the newest state replaces the pending one, in place
+            self.dropped += 1
+            messages_dropped.inc(self.label(frame))
+            return True
+
+        if len(self._queue) >= self.maxsize:
+            self.dropped += 1
+            messages_dropped.inc(self.label(frame))
+            if self.policy is SlowConsumerPolicy.DISCONNECT:
+                log.warning("[%s] send queue is full (%s), disconnecting", self.client_id, self.maxsize)
+                self.close()
+                return False
+            self._queue.popitem(last=False)
+
+        self._queue[key] = frame
+        self._ready.set()
+        return True
+
+    def close(self) -> None:
+        self.closed = True
+        self._ready.set()
+
+    async def drain(self) -> None:
+        """the writer, returns when the connection is closed"""
+        while not self.closed:
+            await self._ready.wait()
+            while self._queue and not self.closed:
+                _, frame = self._queue.popitem(last=False)
+                encoding = Encoding.JSON
+                if self.prepare is not None:
+                    if (prepared := self.prepare(frame)) is None:
+                        continue
+                    frame, encoding = prepared
+                size = await frame.send(self.websocket, encoding)
+                self.sent += 1
+
+                channel = self.label(frame)
+                messages_out.inc(channel)
+                bytes_out.inc(channel, amount=size)
+                if (timestamp := frame.timestamp) is not None:
+                    delivery_latency.observe(time.time() - timestamp, channel)
+            self._ready.clear()
+
+    def stats(self) -> dict[str, Any]:
+        return {"depth": self.depth, "maxsize": self.maxsize, "policy": self.policy, "sent": self.sent, "dropped": self.dropped}
 
 
 class Hub:
     def __init__(self) -> None:
         self._channel_clients: dict[str, set[str]] = {}  # channel -> {clients}
-        self._client_attributes: dict[str, dict[str, str]] = {}  # client attributes
+        self._client_attributes: dict[str, dict[str, Subscription]] = {}  # client -> {channel -> subscription}
+        self._connections: dict[str, ClientConnection] = {}  # client -> connection, local to this process
+        self._snapshot_streams: dict[tuple[str, str], SnapshotStream] = {}  # (channel, event) -> stream
 
     def _client_health_check(self, client_id: str):
         raise NotImplementedError
 
-    def add(self, client_id: str, channel: str) -> None:
+    def connect(self, client_id: str, websocket: WebSocket) -> ClientConnection:
+        connection = ClientConnection(client_id, websocket, prepare=lambda frame: self.prepare(client_id, frame), label=self.label)
+        self._connections[client_id] = connection
+        log.info("client %s connected", client_id)
+        return connection
+
+    def connection(self, client_id: str) -> ClientConnection | None:
+        return self._connections.get(client_id)
+
+    def disconnect(self, client_id: str) -> List[str]:
+        """forget the client, returns channels left without any client"""
+        if connection := self._connections.pop(client_id, None):
+            connection.close()
+        self._client_attributes.pop(client_id, None)
+        emptied = []
+        for channel in self.channels():
+            if client_id in self._channel_clients[channel] and not self.remove(client_id, channel):
+                emptied.append(channel)
+        log.info("client %s disconnected, empty channels: %s", client_id, emptied)
+        return emptied
+
+    def add(self, client_id: str, channel: str, subscription: Subscription | None = None) -> bool:
+        """returns True if the client is the first one in the channel"""
         if channel not in self._channel_clients:
             self._channel_clients[channel] = set()
+        first = not self._channel_clients[channel]
         self._channel_clients[channel].add(client_id)
+        self._client_attributes.setdefault(client_id, {})[channel] = subscription or Subscription(channel)
         log.info("client %s added into channel %s", client_id, channel)
+        return first
+
+    def remove(self, client_id: str, channel: str) -> bool:
+        """returns False if the channel has no client left"""
+        if channel not in self._channel_clients:
+            return False
+        self._channel_clients[channel].discard(client_id)
+        self._client_attributes.get(client_id, {}).pop(channel, None)
+        log.info("client %s removed from channel %s", client_id, channel)
+        if not self._channel_clients[channel]:
+            del self._channel_clients[channel]
+            for key in [key for key in self._snapshot_streams if key[0] == channel]:
+                del self._snapshot_streams[key]
+            for metric in channel_metrics:  # per aircraft channels, e.g. `trajectory-<icao24>`, would add series forever
+                metric.remove(channel)
+            return False
+        return True
 
-    def remove(self, client_id: str, channel: str) -> None:
-        if channel in self._channel_clients:
-            self._channel_clients[channel].discard(client_id)
-            log.info("client %s removed from channel %s", client_id, channel)
+    def label(self, frame: Frame) -> str:
+        """channel label of the metrics of a frame, frames sent after their channel emptied, e.g. the leave reply, are not labelled by it"""
+        return frame.topic if frame.topic in self._channel_clients else DIRECT
 
     def channel_clients(self) -> dict[str, set[str]]:
         return self._channel_clients
@@ -52,11 +520,361 @@ class Hub:
         return list(self.channel_clients().keys())
 
     def clients(self) -> List[str]:
-        return list(broadcast._subscribers.keys())
+        return list(self._connections.keys())
+
+    def channel_connections(self, channel: str) -> List[ClientConnection]:
+        clients = self._channel_clients.get(channel, set())
+        return [self._connections[client_id] for client_id in clients if client_id in self._connections]
+
+    def client_channels(self, client_id: str) -> List[str]:
+        return list(self._client_attributes.get(client_id, {}).keys())
+
+    def subscription(self, client_id: str, channel: str) -> Subscription | None:
+        return self._client_attributes.get(client_id, {}).get(channel)
+
+    def deliver(self, channel: str, frame: Frame) -> int:
+        """queue a frame to every local connection in the channel, returns how many accepted it"""
+        clients = self._channel_clients.get(channel, set())
+        if f"{channel}:{frame.event}" in SNAPSHOT_EVENTS and any(getattr(self.subscription(client_id, channel), "transformed", False) for client_id in clients):
+            self._push_snapshot(frame)
+        return sum(connection.put(frame) for connection in self.channel_connections(channel))
+
+    def _push_snapshot(self, frame: Frame) -> SnapshotStream | None:
+        key = (frame.topic, frame.event)
+        stream = self._snapshot_streams.setdefault(key, SnapshotStream(frame.topic, frame.event))
+        if not stream.push(frame):
+            del self._snapshot_streams[key]
+            return None
+        return stream
+
+    def replay(self, client_id: str, frame: Frame) -> bool:
+        """queue a past snapshot to a client that needs it tailored, i.e. it cannot be part of its join reply"""
+        if (connection := self._connections.get(client_id)) is None:
+            return False
+        if (frame.topic, frame.event) not in self._snapshot_streams:
+            self._push_snapshot(frame)
+        return connection.put(frame)
+
+    def prepare(self, client_id: str, frame: Frame) -> tuple[Frame, Encoding] | None:
+        """the frame as this client gets it, e.g. a delta against what it last received, and its wire format"""
+        subscription = self.subscription(client_id, frame.topic)
+        if subscription is None:
+            return frame, Encoding.JSON
+        if subscription.transformed and (stream := self._snapshot_streams.get((frame.topic, frame.event))) is not None:
+            if (tailored := stream.frame_for(subscription)) is None:
+                return None
+            frame = tailored
+        return frame, subscription.encoding
+
+    def update_viewport(self, client_id: str, channel: str, viewport: Viewport | None) -> None:
+        """a client panned or zoomed, it gets the current snapshots again for its new viewport"""
+        if (subscription := self.subscription(client_id, channel)) is None:
+            return
+        subscription.viewport = viewport
+        subscription.resync()
+        if (connection := self._connections.get(client_id)) is None:
+            return
+        for (stream_channel, _), stream in self._snapshot_streams.items():
+            if stream_channel == channel and stream.frame is not None:
+                connection.put(stream.frame)
+
+    def client_stats(self) -> dict[str, dict[str, Any]]:
+        channels_by_client: dict[str, List[str]] = {}
+        for channel, clients in self._channel_clients.items():
+            for client_id in clients:
+                channels_by_client.setdefault(client_id, []).append(channel)
+        return {client_id: {**connection.stats(), "channels": channels_by_client.get(client_id, [])} for client_id, connection in self._connections.items()}
 
 
 hub = Hub()
 
+metrics.registry.gauge(
+    "tangram_channel_clients",
+    "Websocket clients of this process per channel",
+    ["channel"],
+    function=lambda: {(channel,): len(clients) for channel, clients in hub.channel_clients().items()},
+)
+metrics.registry.gauge(
+    "tangram_client_queue_depth",
+    "Messages waiting in the send queue of each websocket client",
+    ["client"],
+    function=lambda: {(client_id,): connection.depth for client_id in hub.clients() if (connection := hub.connection(client_id)) is not None},
+)
+
+
+class LatestState:
+    """The latest messages published to each channel, by event, replayed to clients when they join.
+
+    Frames are kept as they were fanned out, so a replay costs no serialization. The latest one of every
+    event is also copied to redis, throttled, in the hash `tangram:latest:<channel>`, event -> payload, so that
+    a worker subscribing to a channel for the first time, e.g. during a reconnect storm after a deploy,
+    has something to send before the next publisher tick, with a single HGETALL.
+    """
+
+    prefix = "tangram:latest:"
+
+    def __init__(
+        self, redis_client: aioredis.Redis, tail: int = REPLAY_TAIL, mirror_interval: float = REPLAY_MIRROR_SECONDS, ttl: int = REPLAY_TTL_SECONDS
+    ) -> None:
+        self.redis = redis_client
+        self.tail = max(tail, 1)
+        self.mirror_interval = mirror_interval
+        self.ttl = ttl
+        self._frames: dict[str, dict[str, deque[tuple[int, Frame]]]] = {}  # channel -> {event -> latest (order, frame)}
+        self._order = itertools.count()
+        self._mirrored: dict[tuple[str, str], float] = {}  # (channel, event) -> monotonic time of the last copy
+        self._tasks: set[asyncio.Task] = set()
+
+    def key(self, channel: str) -> str:
+        return f"{self.prefix}{channel}"
+
+    def record(self, frame: Frame) -> None:
+        events = self._frames.setdefault(frame.topic, {})
+        if (frames := events.get(frame.event)) is None:
+            frames = events[frame.event] = deque(maxlen=self.tail)
+        frames.append((next(self._order), frame))
+
+        now = time.monotonic()
+        if now - self._mirrored.get((frame.topic, frame.event), -self.mirror_interval) >= self.mirror_interval:
+            self._mirrored[(frame.topic, frame.event)] = now
+            task = asyncio.create_task(self._mirror(frame))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _mirror(self, frame: Frame) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.key(frame.topic), frame.event, frame.payload_data)
+        pipe.expire(self.key(frame.topic), self.ttl)  # renewed by every copy, the hash goes once the channel is quiet
+        try:
+            await pipe.execute()
+        except redis.exceptions.RedisError as exc:
+            log.warning("fails to copy latest %s:%s to redis: %s", frame.topic, frame.event, exc)
+
+    async def _load(self, channel: str) -> dict[str, deque[tuple[int, Frame]]]:
+        """latest messages copied by any worker, when this one has not seen the channel yet"""
+        events: dict[str, deque[tuple[int, Frame]]] = {}
+        try:
+            entries = await self.redis.hgetall(self.key(channel))
+        except redis.exceptions.RedisError as exc:
+            log.warning("fails to load latest messages of %s from redis: %s", channel, exc)
+            return events
+        for event, value in entries.items():
+            event = event.decode("utf-8")
+            events[event] = deque([(next(self._order), Frame.from_payload_bytes(channel, event, value))], maxlen=self.tail)
+        return events
+
+    async def frames(self, channel: str) -> List[Frame]:
+        """oldest first"""
+        if not (events := self._frames.get(channel)):
+            events = await self._load(channel)
+            if events:
+                log.debug("latest messages of %s loaded from redis: %s", channel, list(events))
+                self._frames.setdefault(channel, {}).update(events)
+        return [frame for _, frame in sorted(item for frames in events.values() for item in frames)]
+
+    def forget(self, channel: str) -> None:
+        """this worker no longer receives the channel, what it has would go stale, redis keeps a copy"""
+        self._frames.pop(channel, None)
+        for key in [key for key in self._mirrored if key[0] == channel]:
+            del self._mirrored[key]
+
+
+latest = LatestState(aredis_client)
+
+
+class ChannelFanout:
+    """Subscribes to redis once per channel for this process, and fans messages out to local websockets.
+
+    Redis traffic grows with the number of channels, not with the number of connected clients.
+    All subscriptions share a single pubsub connection.
+    """
+
+    def __init__(self, redis_client: aioredis.Redis, hub: Hub, latest: LatestState) -> None:
+        self.redis = redis_client
+        self.hub = hub
+        self.latest = latest
+        self.pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+        self.task: asyncio.Task | None = None
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._listen())
+        log.info("channel fan-out started")
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.pubsub.aclose()
+        log.info("channel fan-out stopped")
+
+    async def subscribe(self, channel: str) -> None:
+        await self.pubsub.psubscribe(channel_pattern(channel))
+        log.info("fan-out subscribed to %s", channel_pattern(channel))
+
+    async def unsubscribe(self, channel: str) -> None:
+        await self.pubsub.punsubscribe(channel_pattern(channel))
+        self.latest.forget(channel)
+        log.info("fan-out unsubscribed from %s", channel_pattern(channel))
+
+    async def _listen(self) -> None:
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+                if message is None or message["type"] != "pmessage":
+                    continue
+                await self._dispatch(message["pattern"].decode("utf-8"), message["channel"].decode("utf-8"), message["data"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                log.exception("fan-out fails to dispatch message")
+
+    async def _dispatch(self, pattern: str, topic: str, data: bytes) -> None:
+        channel = pattern[len("to:") : -len(":*")]
+        event = topic[len(f"to:{channel}:") :]
+        frame = Frame.from_payload_bytes(channel, event, data)
+        if data[:1] == b"{":  # one aircraft per message, coalesce per icao24
+            frame._payload = msgspec.json.decode(data)
+            frame.key = (channel, event, frame._payload.get("icao24"))
+        self.latest.record(frame)
+        count = self.hub.deliver(channel, frame)
+        log.debug("fan-out %s to %s local clients", topic, count)
+
+
+fanout = ChannelFanout(aredis_client, hub, latest)
+
+
+publisher = RedisPublisher(aredis_client, latency=publish_latency)
+
+
+class PresenceRegistry:
+    """Channel membership of every worker, shared through redis.
+
+    Each worker owns the hash `tangram:presence:<worker>`, client -> joined channels in CSV. The TTL of the hash is
+    the lease of the worker: it is rewritten from the hub and renewed every `refresh` seconds, so the entries of
+    a worker that dies expire on their own. Workers are listed in the sorted set `tangram:presence`, scored by
+    the end of their lease, so that the membership of all workers is read back without scanning the keyspace,
+    at the same time, and cached locally. Joins and leaves of this worker are written through immediately.
+    """
+
+    prefix = "tangram:presence:"
+    workers_key = "tangram:presence"
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        hub: Hub,
+        worker_id: str = WORKER_ID,
+        lease: int = PRESENCE_LEASE_SECONDS,
+        refresh: float = PRESENCE_REFRESH_SECONDS,
+    ) -> None:
+        self.redis = redis_client
+        self.hub = hub
+        self.worker_id = worker_id
+        self.key = f"{self.prefix}{worker_id}"
+        self.lease = lease
+        self.refresh = refresh
+        self.task: asyncio.Task | None = None
+
+        self._channel_clients: dict[str, set[str]] = {}  # cached, other workers
+        self._client_workers: dict[str, str] = {}  # cached, other workers
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+        log.info("presence registry started, worker: %s", self.worker_id)
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.delete(self.key)
+        pipe.zrem(self.workers_key, self.worker_id)
+        try:
+            await pipe.execute()
+        except redis.exceptions.RedisError:
+            log.exception("fail to release presence lease %s", self.key)
+        log.info("presence registry stopped, worker: %s", self.worker_id)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.renew()
+                await self.load()
+            except redis.exceptions.RedisError:
+                log.exception("fail to sync presence")
+            await asyncio.sleep(self.refresh)
+
+    async def update(self, client_id: str) -> None:
+        """write through the channels of a local client, after it joined, left or disconnected"""
+        channels = self.hub.client_channels(client_id)
+        pipe = self.redis.pipeline(transaction=False)
+        if channels:
+            pipe.hset(self.key, client_id, ",".join(channels))
+        else:
+            pipe.hdel(self.key, client_id)
+        pipe.expire(self.key, self.lease)
+        try:
+            await pipe.execute()
+        except redis.exceptions.RedisError:
+            log.exception("fail to update presence of %s", client_id)
+
+    async def renew(self) -> None:
+        """rewrite the hash of this worker from the hub, and extend its lease"""
+        mapping = {client_id: ",".join(channels) for client_id in self.hub.clients() if (channels := self.hub.client_channels(client_id))}
+        now = time.time()
+        pipe = self.redis.pipeline(transaction=True)
+        pipe.delete(self.key)
+        if mapping:
+            pipe.hset(self.key, mapping=mapping)
+            pipe.expire(self.key, self.lease)
+        pipe.zadd(self.workers_key, {self.worker_id: now + self.lease})
+        pipe.zremrangebyscore(self.workers_key, "-inf", now)  # workers that died
+        await pipe.execute()
+
+    async def load(self) -> None:
+        """read back the membership of the other workers"""
+        workers = [worker.decode("utf-8") for worker in await self.redis.zrangebyscore(self.workers_key, time.time(), "+inf")]
+        workers = [worker_id for worker_id in workers if worker_id != self.worker_id]
+        pipe = self.redis.pipeline(transaction=False)
+        for worker_id in workers:
+            pipe.hgetall(f"{self.prefix}{worker_id}")
+        channel_clients: dict[str, set[str]] = {}
+        client_workers: dict[str, str] = {}
+        for worker_id, entries in zip(workers, await pipe.execute() if workers else []):
+            for client_id, channels in entries.items():
+                client_id = client_id.decode("utf-8")
+                client_workers[client_id] = worker_id
+                for channel in channels.decode("utf-8").split(","):
+                    channel_clients.setdefault(channel, set()).add(client_id)
+        self._channel_clients, self._client_workers = channel_clients, client_workers
+
+    def channel_clients(self) -> dict[str, set[str]]:
+        """clients of every worker by channel, the local ones always up to date"""
+        merged = {channel: set(clients) for channel, clients in self._channel_clients.items()}
+        for channel, clients in self.hub.channel_clients().items():
+            merged.setdefault(channel, set()).update(clients)
+        return merged
+
+    def count(self, channel: str) -> int:
+        return len(self.channel_clients().get(channel, set()))
+
+    def client_worker(self, client_id: str) -> str | None:
+        if self.hub.connection(client_id) is not None:
+            return self.worker_id
+        return self._client_workers.get(client_id)
+
+
+presence = PresenceRegistry(aredis_client, hub)
+
 
 class ClientMessage(BaseModel):
     join_ref: str | None
@@ -76,7 +894,16 @@ class ClientMessage(BaseModel):
 
     @classmethod
     def from_string(cls, text) -> ClientMessage:
-        [join_ref, ref, topic, event, payload] = json.loads(text)
+        return cls.from_array(json.loads(text))
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> ClientMessage:
+        """binary frames are MessagePack"""
+        return cls.from_array(msgspec.msgpack.decode(data))
+
+    @classmethod
+    def from_array(cls, array: List[Any]) -> ClientMessage:
+        [join_ref, ref, topic, event, payload] = array
         match event:
             case event if event in ["phx_join", "phx_leave"]:
                 event = event.lstrip("phx_")
@@ -97,44 +924,100 @@ def is_joining_message(message: ClientMessage) -> bool:
 
 
 def is_leaving_message(message: ClientMessage) -> bool:
-    return message.event == ["phx_leave", "leave"]
+    return message.event in ["phx_leave", "leave"]
+
+
+def is_viewport_message(message: ClientMessage) -> bool:
+    return message.event == "viewport"
+
+
+async def send_to_client(client_id: str, frame: Frame) -> None:
+    """straight into the send queue when the client is connected to this process, through redis otherwise"""
+    if (connection := hub.connection(client_id)) is not None:
+        connection.put(frame)
+        return
+    if presence.client_worker(client_id) is None:
+        log.warning("client %s is not known to any worker (yet), publishing anyway", client_id)
+    try:
+        await broadcast.publish(channel=client_id, message=frame.data)
+    except redis.exceptions.DataError as exc:
+        log.error("%s", exc)
+
+
+def reply_frame(message: ClientMessage, response: Any = None, replay: List[Frame] | None = None) -> Frame:
+    """`replay` frames go in `response.messages` as `{"event", "payload"}`, their payloads spliced in without decoding"""
+    if not replay:
+        return Frame.encode(message.join_ref, message.ref, message.topic, "phx_reply", {"status": "ok", "response": response or {}})
+    messages = b",".join(b"".join([b'{"event":', json_encoder.encode(frame.event), b',"payload":', frame.payload_data, b"}"]) for frame in replay)
+    head = json_encoder.encode([message.join_ref, message.ref, message.topic, "phx_reply"])[:-1]
+    response_data = json_encoder.encode({key: value for key, value in (response or {}).items() if key != "messages"})[:-1]
+    separator = b"," if len(response_data) > 1 else b""
+    data = b"".join([head, b',{"status":"ok","response":', response_data, separator, b'"messages":[', messages, b"]}}]"])
+    return Frame(message.topic, "phx_reply", data)
+
+
+async def handle_viewport(client_id: str, message: ClientMessage) -> None:
+    hub.update_viewport(client_id, message.topic, Viewport.from_payload(message.payload))
+    await send_to_client(client_id, reply_frame(message))
+    log.debug("[%s] - viewport of %s: %s", client_id, message.topic, message.payload)
 
 
 async def handle_heartbeat(client_id: str, message: ClientMessage) -> None:
     """always respond"""
     log.debug("[%s] - receive heartbeat from client", client_id)
-    await broadcast.publish(channel=client_id, message=json.dumps([message.join_ref, message.ref, message.topic, "phx_reply", message.ok]))
+    await send_to_client(client_id, reply_frame(message))
     log.debug("[%s] - heartbeat piped: %s [%s]", client_id, type(message), message)
 
 
 async def ok_to_join(client_id: str, message: ClientMessage, response=None):
     log.debug("DEFAULT JOIN HANDLER, %s is joining %s ...", client_id, message.topic)
 
-    hub.add(client_id, message.topic)
-    default_payload = {"status": "ok", "response": response or {}}
-    # response_message = [message.join_ref, message.ref, message.topic, "phx_reply", default_payload]
-    response_message = json.dumps([message.join_ref, message.ref, message.topic, "phx_reply", default_payload])
-    log.error("%s %s", response_message, type(response_message))
-    # log.error("%s\n%s\n", json.dumps(response_message), json.dumps(response_message[-1]))
-    try:
-        await broadcast.publish(channel=client_id, message=response_message)
-    except redis.exceptions.DataError as exc:
-        log.error("%s", exc)
+    subscription = Subscription.from_join(message.topic, message.payload)
+    if hub.add(client_id, message.topic, subscription):
+        await fanout.subscribe(message.topic)
+    await presence.update(client_id)
+
+    # the latest messages give an immediate first paint, snapshots tailored to the client follow the reply instead
+    frames = await latest.frames(message.topic)
+    tailored = [frame for frame in frames if subscription.transformed and f"{message.topic}:{frame.event}" in SNAPSHOT_EVENTS]
+    response_frame = reply_frame(message, response, [frame for frame in frames if frame not in tailored])
+    log.debug("%s", response_frame)
+    await send_to_client(client_id, response_frame)
+    for frame in tailored:
+        hub.replay(client_id, frame)
     log.debug("[%s] - %s response piped: %s [%s]", client_id, message.event, type(message), message)
 
 
 async def ok_to_leave(client_id: str, message: ClientMessage):
     log.debug("DEFAULT LEAVE HANDLER, %s is leaving %s ...", client_id, message.topic)
 
-    await broadcast.publish(channel=client_id, message=json.dumps([message.join_ref, message.ref, message.topic, "phx_reply", message.ok]))
-    hub.remove(client_id, message.topic)
+    await send_to_client(client_id, reply_frame(message))
+    if not hub.remove(client_id, message.topic):
+        await fanout.unsubscribe(message.topic)
+    await presence.update(client_id)
     log.debug("[%s] - %s response piped %s", client_id, message.event, message.topic)
 
 
+async def iter_messages(websocket: WebSocket) -> AsyncIterator[str | bytes]:
+    """text and binary frames, until the client disconnects"""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if message.get("text") is not None:
+            yield message["text"]
+        elif message.get("bytes") is not None:
+            yield message["bytes"]
+
+
 async def websocket_receiver(websocket: WebSocket, client_id: str) -> None:
     log.info("[%s] - receive task", client_id)
-    async for text in websocket.iter_text():
-        client_message: ClientMessage = ClientMessage.from_string(text)  # noqa
+    async for text in iter_messages(websocket):
+        if isinstance(text, bytes):
+            client_message: ClientMessage = ClientMessage.from_bytes(text)
+            text = json_encoder.encode(client_message.to_array()).decode("utf-8")  # plugins read JSON from redis
+        else:
+            client_message = ClientMessage.from_string(text)  # noqa
         log.debug("[%s] < %s [%s]", client_id, type(text), text)
         log.debug("client message: %s", client_message)
 
@@ -150,50 +1033,65 @@ async def websocket_receiver(websocket: WebSocket, client_id: str) -> None:
             await ok_to_leave(client_id, client_message)
             continue
 
+        if is_viewport_message(client_message):
+            await handle_viewport(client_id, client_message)
+            continue
+
         publish_topic = f"{client_message.topic}:{client_message.event}"
-        redis_client.publish(publish_topic, text)
+        await publisher.publish(publish_topic, text)
         # log.debug("> RX / to Redis %s %s", publish_topic, text)
 
     log.debug("[%s] done\n\n", client_id)
 
 
-async def websocket_sender(websocket: WebSocket, client_id: str) -> None:
+async def websocket_sender(connection: ClientConnection, client_id: str) -> None:
+    """messages addressed to this client by other processes, replies from this one go straight to the queue"""
     log.info("[%s] > send task", client_id)
     async with broadcast.subscribe(client_id) as subscriber:
         log.info("[%s] > new subscriber created, %s", client_id, subscriber)
         async for event in subscriber:
-            message = event.message
-            # log.debug("to send %s %s", message, type(message))
-            await websocket.send_text(message)
+            # log.debug("to send %s %s", event.message, type(event.message))
+            connection.put(Frame.from_text(event.message))
     log.info("[%s] sending task is done", client_id)
 
 
-async def websocket_broadcast(websocket: WebSocket, client_id: str) -> None:
+async def websocket_broadcast(connection: ClientConnection, client_id: str) -> None:
     """get messages from a redis broadcast channel and publish to client"""
     log.info("[%s] > broadcast task", client_id)
     async with broadcast.subscribe("broadcast") as subscriber:
         async for event in subscriber:
             # log.debug("to broadcast %s", event.message)
-            await websocket.send_text(event.message)
+            connection.put(Frame.from_text(event.message))
     log.info("[%s] broadcast task is done", client_id)
 
 
+async def websocket_writer(connection: ClientConnection, client_id: str) -> None:
+    """the only task writing to the websocket, it drains the bounded send queue"""
+    log.info("[%s] > writer task", client_id)
+    await connection.drain()
+    log.info("[%s] writer task is done, %s", client_id, connection.stats())
+
+
 async def handle_websocket_client(client_id: str, ws: WebSocket):
-    # TODO interface deprecated
-    await run_until_first_complete(
-        (websocket_receiver, {"websocket": ws, "client_id": client_id}),
-        (websocket_sender, {"websocket": ws, "client_id": client_id}),
-        (websocket_broadcast, {"websocket": ws, "client_id": client_id}),
-    )
+    connection = hub.connect(client_id, ws)
+    try:
+        # TODO interface deprecated
+        await run_until_first_complete(
+            (websocket_receiver, {"websocket": ws, "client_id": client_id}),
+            (websocket_sender, {"connection": connection, "client_id": client_id}),
+            (websocket_broadcast, {"connection": connection, "client_id": client_id}),
+            (websocket_writer, {"connection": connection, "client_id": client_id}),
+        )
+    finally:
+        for channel in hub.disconnect(client_id):
+            await fanout.unsubscribe(channel)
+        await presence.update(client_id)
 
 
 async def publish_any(channel: str, event: str, any: Any) -> int:
-    """this publishes to client"""
-    message = [None, None, channel, event, any]
-    clients = hub.channel_clients().get(channel, [])
-    for client_id in clients:
-        await broadcast.publish(channel=client_id, message=json.dumps(message))
-    return len(clients)
+    """this publishes to client, once for the channel. Every process fans it out to its own websockets."""
+    await aredis_client.publish(channel_topic(channel, event), json_encoder.encode(any))
+    return presence.count(channel)
 
 
 async def system_broadcast(*, channel: str, event: str, data: Any, by_redis: bool = False) -> None:
@@ -201,11 +1099,11 @@ async def system_broadcast(*, channel: str, event: str, data: Any, by_redis: boo
     #     log.warning("channel name should start with `channel:`, correcting %s => %s", channel, f"channel:{channel}")
     #     channel = f"channel:{channel}"
 
-    message = [None, None, channel, event, data]
-    # (redis_client if by_redis else broadcast).publish(channel, json.dumps(message))
+    frame = Frame.encode(None, None, channel, event, data)
+    # (redis_client if by_redis else broadcast).publish(channel, frame.data)
     if by_redis:  # FIXME: not working properly
-        await redis_client.publish(channel, json.dumps(message))
+        await redis_client.publish(channel, frame.data)
     else:
         # check the `websocket_broadcast` function, it's listening to `broadcast` channel
-        await broadcast.publish(channel="broadcast", message=json.dumps(message))
+        await broadcast.publish(channel="broadcast", message=frame.data)
     # log.debug("message broadcasted")
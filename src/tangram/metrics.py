@@ -0,0 +1,169 @@
+"""Process local metrics, rendered in the Prometheus text format on scrape.
+
+Metrics are plain dicts updated from the event loop, so recording a value takes no lock and no I/O.
+With several workers, every process exposes its own values, labelled with `worker="<host>:<pid>"`:
+a scrape is answered by any of them, series of different workers are told apart, and aggregated in
+Prometheus, e.g. `sum without (worker) (rate(tangram_channel_messages_out_total[1m]))`.
+"""
+
+from __future__ import annotations
+
+import bisect
+import math
+import os
+import socket
+from typing import Callable, Iterable, Iterator, List, TypeVar
+
+Labels = tuple[str, ...]
+
+# seconds, from sub-millisecond fan-out to a client several seconds behind
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"  # this process, among the workers serving the same port
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Labels, values: Labels, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names: Labels = tuple(labels)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        """(suffix, labels, value)"""
+        raise NotImplementedError
+
+    def remove(self, *labels: str) -> None:
+        """forgets the series of these label values, e.g. of a channel that is gone"""
+
+    def render(self, constant: str = "") -> List[str]:
+        """`constant` labels, formatted, are added to every sample"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        for suffix, labels, value in self.samples():
+            if constant:
+                labels = f"{{{constant},{labels[1:]}" if labels else f"{{{constant}}}"
+            lines.append(f"{self.name}{suffix}{labels} {_format_value(value)}")
+        return lines
+
+
+class Counter(Metric):
+    """incremented, or read from `function` on scrape for totals kept elsewhere"""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), function: Callable[[], dict[Labels, float]] | None = None) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[Labels, float] = {}
+        self.function = function
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def remove(self, *labels: str) -> None:
+        self.values.pop(labels, None)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        values = self.function() if self.function is not None else self.values
+        for labels, value in values.items():
+            yield "", _format_labels(self.label_names, labels), value
+
+
+class Gauge(Metric):
+    """set explicitly, or read from `function` on scrape, which returns values by labels"""
+
+    type = "gauge"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), function: Callable[[], dict[Labels, float]] | None = None) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: dict[Labels, float] = {}
+        self.function = function
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+    def remove(self, *labels: str) -> None:
+        self.values.pop(labels, None)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        values = self.function() if self.function is not None else self.values
+        for labels, value in values.items():
+            yield "", _format_labels(self.label_names, labels), value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        self.counts: dict[Labels, List[int]] = {}  # per bucket, not cumulative, the last one is +Inf
+        self.sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        if (counts := self.counts.get(labels)) is None:
+            counts = self.counts[labels] = [0] * (len(self.buckets) + 1)
+            self.sums[labels] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sums[labels] += value
+
+    def remove(self, *labels: str) -> None:
+        self.counts.pop(labels, None)
+        self.sums.pop(labels, None)
+
+    def samples(self) -> Iterator[tuple[str, str, float]]:
+        for labels, counts in self.counts.items():
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                yield "_bucket", _format_labels(self.label_names, labels, f'le="{_format_value(bound)}"'), cumulative
+            yield "_sum", _format_labels(self.label_names, labels), self.sums[labels]
+            yield "_count", _format_labels(self.label_names, labels), cumulative
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    def __init__(self, labels: dict[str, str] | None = None) -> None:
+        self.metrics: dict[str, Metric] = {}
+        self.labels = labels or {}  # constant, on every sample
+
+    def register(self, metric: M) -> M:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = (), function: Callable[[], dict[Labels, float]] | None = None) -> Counter:
+        return self.register(Counter(name, documentation, labels, function))
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = (), function: Callable[[], dict[Labels, float]] | None = None) -> Gauge:
+        return self.register(Gauge(name, documentation, labels, function))
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (), buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, documentation, labels, buckets))
+
+    def render(self) -> str:
+        constant = ",".join(f'{name}="{_escape(value)}"' for name, value in self.labels.items())
+        return "\n".join(line for metric in self.metrics.values() for line in metric.render(constant)) + "\n"
+
+
+registry = Registry({"worker": WORKER_ID})
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
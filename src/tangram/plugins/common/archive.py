@@ -0,0 +1,153 @@
+"""Columnar archive of closed history partitions, one Parquet file per partition
+
+Files are `<directory>/<table>/<bucket>.parquet`, rows sorted by icao24 and time, so that row group
+statistics on icao24, last, latitude and longitude are narrow and queries skip most row groups.
+Files are memory mapped when read, only the row groups and columns a query needs are touched.
+
+pyarrow is optional, install it with `pip install tangram[archive]`.
+"""
+
+import logging
+import os
+import pathlib
+import time
+from typing import Any, List, Sequence
+
+from tangram.util.spatial import BoundingBox
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover
+    pa = pc = pq = None
+
+log = logging.getLogger(__name__)
+
+ARCHIVE_DIRECTORY = os.getenv("TANGRAM_HISTORY_ARCHIVE")  # no archive when not set
+ARCHIVE_RETENTION_DAYS = float(os.getenv("TANGRAM_HISTORY_ARCHIVE_DAYS", "7"))
+ROW_GROUP_SIZE = int(os.getenv("TANGRAM_HISTORY_ARCHIVE_ROW_GROUP", "8192"))  # rows, smaller groups prune better, larger ones compress better
+
+
+def schemas() -> dict[str, Any]:
+    return {
+        "trajectories": pa.schema(
+            [
+                ("icao24", pa.string()),
+                ("last", pa.float64()),
+                ("latitude", pa.float64()),
+                ("longitude", pa.float64()),
+                ("altitude", pa.float64()),
+            ]
+        ),
+        "altitudes": pa.schema([("icao24", pa.string()), ("last", pa.float64()), ("altitude", pa.float64())]),
+    }
+
+
+class HistoryArchive:
+    def __init__(self, directory: str | pathlib.Path, partition_seconds: int, row_group_size: int = ROW_GROUP_SIZE) -> None:
+        if pa is None:
+            raise RuntimeError("the history archive requires pyarrow, `pip install tangram[archive]`")
+        self.directory = pathlib.Path(directory)
+        self.partition_seconds = partition_seconds
+        self.row_group_size = row_group_size
+        self.schemas = schemas()
+
+    def path(self, table: str, bucket: int) -> pathlib.Path:
+        return self.directory / table / f"{bucket}.parquet"
+
+    def buckets(self, table: str, since: float | None = None, until: float | None = None) -> List[int]:
+        """archived partitions overlapping [since, until), from file names only"""
+        buckets = []
+        for path in (self.directory / table).glob("*.parquet"):
+            bucket = int(path.stem)
+            if (since is None or bucket + self.partition_seconds > since) and (until is None or bucket < until):
+                buckets.append(bucket)
+        return sorted(buckets)
+
+    def num_rows(self, table: str, bucket: int) -> int | None:
+        """from the file footer, None when the partition is not archived"""
+        path = self.path(table, bucket)
+        return pq.read_metadata(path).num_rows if path.exists() else None
+
+    def write(self, table: str, bucket: int, columns: dict[str, Sequence[Any]]) -> int:
+        """merges rows into the file of a partition, atomically, returns the number of rows in the file
+
+        Rows already archived are kept, e.g. when they were expired from the database since,
+        a row with the same icao24 and time is written once.
+        """
+        data = pa.table(columns, schema=self.schemas[table])
+        path = self.path(table, bucket)
+        if path.exists():
+            data = pa.concat_tables([pq.read_table(path, schema=self.schemas[table]), data])
+        data = data.sort_by([("icao24", "ascending"), ("last", "ascending")])
+        if data.num_rows > 1:  # duplicates are next to each other once sorted
+            icao24, last = data["icao24"], data["last"]
+            same = pc.and_(
+                pc.equal(icao24.slice(1), icao24.slice(0, data.num_rows - 1)),
+                pc.equal(last.slice(1), last.slice(0, data.num_rows - 1)),
+            )
+            data = data.filter(pa.concat_arrays([pa.array([True]), pc.invert(same).combine_chunks()]))
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temporary = path.with_suffix(".parquet.tmp")
+        pq.write_table(data, temporary, row_group_size=self.row_group_size, compression="zstd", write_statistics=True)
+        os.replace(temporary, path)
+        return data.num_rows
+
+    def query(
+        self,
+        table: str = "trajectories",
+        icao24: str | Sequence[str] | None = None,
+        since: float | None = None,
+        until: float | None = None,
+        bbox: BoundingBox | None = None,
+        columns: List[str] | None = None,
+    ) -> Any:
+        """a `pyarrow.Table` sorted by time
+
+        Time bounds select files by name, the filter is pushed down to row group statistics,
+        and rows of the remaining row groups are filtered exactly.
+        """
+        paths = [str(self.path(table, bucket)) for bucket in self.buckets(table, since, until)]
+        schema = self.schemas[table]
+        if not paths:
+            return schema.empty_table() if columns is None else schema.empty_table().select(columns)
+
+        conditions = []
+        if icao24 is not None:
+            conditions.append(pc.field("icao24") == icao24 if isinstance(icao24, str) else pc.field("icao24").isin(list(icao24)))
+        if since is not None:
+            conditions.append(pc.field("last") >= since)
+        if until is not None:
+            conditions.append(pc.field("last") < until)
+        if bbox is not None:
+            if table != "trajectories":
+                raise ValueError(f"no position in {table}")
+            longitudes = None
+            for part in bbox.parts():  # two when crossing the antimeridian
+                condition = (pc.field("longitude") >= part.west) & (pc.field("longitude") <= part.east)
+                longitudes = condition if longitudes is None else longitudes | condition
+            conditions.append(longitudes)
+            conditions.append((pc.field("latitude") >= bbox.south) & (pc.field("latitude") <= bbox.north))
+        expression = None
+        for condition in conditions:
+            expression = condition if expression is None else expression & condition
+
+        data = pq.read_table(paths, schema=schema, columns=columns, filters=expression, memory_map=True)
+        return data.sort_by("last") if "last" in data.column_names else data
+
+    def rows(self, *args: Any, **kwargs: Any) -> List[dict[str, Any]]:
+        return self.query(*args, **kwargs).to_pylist()
+
+    def expire(self, retention_seconds: float = ARCHIVE_RETENTION_DAYS * 86400) -> int:
+        """removes files of partitions older than the retention, returns how many"""
+        cutoff = time.time() - retention_seconds
+        removed = 0
+        for table in self.schemas:
+            for bucket in self.buckets(table, until=cutoff):
+                if bucket + self.partition_seconds <= cutoff:
+                    self.path(table, bucket).unlink(missing_ok=True)
+                    removed += 1
+        if removed:
+            log.info("%s archived partitions older than %s days removed", removed, retention_seconds / 86400)
+        return removed
@@ -1,14 +1,30 @@
+import asyncio
 import logging
 import os
-from typing import Any
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Iterable, List, Sequence
 
 import dotenv
 import httpx
+import msgspec
 from pydantic import BaseModel, Field
 
 dotenv.load_dotenv()
 log = logging.getLogger(__name__)
 
+# `msgspec` decodes response bytes straight into `Jet1090Record`,
+# `pydantic` validates every item into `Jet1090Data`, as it used to, for code relying on pydantic models
+DECODER = os.getenv("TANGRAM_RS1090_DECODER", "msgspec")
+
+# requests in flight at once, kept alive in the connection pool, for batches like `Rs1090Client.tracks`
+CONCURRENCY = int(os.getenv("TANGRAM_RS1090_CONCURRENCY", "16"))
+TIMEOUT_SECONDS = float(os.getenv("TANGRAM_RS1090_TIMEOUT_SECONDS", "10"))
+
+# `/track` responses shared by every caller asking for the same aircraft within a few seconds
+TRACK_CACHE_TTL_SECONDS = float(os.getenv("TANGRAM_TRACK_CACHE_TTL_SECONDS", "2"))
+TRACK_CACHE_SIZE = int(os.getenv("TANGRAM_TRACK_CACHE_SIZE", "1024"))  # aircraft
+
 
 class Jet1090Data(BaseModel):
     idx: int | None = None
@@ -40,6 +56,83 @@ class Jet1090Data(BaseModel):
     vrate_inertial: float | None = None
 
 
+class Bds50(msgspec.Struct):
+    """track and turn report, fields left unset when absent, unlike the ones set to null"""
+
+    roll: float | None | msgspec.UnsetType = msgspec.UNSET
+    track: float | None | msgspec.UnsetType = msgspec.UNSET
+    groundspeed: float | None | msgspec.UnsetType = msgspec.UNSET
+    TAS: float | None | msgspec.UnsetType = msgspec.UNSET
+
+
+class Bds60(msgspec.Struct):
+    """heading and speed report, fields left unset when absent, unlike the ones set to null"""
+
+    heading: float | None | msgspec.UnsetType = msgspec.UNSET
+    IAS: float | None | msgspec.UnsetType = msgspec.UNSET
+    Mach: float | None | msgspec.UnsetType = msgspec.UNSET
+    vrate_barometric: float | None | msgspec.UnsetType = msgspec.UNSET
+    vrate_inertial: float | None | msgspec.UnsetType = msgspec.UNSET
+
+
+class Jet1090Record(msgspec.Struct, kw_only=True):
+    """`Jet1090Data` as a msgspec struct, decoded without intermediate dicts.
+
+    `bds50` and `bds60` of `/track` items are flattened into the record while decoding, as `Rs1090Client.flatten`
+    does for the pydantic model: fields present in a report, null ones included, override the item's.
+    The reports are then left unset so that they are not encoded back.
+    """
+
+    idx: int | None = None
+    icao24: str
+    df: int | None = None
+
+    last: float | None = None
+    lastseen: float | None = None
+    timestamp: float | None = None
+
+    latitude: float | None = None
+    longitude: float | None = None
+    altitude: float | None = None
+    selected_altitude: float | None = None
+    groundspeed: float | None = None
+    vertical_rate: float | None = None
+    track: float | None = None
+    IAS: float | None = None
+    TAS: float | None = None
+    Mach: float | None = None
+    roll: float | None = None
+    heading: float | None = None
+    vrate_barometric: float | None = None
+    vrate_inertial: float | None = None
+
+    bds50: Bds50 | None | msgspec.UnsetType = msgspec.UNSET
+    bds60: Bds60 | None | msgspec.UnsetType = msgspec.UNSET
+
+    def __post_init__(self) -> None:
+        for report in (self.bds50, self.bds60):
+            if report:
+                for name in report.__struct_fields__:
+                    if (value := getattr(report, name)) is not msgspec.UNSET:
+                        setattr(self, name, value)
+        self.bds50 = self.bds60 = msgspec.UNSET
+
+
+Record = Jet1090Record | Jet1090Data  # decoded with msgspec or pydantic, see `DECODER`
+records_decoder = msgspec.json.Decoder(List[Jet1090Record])
+
+
+def _encode_model(obj: Any) -> Any:
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    raise NotImplementedError(f"cannot encode {type(obj)}")
+
+
+def encode_records(records: Sequence[Record]) -> bytes:
+    """JSON of decoded records, whichever the decoder"""
+    return msgspec.json.encode(records, enc_hook=_encode_model)
+
+
 class Reference(BaseModel):
     latitude: float
     longitude: float
@@ -56,12 +149,17 @@ class Receiver(BaseModel):
 
 
 class Rs1090Client:
-    def __init__(self, base_url: str | None = None) -> None:
+    def __init__(self, base_url: str | None = None, decoder: str = DECODER, concurrency: int = CONCURRENCY, timeout: float = TIMEOUT_SECONDS) -> None:
         self.base_url = base_url or os.environ.get("JET1090_URL", "http://jet1090:8080")
+        self.decoder = decoder
+        self.concurrency = concurrency
 
-        self.aclient = httpx.AsyncClient()
+        # one keep-alive connection per concurrent request, no reconnect in a batch
+        limits = httpx.Limits(max_connections=max(concurrency, 1) * 2, max_keepalive_connections=max(concurrency, 1))
+        self.aclient = httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(timeout, connect=min(timeout, 5.0)))
 
-    async def request_rs1090(self, path, params=None):  # -> None | list[Jet1090Data]:
+    async def request_content(self, path: str, params: dict[str, Any] | None = None) -> bytes | None:
+        """the response body, undecoded"""
         url = self.base_url + path
         params = params or {}
         try:
@@ -71,15 +169,40 @@ class Rs1090Client:
                 logging.error("fail to get %s, status: %s, %s", url, resp.status_code, resp.text)
                 return None
             log.debug("got data from jet1090 service")
-            return resp.json()
+            return resp.content
         except httpx.ConnectError:
             log.error("fail to connection jet1090 service, please check %s", url)
             return None
+        except httpx.TimeoutException as exc:
+            log.warning("timeout requesting %s %s: %s", url, params, type(exc).__name__)
+            return None
         except Exception:  # catch all
             log.exception("fail to get data from jet1090 service")
             return None
 
-    async def all(self, path: str | None = None) -> list[Jet1090Data] | None:
+    async def request_rs1090(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        content = await self.request_content(path, params)
+        try:
+            return msgspec.json.decode(content) if content is not None else None
+        except msgspec.DecodeError:
+            log.exception("fail to decode data from jet1090 service")
+            return None
+
+    async def request_records(self, path: str, params: dict[str, Any] | None = None) -> Sequence[Record] | None:
+        if self.decoder == "pydantic":
+            items = await self.request_rs1090(path, params)
+            return [self.flatten(item) for item in items] if items is not None else None
+
+        content = await self.request_content(path, params)
+        if content is None:
+            return None
+        try:
+            return records_decoder.decode(content)
+        except msgspec.DecodeError:  # ValidationError included
+            log.exception("fail to decode records from %s", path)
+            return None
+
+    async def all(self, path: str | None = None) -> Sequence[Record] | None:
         """instant position
         sample record for `/all`
         {
@@ -103,8 +226,7 @@ class Rs1090Client:
             "nacp": 9
         }
         """
-        items = await self.request_rs1090(path or "/all")
-        return [Jet1090Data(**item) for item in items] if items is not None else None
+        return await self.request_records(path or "/all")
 
     async def receivers(self, path: str) -> Receiver | None:
         """get receiver status from rs1090 `/receivers` endpoint
@@ -127,15 +249,47 @@ class Rs1090Client:
     async def list_identifiers(self, path: str | None = None) -> list[str]:
         return await self.request_rs1090(path or "/") or []
 
-    async def icao24_track(self, identifier: str, path: str | None = "/track") -> list[Jet1090Data] | None:
+    async def icao24_track(self, identifier: str, path: str | None = "/track") -> Sequence[Record] | None:
         """ICAO24 1 minute historical positions, `/track?icao24=010117`"""
-        items = await self.request_rs1090(path or "/track", params={"icao24": identifier})
-        if not items:
-            return None
+        return await self.request_records(path or "/track", params={"icao24": identifier}) or None
+
+    async def tracks(
+        self, icao24_list: Iterable[str], concurrency: int | None = None, path: str | None = "/track"
+    ) -> AsyncIterator[tuple[str, Sequence[Record] | None]]:
+        """`(icao24, track)` of many aircraft, `concurrency` requests at a time, yielded as they complete.
 
-        return [self.flatten(item) for item in items]
+        The track is None when its request fails or times out, the others go on. Leaving the loop early
+        cancels the requests in flight.
+        """
+        pending = iter(icao24_list)  # shared by the workers, each identifier is taken once
+        results: asyncio.Queue[tuple[str, Sequence[Record] | None] | None] = asyncio.Queue()
+
+        async def worker() -> None:
+            try:
+                for icao24 in pending:
+                    try:
+                        track = await self.icao24_track(icao24, path)
+                    except Exception:  # noqa
+                        log.exception("fail to get track of %s", icao24)
+                        track = None
+                    await results.put((icao24, track))
+            finally:
+                await results.put(None)
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(concurrency or self.concurrency, 1))]
+        try:
+            running = len(workers)
+            while running:
+                if (result := await results.get()) is None:
+                    running -= 1
+                    continue
+                yield result
+        finally:
+            for task in workers:
+                task.cancel()
 
     def flatten(self, item: dict[str, Any]) -> Jet1090Data:
+        """the pydantic path"""
         if bds50 := item.get("bds50", None):
             item |= bds50
             del item["bds50"]
@@ -143,3 +297,61 @@ class Rs1090Client:
             item |= bds60
             del item["bds60"]
         return Jet1090Data(**item)
+
+
+class TrackCache:
+    """`icao24_track` of an `Rs1090Client`, with a short TTL and single-flight requests.
+
+    Concurrent lookups of the same aircraft wait for the one request in flight, and the result is reused
+    until it expires. At most `maxsize` tracks are kept, the least recently used go first.
+    Failed requests (None) are not cached. Tracks are shared between callers, do not modify them.
+    """
+
+    def __init__(self, client: Rs1090Client, ttl: float = TRACK_CACHE_TTL_SECONDS, maxsize: int = TRACK_CACHE_SIZE) -> None:
+        self.client = client
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, Sequence[Record]]] = OrderedDict()  # icao24 -> (expiry, track), least recent first
+        self._inflight: dict[str, asyncio.Task[Sequence[Record] | None]] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0  # lookups answered by a request already in flight
+        self.evictions = 0
+
+    async def icao24_track(self, identifier: str) -> Sequence[Record] | None:
+        if (entry := self._entries.get(identifier)) is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(identifier)
+                self.hits += 1
+                return entry[1]
+            del self._entries[identifier]
+
+        if (task := self._inflight.get(identifier)) is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+            task = self._inflight[identifier] = asyncio.create_task(self._fetch(identifier))
+        return await asyncio.shield(task)  # a cancelled caller does not cancel the request for the others
+
+    async def _fetch(self, identifier: str) -> Sequence[Record] | None:
+        try:
+            track = await self.client.icao24_track(identifier)
+        finally:
+            del self._inflight[identifier]
+        if track is not None:
+            self._entries[identifier] = (time.monotonic() + self.ttl, track)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return track
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""A stand-in for the jet1090 websocket feed, pushing synthetic timed messages, for tests and local development
+
+Clients join the `jet1090` channel with the phoenix protocol, and get `data` events as messages are made up.
+The latest messages are kept, a join with `{"since": timestamp}` replays the ones after that timestamp.
+`--disconnect-every` drops every connection periodically, to exercise reconnections.
+
+    python -m tangram.plugins.common.rs1090.fake_server --port 8080 --aircraft 200 --rate 1000
+    python -m tangram.plugins.rs1090_source --jet1090-url ws://127.0.0.1:8080/websocket --redis-url redis://127.0.0.1:6379
+"""
+
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, List
+
+import msgspec
+import websockets
+
+log = logging.getLogger(__name__)
+
+
+@dataclass
+class Aircraft:
+    icao24: str
+    latitude: float
+    longitude: float
+    altitude: float
+    groundspeed: float
+    track: float
+    seen: int = field(default=0)
+
+    def message(self, timestamp: float) -> dict[str, Any]:
+        """a position or a velocity message, moving the aircraft a little"""
+        self.seen += 1
+        self.track = (self.track + random.uniform(-2, 2)) % 360
+        self.latitude += random.uniform(-0.002, 0.002)
+        self.longitude += random.uniform(-0.002, 0.002)
+        self.altitude = max(0.0, self.altitude + random.choice([-25, 0, 0, 25]))
+        if self.seen % 2:
+            return {
+                "timestamp": timestamp,
+                "icao24": self.icao24,
+                "df": 17,
+                "bds": "05",
+                "altitude": self.altitude,
+                "latitude": self.latitude,
+                "longitude": self.longitude,
+            }
+        return {"timestamp": timestamp, "icao24": self.icao24, "df": 17, "bds": "09", "groundspeed": self.groundspeed, "track": self.track, "vertical_rate": 0}
+
+
+class FakeJet1090:
+    def __init__(self, aircraft: int = 100, rate: float = 500, buffer: int = 10000, channel: str = "jet1090") -> None:
+        self.channel = channel
+        self.rate = rate
+        self.aircraft = [
+            Aircraft(
+                f"{random.getrandbits(24):06x}",
+                random.uniform(43, 49),
+                random.uniform(-1, 7),
+                random.uniform(1000, 39000),
+                random.uniform(150, 480),
+                random.uniform(0, 360),
+            )
+            for _ in range(aircraft)
+        ]
+        self.buffer: deque[tuple[float, bytes]] = deque(maxlen=buffer)  # (timestamp, payload)
+        self.clients: set[Any] = set()  # joined websockets
+        self.sent = 0
+
+    def frame(self, payload: bytes, join_ref: str | None = None) -> str:
+        return b"".join([b"[", msgspec.json.encode(join_ref), b',null,"', self.channel.encode("utf-8"), b'","data",', payload, b"]"]).decode("utf-8")
+
+    async def produce(self) -> None:
+        """messages at `rate` per second, in batches every 10ms"""
+        interval, carry = 0.01, 0.0
+        while True:
+            await asyncio.sleep(interval)
+            carry += self.rate * interval
+            count, carry = int(carry), carry - int(carry)
+            for _ in range(count):
+                timestamp = time.time()
+                payload = msgspec.json.encode(random.choice(self.aircraft).message(timestamp))
+                self.buffer.append((timestamp, payload))
+                text = self.frame(payload)
+                for websocket in list(self.clients):
+                    try:
+                        await websocket.send(text)
+                        self.sent += 1
+                    except websockets.ConnectionClosed:
+                        self.clients.discard(websocket)
+
+    async def handle(self, websocket: Any) -> None:
+        try:
+            async for text in websocket:
+                join_ref, ref, topic, event, payload = msgspec.json.decode(text)
+                if topic == "phoenix" and event == "heartbeat":
+                    await websocket.send(msgspec.json.encode([None, ref, "phoenix", "phx_reply", {"status": "ok", "response": {}}]).decode("utf-8"))
+                elif topic == self.channel and event == "phx_join":
+                    since = payload.get("since") if isinstance(payload, dict) else None
+                    await websocket.send(msgspec.json.encode([join_ref, ref, topic, "phx_reply", {"status": "ok", "response": {}}]).decode("utf-8"))
+                    # joined before replaying: messages produced while the replay is sent are not lost
+                    replay: List[bytes] = [data for timestamp, data in self.buffer if since is not None and timestamp > since]
+                    self.clients.add(websocket)
+                    for data in replay:
+                        await websocket.send(self.frame(data, join_ref))
+                    log.info("client joined %s, since: %s, replayed: %s", topic, since, len(replay))
+                elif event == "phx_leave":
+                    self.clients.discard(websocket)
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            self.clients.discard(websocket)
+
+    async def disconnect_periodically(self, seconds: float) -> None:
+        while True:
+            await asyncio.sleep(seconds)
+            log.info("dropping %s connections, %s messages sent", len(self.clients), self.sent)
+            for websocket in list(self.clients):
+                await websocket.close()
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8080, disconnect_every: float | None = None) -> None:
+        tasks = [asyncio.create_task(self.produce())]
+        if disconnect_every:
+            tasks.append(asyncio.create_task(self.disconnect_periodically(disconnect_every)))
+        try:
+            async with websockets.serve(self.handle, host, port):
+                log.info("fake jet1090 on ws://%s:%s/websocket, %s aircraft, %s messages/s", host, port, len(self.aircraft), self.rate)
+                await asyncio.Future()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--aircraft", type=int, default=100)
+    parser.add_argument("--rate", type=float, default=500, help="messages per second")
+    parser.add_argument("--disconnect-every", dest="disconnect_every", type=float, default=None, help="seconds")
+    args = parser.parse_args()
+    asyncio.run(FakeJet1090(args.aircraft, args.rate).serve(args.host, args.port, args.disconnect_every))
@@ -0,0 +1,186 @@
+"""Recent trajectories in memory, one ring buffer of float64 rows per aircraft
+
+Rows are (timestamp, latitude, longitude, altitude), a buffer starts small and doubles up to
+`points` rows, then moves its oldest rows to compressed chunks (see `tangram.util.trackcodec`),
+kept for `retention` seconds at a few bytes per row. The size of all buffers together is capped,
+aircraft not updated for `idle_seconds` and, above the cap, the least recently updated ones are evicted.
+
+Reads return a contiguous (n, 4) array, oldest row first, sliced with NumPy rather than built row by row.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Iterator
+
+import numpy as np
+
+from tangram.util import trackcodec
+
+log = logging.getLogger(__name__)
+
+MAX_BYTES = int(os.getenv("TANGRAM_TRACKSTORE_BYTES", str(64 * 1024 * 1024)))
+MAX_POINTS = int(os.getenv("TANGRAM_TRACKSTORE_POINTS", "4096"))  # per aircraft
+IDLE_SECONDS = float(os.getenv("TANGRAM_TRACKSTORE_IDLE_SECONDS", "600"))
+RETENTION_SECONDS = float(os.getenv("TANGRAM_TRACKSTORE_RETENTION_SECONDS", str(24 * 3600)))  # of compressed rows, 0 drops them
+
+TIMESTAMP, LATITUDE, LONGITUDE, ALTITUDE = range(4)  # columns
+INITIAL_POINTS = 64
+
+
+class TrackBuffer:
+    def __init__(self, points: int = MAX_POINTS, initial: int = INITIAL_POINTS, retention: float = RETENTION_SECONDS) -> None:
+        self.points = points
+        self.retention = retention
+        self.rows = np.empty((min(initial, points), 4), dtype=np.float64)
+        self.history = trackcodec.CompressedTrack()  # rows older than the ones in the ring
+        self.start = 0  # oldest row
+        self.size = 0
+        self.altitude = np.nan  # the latest, for positions reported without it
+        self.loaded = False  # earlier rows merged with `replace`, not only the ones appended since the aircraft was first seen
+        self.updated = time.monotonic()
+
+    @property
+    def nbytes(self) -> int:
+        return self.rows.nbytes + self.history.nbytes
+
+    def __len__(self) -> int:
+        return len(self.history) + self.size
+
+    def append(self, timestamp: float, latitude: float, longitude: float, altitude: float | None = None) -> int:
+        """returns how many bytes the buffer grew"""
+        if altitude is not None:
+            self.altitude = altitude
+        grown = 0
+        capacity = len(self.rows)
+        if self.size == capacity and capacity < self.points:
+            grown = self._resize(min(capacity * 2, self.points))
+            capacity = len(self.rows)
+        end = (self.start + self.size) % capacity
+        if self.size == capacity and self.retention > 0:  # full, the oldest row is about to be overwritten
+            grown += self.history.append(tuple(self.rows[end].tolist()))
+            if not self.history.pending:  # a chunk was sealed
+                grown += self.history.expire(timestamp - self.retention)
+        self.rows[end] = (timestamp, latitude, longitude, self.altitude)
+        if self.size < capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % capacity
+        self.updated = time.monotonic()
+        return grown
+
+    def set_altitude(self, timestamp: float, altitude: float) -> None:
+        """altitude messages come separately, the latest position gets it if it is not older"""
+        self.altitude = altitude
+        if self.size and timestamp >= (last := self.rows[(self.start + self.size - 1) % len(self.rows)])[TIMESTAMP]:
+            last[ALTITUDE] = altitude
+        self.updated = time.monotonic()
+
+    def _resize(self, capacity: int) -> int:
+        before = self.rows.nbytes
+        rows = np.empty((capacity, 4), dtype=np.float64)
+        rows[: self.size] = self.recent()
+        self.rows, self.start = rows, 0
+        return self.rows.nbytes - before
+
+    def array(self, since: float | None = None) -> np.ndarray:
+        """rows oldest first, a view when they do not wrap around and none is compressed, a copy otherwise"""
+        rows = self.recent(since)
+        if len(self.history) and (since is None or len(rows) == self.size):  # compressed rows may be after `since`
+            rows = np.concatenate((self.history.array(since), rows))
+        return rows
+
+    def recent(self, since: float | None = None) -> np.ndarray:
+        """rows of the ring only"""
+        end = self.start + self.size
+        if end <= len(self.rows):
+            rows = self.rows[self.start : end]
+        else:
+            rows = np.concatenate((self.rows[self.start :], self.rows[: end - len(self.rows)]))
+        if since is not None:
+            rows = rows[np.searchsorted(rows[:, TIMESTAMP], since, side="left") :]
+        return rows
+
+    def replace(self, rows: np.ndarray) -> int:
+        """merged with the rows already there, e.g. history loaded after live messages, returns the change in bytes"""
+        merged = np.concatenate((rows, self.array()))
+        merged = merged[np.argsort(merged[:, TIMESTAMP], kind="stable")]
+        before = self.nbytes
+        self.history = trackcodec.CompressedTrack()
+        if self.retention > 0 and len(merged) > self.points:
+            older = merged[: -self.points]
+            self.history.extend(older[older[:, TIMESTAMP] >= merged[-1, TIMESTAMP] - self.retention])
+        merged = merged[-self.points :]
+        capacity = min(max(INITIAL_POINTS, 1 << (len(merged) - 1).bit_length()), self.points)
+        self.rows = np.empty((capacity, 4), dtype=np.float64)
+        self.rows[: len(merged)] = merged
+        self.start, self.size = 0, len(merged)
+        self.loaded = True
+        self.updated = time.monotonic()
+        return self.nbytes - before
+
+
+class TrackStore:
+    """buffers by icao24, ordered from the least to the most recently updated"""
+
+    def __init__(self, max_bytes: int = MAX_BYTES, points: int = MAX_POINTS, idle_seconds: float = IDLE_SECONDS, retention: float = RETENTION_SECONDS) -> None:
+        self.max_bytes = max_bytes
+        self.points = points
+        self.retention = retention
+        self.idle_seconds = idle_seconds
+        self.buffers: OrderedDict[str, TrackBuffer] = OrderedDict()
+        self.nbytes = 0
+        self.evictions = 0
+
+    def __contains__(self, icao24: str) -> bool:
+        return icao24 in self.buffers
+
+    def __len__(self) -> int:
+        return len(self.buffers)
+
+    def _buffer(self, icao24: str) -> TrackBuffer:
+        if (buffer := self.buffers.get(icao24)) is None:
+            buffer = self.buffers[icao24] = TrackBuffer(self.points, retention=self.retention)
+            self.nbytes += buffer.nbytes
+        else:
+            self.buffers.move_to_end(icao24)
+        return buffer
+
+    def append(self, icao24: str, timestamp: float, latitude: float, longitude: float, altitude: float | None = None) -> None:
+        buffer = self._buffer(icao24)  # before `+=`, it may count a new buffer
+        self.nbytes += buffer.append(timestamp, latitude, longitude, altitude)
+        self.evict()
+
+    def set_altitude(self, icao24: str, timestamp: float, altitude: float) -> None:
+        self._buffer(icao24).set_altitude(timestamp, altitude)
+
+    def replace(self, icao24: str, rows: np.ndarray) -> None:
+        buffer = self._buffer(icao24)
+        self.nbytes += buffer.replace(rows)
+        self.evict()
+
+    def loaded(self, icao24: str) -> bool:
+        return (buffer := self.buffers.get(icao24)) is not None and buffer.loaded
+
+    def track(self, icao24: str, since: float | None = None) -> np.ndarray | None:
+        """(n, 4) rows, oldest first, None for an aircraft not in memory"""
+        buffer = self.buffers.get(icao24)
+        return None if buffer is None else buffer.array(since)
+
+    def evict(self) -> None:
+        """idle aircraft, then least recently updated ones while above the cap, checked from the oldest update"""
+        deadline = time.monotonic() - self.idle_seconds
+        while self.buffers:
+            icao24, buffer = next(iter(self.buffers.items()))
+            if buffer.updated > deadline and self.nbytes <= self.max_bytes:
+                break
+            del self.buffers[icao24]
+            self.nbytes -= buffer.nbytes
+            self.evictions += 1
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.buffers)
+
+    def stats(self) -> dict[str, Any]:
+        return {"aircraft": len(self.buffers), "bytes": self.nbytes, "max_bytes": self.max_bytes, "evictions": self.evictions}
@@ -1,22 +1,189 @@
 import asyncio
+import contextlib
+import functools
 import logging
 import json
+import os
+import queue
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import List, Sequence, Any
+from typing import Callable, Iterator, List, Any, Sequence
 import pathlib
 
 import sqlite3
-from datetime import datetime
 
 from tangram.plugins.common import rs1090
-from redis.commands.timeseries import TimeSeries
+from tangram.plugins.common.archive import ARCHIVE_DIRECTORY, HistoryArchive
+from redis.asyncio import Redis
+from redis.exceptions import RedisError
 from tangram.plugins import redis_subscriber
+from tangram.util import delta, simplify
+from tangram.util.spatial import BoundingBox
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 log = logging.getLogger(__name__)
 
 DEFAULT_DB_DIRECTORY = pathlib.Path("/tmp")
 
+# rows are committed in groups, at most N ms after the first one is queued, or as soon as M rows are waiting
+COMMIT_INTERVAL_MS = float(os.getenv("TANGRAM_HISTORY_COMMIT_MS", "50"))
+COMMIT_ROWS = int(os.getenv("TANGRAM_HISTORY_COMMIT_ROWS", "1000"))
+READERS = int(os.getenv("TANGRAM_HISTORY_READERS", "4"))  # read-only connections, and threads running queries
+
+# history is stored in one table per time bucket, `trajectories_<bucket start>`, expiry drops whole tables
+PARTITION_SECONDS = int(os.getenv("TANGRAM_HISTORY_PARTITION_SECONDS", str(10 * 60)))
+TRAJECTORIES, ALTITUDES = "trajectories", "altitudes"
+# older rows are left out of queries, partitions are dropped once all their rows are
+RETENTION_SECONDS = int(os.getenv("TANGRAM_HISTORY_RETENTION_SECONDS", str(2 * 60 * 60)))
+
+# redis timeseries samples of the `Subscriber`, written once per interval
+TS_FLUSH_MS = float(os.getenv("TANGRAM_HISTORY_TS_FLUSH_MS", "100"))
+TS_MAX_PENDING = int(os.getenv("TANGRAM_HISTORY_TS_MAX_PENDING", "100000"))
+TS_RETENTION_MSECS = 1000 * 60
+
+# trajectories simplified for a zoom level deviate from the original by at most this many pixels
+SIMPLIFY_PIXELS = float(os.getenv("TANGRAM_SIMPLIFY_PIXELS", "1"))
+
+
+def partition_of(timestamp: float) -> int:
+    """start of the bucket, in seconds"""
+    return int(timestamp // PARTITION_SECONDS) * PARTITION_SECONDS
+
+
+def partition_name(table: str, bucket: int) -> str:
+    return f"{table}_{bucket}"
+
+
+def rtree_name(bucket: int) -> str:
+    """spatial index of a trajectory partition, not matching `trajectories_*`, nor do its shadow tables"""
+    return f"rtree_{TRAJECTORIES}_{bucket}"
+
+
+class HistoryWriter(threading.Thread):
+    """The only connection writing to the history database, in a thread of its own.
+
+    Statements are queued from any thread and committed in groups, one transaction per group.
+    When a group fails, its statements are retried one by one, so a bad row only loses itself.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, commit_ms: float = COMMIT_INTERVAL_MS, commit_rows: int = COMMIT_ROWS) -> None:
+        super().__init__(name="history-writer", daemon=True)
+        self.conn = conn
+        self.commit_interval = commit_ms / 1000
+        self.commit_rows = commit_rows
+        self.queue: queue.Queue[tuple[str, List[Any] | None] | threading.Event | None] = queue.Queue()
+
+        self.rows = 0
+        self.commits = 0
+        self.errors = 0
+
+    def executemany(self, sql: str, rows: List[Any]) -> None:
+        if rows:
+            self.queue.put((sql, rows))
+
+    def execute(self, sql: str) -> None:
+        self.queue.put((sql, None))
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """waits for everything queued so far to be committed"""
+        done = threading.Event()
+        self.queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self) -> None:
+        self.queue.put(None)
+        self.join()
+
+    def run(self) -> None:
+        while True:
+            group: List[tuple[str, List[Any] | None]] = []
+            waiting: List[threading.Event] = []
+            rows, stopping = 0, False
+            item = self.queue.get()
+            deadline = time.monotonic() + self.commit_interval
+            while True:
+                if item is None:
+                    stopping = True
+                elif isinstance(item, threading.Event):
+                    waiting.append(item)
+                else:
+                    group.append(item)
+                    rows += len(item[1] or ())
+                if stopping or waiting or rows >= self.commit_rows or (timeout := deadline - time.monotonic()) <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+
+            self._commit(group)
+            for done in waiting:
+                done.set()
+            if stopping:
+                self.conn.close()
+                return
+
+    def _apply(self, sql: str, rows: List[Any] | None) -> None:
+        if rows is None:
+            self.conn.execute(sql)
+        else:
+            self.conn.executemany(sql, rows)
+
+    def _commit(self, group: List[tuple[str, List[Any] | None]]) -> None:
+        if not group:
+            return
+        try:
+            with self.conn:  # one transaction
+                for sql, rows in group:
+                    self._apply(sql, rows)
+            self.rows += sum(len(rows or ()) for _, rows in group)
+            self.commits += 1
+            return
+        except sqlite3.Error:
+            log.warning("fail to commit %s statements at once, retrying one by one", len(group))
+
+        for sql, rows in group:
+            try:
+                with self.conn:
+                    self._apply(sql, rows)
+                self.rows += len(rows or ())
+                self.commits += 1
+            except sqlite3.Error:
+                self.errors += 1
+                log.exception("fail to write db, %s rows lost", len(rows or ()))
+
+    def stats(self) -> dict[str, int]:
+        return {"pending": self.queue.qsize(), "rows": self.rows, "commits": self.commits, "errors": self.errors}
+
+
+class ReadPool:
+    """Read-only connections, lent to one query at a time, and the threads running queries off the event loop"""
+
+    def __init__(self, uri: str, size: int = READERS) -> None:
+        self.connections: queue.Queue[sqlite3.Connection] = queue.Queue()
+        for _ in range(max(size, 1)):
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute("PRAGMA query_only = 1")
+            conn.execute("PRAGMA read_uncommitted = 1")  # in-memory databases share a cache, do not wait for the writer's table locks
+            self.connections.put(conn)
+        self.executor = ThreadPoolExecutor(max_workers=max(size, 1), thread_name_prefix="history-reader")
+
+    @contextlib.contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn = self.connections.get()
+        try:
+            yield conn
+        finally:
+            self.connections.put(conn)
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        while not self.connections.empty():
+            self.connections.get_nowait().close()
+
 
 class HistoryDB:
     """by default, this loads data from JET1090 restful api"""
@@ -37,7 +204,15 @@ class HistoryDB:
         delete_db: bool = False,
         drop_table: bool = False,
         read_only: bool = False,
+        commit_ms: float = COMMIT_INTERVAL_MS,
+        commit_rows: int = COMMIT_ROWS,
+        readers: int = READERS,
+        retention: float = RETENTION_SECONDS,
     ):
+        if getattr(self, "readers", None) is not None:
+            log.debug("HistoryDB is already initialized, %s", self.db_file)
+            return  # a singleton, with threads and connections of its own
+
         self.jet1090_restful_client = rs1090.Rs1090Client()
 
         if db_file is not None:
@@ -65,9 +240,27 @@ class HistoryDB:
         self.db_file = db_file
         log.info("db_file: %s", self.db_file)
 
-        self.conn = sqlite3.connect(self.db_file)
+        # `:memory:` is private to a connection, the writer and the readers share a named in-memory database instead
+        if use_memory:
+            uri = f"file:tangram-history-{uuid.uuid4().hex}?mode=memory&cache=shared"
+            read_uri = uri
+        else:
+            uri, read_uri = f"file:{db_file}", f"file:{db_file}?mode=ro"
+
+        self.retention = retention
+        self.writer: HistoryWriter | None = None
+        self.partitions: set[tuple[str, int]] = set()  # (table, bucket) created so far
+        self.level_of_detail = simplify.LevelOfDetail()
+        self.conn = sqlite3.connect(read_uri if read_only else uri, uri=True, check_same_thread=False)
         if not read_only:
+            if not use_memory:
+                self.conn.execute("PRAGMA journal_mode = WAL")  # readers do not block the writer, nor the other way around
+                self.conn.execute("PRAGMA synchronous = NORMAL")
             self.__create_tables(drop_table=drop_table)
+            self.conn.commit()
+            self.writer = HistoryWriter(self.conn, commit_ms, commit_rows)
+            self.writer.start()
+        self.readers = ReadPool(read_uri, readers)
 
     def get_db_file(self):
         try:
@@ -76,59 +269,149 @@ class HistoryDB:
             return None
 
     def __create_tables(self, drop_table: bool = False):
+        for table in (TRAJECTORIES, ALTITUDES):
+            if self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone():
+                # from before partitioning, history is loaded again from jet1090 at startup
+                self.conn.execute(f"DROP TABLE {table}")
+                log.warning("unpartitioned table %s removed from db", table)
         if drop_table:
             self.drop_trajectory_table()
             self.drop_altitude_table()
-        self.create_trajectory_table()
-        self.create_altitude_table()
+        self.partitions = {(table, bucket) for table in (TRAJECTORIES, ALTITUDES) for bucket, _ in self._partitions(self.conn, table)}
+
+        for bucket, name in self._partitions(self.conn, TRAJECTORIES):
+            if not self.conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (rtree_name(bucket),)).fetchone():
+                for statement in self.create_trajectory_table(bucket)[1:]:
+                    self.conn.execute(statement)
+                self.conn.execute(f"INSERT INTO {rtree_name(bucket)} {self._rtree_select(bucket, '')} FROM {name} WHERE {self._rtree_where('')}")
+                log.info("spatial index of %s built", name)
 
     def drop_trajectory_table(self):
-        self.conn.execute("DROP TABLE trajectories IF EXISTS;")
+        for bucket, name in self._partitions(self.conn, TRAJECTORIES):
+            self.conn.execute(f"DROP TABLE IF EXISTS {name}")
+            self.conn.execute(f"DROP TABLE IF EXISTS {rtree_name(bucket)}")
         log.warning("existing table trajectories removed from db")
 
-    def create_trajectory_table(self):
-        sql = """
-          CREATE TABLE IF NOT EXISTS trajectories (
-            id integer primary key autoincrement,
-            icao24 text,
-            last real,
-            latitude real,
-            longitude real,
-            altitude real default null,
-            UNIQUE (icao24, last)
-          )
+    def create_trajectory_table(self, bucket: int) -> List[str]:
+        """the partition, its R*Tree index over (latitude, longitude, time), and triggers keeping the index in sync
+
+        R*Tree coordinates are 32-bit floats, time is stored relative to the start of the bucket to keep it precise.
         """
-        self.conn.execute(sql)
+        name, rtree = partition_name(TRAJECTORIES, bucket), rtree_name(bucket)
+        return [
+            f"""
+              CREATE TABLE IF NOT EXISTS {name} (
+                id integer primary key autoincrement,
+                icao24 text,
+                last real,
+                latitude real,
+                longitude real,
+                altitude real default null,
+                UNIQUE (icao24, last)
+              )
+            """,
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {rtree} USING rtree(id, min_lat, max_lat, min_lon, max_lon, min_t, max_t, +icao24)",
+            f"""
+              CREATE TRIGGER IF NOT EXISTS {name}_rtree_insert AFTER INSERT ON {name} WHEN {self._rtree_where("new.")}
+              BEGIN INSERT INTO {rtree} {self._rtree_select(bucket, "new.")}; END
+            """,
+            f"""
+              CREATE TRIGGER IF NOT EXISTS {name}_rtree_delete AFTER DELETE ON {name}
+              BEGIN DELETE FROM {rtree} WHERE id = old.id; END
+            """,
+        ]
+
+    def _rtree_select(self, bucket: int, prefix: str) -> str:
+        p = prefix
+        return f"SELECT {p}id, {p}latitude, {p}latitude, {p}longitude, {p}longitude, {p}last - {bucket}, {p}last - {bucket}, {p}icao24"
+
+    def _rtree_where(self, prefix: str) -> str:
+        return f"{prefix}latitude IS NOT NULL AND {prefix}longitude IS NOT NULL AND {prefix}last IS NOT NULL"
 
     def drop_altitude_table(self):
-        self.conn.execute("DROP TABLE altitudes IF EXISTS;")
+        for _, name in self._partitions(self.conn, ALTITUDES):
+            self.conn.execute(f"DROP TABLE IF EXISTS {name}")
         log.warning("existing table altitudes removed from db")
 
-    def create_altitude_table(self):
-        sql = """
-            CREATE TABLE IF NOT EXISTS altitudes (
+    def create_altitude_table(self, bucket: int) -> List[str]:
+        return [
+            f"""
+              CREATE TABLE IF NOT EXISTS {partition_name(ALTITUDES, bucket)} (
                 id integer primary key autoincrement,
                 icao24 text,
                 last real,
                 altitude real,
                 UNIQUE (icao24, last)
-            )
-        """
-        self.conn.execute(sql)
+              )
+            """
+        ]
 
-    def expire_records(self, expiration_seconds: int = 60 * 60 * 2):
-        sql = f"""
-            DELETE FROM trajectories WHERE UNIXEPOCH(current_timestamp) - last > {expiration_seconds};
-            DELETE FROM altitudes WHERE UNIXEPOCH(current_timestamp) - last > {expiration_seconds};
+    def _partitions(self, conn: sqlite3.Connection, table: str, since: float | None = None, until: float | None = None) -> List[tuple[int, str]]:
+        """(bucket, name) of the partitions of `table` overlapping [since, until), oldest first"""
+        rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?", (f"{table}_[0-9]*",)).fetchall()
+        partitions = []
+        for (name,) in rows:
+            bucket = int(name.rsplit("_", 1)[1])
+            if (since is None or bucket + PARTITION_SECONDS > since) and (until is None or bucket < until):
+                partitions.append((bucket, name))
+        return sorted(partitions)
+
+    def _insert_partitioned(self, table: str, sql: str, rows: List[dict[str, Any]]) -> None:
+        """`sql` is formatted with the partition name, rows are grouped by partition"""
+        buckets: dict[int, List[dict[str, Any]]] = {}
+        for row in rows:
+            buckets.setdefault(partition_of(row["last"]), []).append(row)
+        for bucket, partition_rows in buckets.items():
+            if (table, bucket) not in self.partitions:
+                create = self.create_trajectory_table if table == TRAJECTORIES else self.create_altitude_table
+                for statement in create(bucket):
+                    self._write(statement)
+                self.partitions.add((table, bucket))
+            self._write(sql.format(partition=partition_name(table, bucket)), partition_rows)
+
+    def _since(self, since: float | None) -> float:
+        """`since`, not before the retention, rows of the partition at the boundary stay until it is dropped"""
+        expired = time.time() - self.retention
+        return expired if since is None else max(since, expired)
+
+    def _select_partitioned(self, table: str, select: str, where: str, params: dict[str, Any], since: float | None, until: float | None) -> List[tuple]:
+        """`select ... FROM <partition> WHERE where` over the partitions in range, as one UNION ALL, ordered by time"""
+        since = self._since(since)
+        conditions = [where] if where else []
+        if since is not None:
+            conditions.append("last >= :since")
+        if until is not None:
+            conditions.append("last < :until")
+        clause = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        with self.readers.connection() as conn:
+            partitions = self._partitions(conn, table, since, until)
+            if not partitions:
+                return []
+            sql = " UNION ALL ".join(f"SELECT {select} FROM {name} {clause}" for _, name in partitions)
+            return conn.execute(f"{sql} ORDER BY 3 ASC", {**params, "since": since, "until": until}).fetchall()
+
+    def expire_records(self, expiration_seconds: float | None = None) -> int:
+        """drops partitions that are entirely expired, returns how many
+
+        Partitions are the ones known to this instance, no query is run, drops are queued to the writer thread.
+        Expired rows of the partition at the boundary are not deleted, queries leave them out.
         """
-        self.conn.executescript(sql)
-        log.info("expire records older than %s seconds", expiration_seconds)
-
-    def insert_many_tracks(self, items: List[rs1090.Jet1090Data | dict[str, Any]]) -> None:
+        cutoff = time.time() - (self.retention if expiration_seconds is None else expiration_seconds)
+        expired = sorted((table, bucket) for table, bucket in self.partitions if bucket + PARTITION_SECONDS <= cutoff)
+        for table, bucket in expired:
+            self._write(f"DROP TABLE IF EXISTS {partition_name(table, bucket)}")
+            if table == TRAJECTORIES:
+                self._write(f"DROP TABLE IF EXISTS {rtree_name(bucket)}")
+            self.partitions.discard((table, bucket))
+        if expired:
+            log.info("%s partitions older than %s dropped", len(expired), cutoff)
+        return len(expired)
+
+    def insert_many_tracks(self, items: Sequence[rs1090.Record | dict[str, Any]]) -> None:
         """required fields: icao24, last, latitude, longitude, altitude
         make altitude None if it is not available in the data."""
         sql = """
-            INSERT INTO trajectories (icao24, last, latitude, longitude, altitude)
+            INSERT INTO {partition} (icao24, last, latitude, longitude, altitude)
             VALUES (:icao24, :last, :latitude, :longitude, :altitude)
             ON CONFLICT(icao24, last) DO NOTHING
         """
@@ -142,89 +425,231 @@ class HistoryDB:
             }
             for item in items
         ]
-        try:
-            self.conn.executemany(sql, rows)
-            self.conn.commit()
-        except:  # noqa
-            log.exception("fail to write db")
+        self._insert_partitioned(TRAJECTORIES, sql, rows)
 
-    def insert_many_altitudes(self, items: List[rs1090.Jet1090Data]) -> None:
-        sql = """INSERT INTO altitudes (icao24, last, altitude) VALUES (:icao24, :last, :altitude) ON CONFLICT(icao24, last) DO NOTHING"""
-        rows = [{"icao24": item.icao24, "last": item.last, "altitude": item.altitude} for item in items]
-        try:
-            self.conn.executemany(sql, rows)
-            self.conn.commit()
-        except:  # noqa
-            log.exception("fail to write altitude into db")
+    def insert_many_altitudes(self, items: Sequence[rs1090.Record | dict[str, Any]]) -> None:
+        sql = """INSERT INTO {partition} (icao24, last, altitude) VALUES (:icao24, :last, :altitude) ON CONFLICT(icao24, last) DO NOTHING"""
+        rows = [
+            {"icao24": item["icao24"], "last": item["last"], "altitude": item["altitude"]}
+            if isinstance(item, dict)
+            else {"icao24": item.icao24, "last": item.last, "altitude": item.altitude}
+            for item in items
+        ]
+        self._insert_partitioned(ALTITUDES, sql, rows)
 
-    def list_tracks(self, icao24: str) -> List[dict[str, Any]]:
-        sql = """
-            SELECT id, icao24, last as timestamp, latitude, longitude, altitude
-            FROM trajectories
-            WHERE icao24 = :icao24
-            ORDER BY last ASC
+    def list_tracks(
+        self,
+        icao24: str,
+        since: float | None = None,
+        until: float | None = None,
+        zoom: float | None = None,
+        tolerance: float | None = None,
+    ) -> List[dict[str, Any]]:
+        """`since` and `until` in seconds, only partitions in this range are read
+
+        With a `zoom` level, or a `tolerance` in degrees, the trajectory is simplified with Douglas-Peucker,
+        point significance is cached per track, so asking again at another zoom level costs no computation.
         """
-        rows = self.conn.execute(sql, dict(icao24=icao24)).fetchall()
+        select = "id, icao24, last as timestamp, latitude, longitude, altitude"
+        rows = self._select_partitioned(TRAJECTORIES, select, "icao24 = :icao24", dict(icao24=icao24), since, until)
+        if zoom is not None and tolerance is None and rows:
+            tolerance = simplify.tolerance_for_zoom(zoom, SIMPLIFY_PIXELS, sum(row[3] for row in rows) / len(rows))
+        if tolerance and len(rows) > 2:
+            version = (len(rows), rows[0][2], rows[-1][2])
+            latitudes, longitudes = [row[3] for row in rows], [row[4] for row in rows]
+            rows = [rows[i] for i in self.level_of_detail.simplify((icao24, since, until), version, latitudes, longitudes, tolerance)]
         fields = ["id", "icao24", "timestamp", "latitude", "longitude", "altitude"]
         return [dict(zip(fields, row)) for row in rows]
 
-    def list_altitudes(self, icao24: str):
-        sql = """
-            SELECT id, icao24, last as timestamp, altitude
-            FROM altitudes
-            WHERE icao24 = :icao24
-            ORDER BY last ASC
-        """
-        rows = self.conn.execute(sql, dict(icao24=icao24)).fetchall()
+    def list_altitudes(self, icao24: str, since: float | None = None, until: float | None = None):
+        select = "id, icao24, last as timestamp, altitude"
+        rows = self._select_partitioned(ALTITUDES, select, "icao24 = :icao24", dict(icao24=icao24), since, until)
         fields = ["id", "icao24", "last", "altitude"]
         return [dict(zip(fields, row)) for row in rows]
 
     def count_tracks(self, last_minutes: int = 5):
-        sql = "SELECT count(DISTINCT icao24) FROM trajectories WHERE last > current_timestamp - :last_minutes * 60"
-        result = self.conn.execute(sql, {"last_minutes": last_minutes}).fetchone()
+        since = self._since(time.time() - last_minutes * 60)
+        with self.readers.connection() as conn:
+            partitions = self._partitions(conn, TRAJECTORIES, since)
+            if not partitions:
+                return 0
+            sql = " UNION ".join(f"SELECT DISTINCT icao24 FROM {name} WHERE last > :since" for _, name in partitions)
+            result = conn.execute(f"SELECT count(*) FROM ({sql})", {"since": since}).fetchone()
         return result[0]
 
+    def _box_conditions(self, bbox: BoundingBox, bucket: int, since: float | None, until: float | None) -> str:
+        """R*Tree constraints for a partition, relative times inlined as they differ for every partition"""
+        longitudes = " OR ".join(f"(r.max_lon >= {part.west!r} AND r.min_lon <= {part.east!r})" for part in bbox.parts())
+        conditions = [f"r.max_lat >= {bbox.south!r}", f"r.min_lat <= {bbox.north!r}", f"({longitudes})"]
+        if since is not None:
+            conditions.append(f"r.max_t >= {since - bucket!r}")
+        if until is not None:
+            conditions.append(f"r.min_t < {until - bucket!r}")
+        return " AND ".join(conditions)
+
+    def list_aircraft_in(self, bbox: BoundingBox, since: float | None = None, until: float | None = None) -> List[dict[str, Any]]:
+        """aircraft seen in a box during [since, until), from the R*Tree indices alone
+
+        Index coordinates are rounded outward to 32-bit floats, positions within about a meter of the box may match.
+        """
+        since = self._since(since)
+        with self.readers.connection() as conn:
+            partitions = self._partitions(conn, TRAJECTORIES, since, until)
+            if not partitions:
+                return []
+            sql = " UNION ALL ".join(
+                f"SELECT r.icao24 AS icao24, min(r.min_t) + {bucket} AS first, max(r.max_t) + {bucket} AS last, count(*) AS count "
+                f"FROM {rtree_name(bucket)} r WHERE {self._box_conditions(bbox, bucket, since, until)} GROUP BY r.icao24"
+                for bucket, _ in partitions
+            )
+            rows = conn.execute(f"SELECT icao24, min(first), max(last), sum(count) FROM ({sql}) GROUP BY icao24 ORDER BY icao24").fetchall()
+        fields = ["icao24", "first", "last", "count"]
+        return [dict(zip(fields, row)) for row in rows]
+
+    def list_positions_in(self, bbox: BoundingBox, since: float | None = None, until: float | None = None) -> List[dict[str, Any]]:
+        """positions in a box during [since, until), candidates from the R*Tree indices, checked exactly against the partitions"""
+        since = self._since(since)
+        longitudes = " OR ".join(f"(t.longitude BETWEEN {part.west!r} AND {part.east!r})" for part in bbox.parts())
+        exact = [f"t.latitude BETWEEN {bbox.south!r} AND {bbox.north!r}", f"({longitudes})"]
+        if since is not None:
+            exact.append(f"t.last >= {since!r}")
+        if until is not None:
+            exact.append(f"t.last < {until!r}")
+        with self.readers.connection() as conn:
+            partitions = self._partitions(conn, TRAJECTORIES, since, until)
+            if not partitions:
+                return []
+            sql = " UNION ALL ".join(
+                f"SELECT t.icao24, t.last, t.latitude, t.longitude, t.altitude FROM {rtree_name(bucket)} r JOIN {name} t ON t.id = r.id "
+                f"WHERE {self._box_conditions(bbox, bucket, since, until)} AND {' AND '.join(exact)}"
+                for bucket, name in partitions
+            )
+            rows = conn.execute(f"{sql} ORDER BY 2 ASC").fetchall()
+        fields = ["icao24", "timestamp", "latitude", "longitude", "altitude"]
+        return [dict(zip(fields, row)) for row in rows]
+
+    def _write(self, sql: str, rows: List[Any] | None = None) -> None:
+        """queued to the writer thread, committed with the next group"""
+        if self.writer is None:
+            raise RuntimeError(f"HistoryDB is read only, {self.db_file}")
+        if rows is None:
+            self.writer.execute(sql)
+        else:
+            self.writer.executemany(sql, rows)
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """blocks until writes queued so far are committed, for readers expecting their own writes"""
+        return self.writer.flush(timeout) if self.writer is not None else True
+
+    async def read(self, method: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """runs a query method, e.g. `await db.read(db.list_tracks, icao24)`, in a reader thread"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.readers.executor, functools.partial(method, *args, **kwargs))
+
+    def stats(self) -> dict[str, int]:
+        return self.writer.stats() if self.writer is not None else {}
+
+    def close(self) -> None:
+        if self.writer is not None:
+            self.writer.stop()
+            self.writer = None
+        else:
+            self.conn.close()
+        self.readers.close()
+        if getattr(HistoryDB, "instance", None) is self:
+            del HistoryDB.instance  # the next `HistoryDB()` opens the database again
+
     async def _load_history(self, identifier: str):
         """load tracks from rs1090 and save them to local db"""
-        tracks: List[rs1090.Jet1090Data] = await self.jet1090_restful_client.icao24_track(identifier) or []
+        self._save_history(await self.jet1090_restful_client.icao24_track(identifier) or [])
+
+    def _save_history(self, tracks: Sequence[rs1090.Record]):
         log.debug("total track items: %s", len(tracks))
 
-        tracks = [item for item in tracks if item.latitude and item.longitude]
-        log.debug("loaded %s tracks with latitude/longitude", len(tracks))
+        # items of `/track` have a timestamp and no last, rows without any time can not be partitioned
+        rows = [
+            {
+                "icao24": item.icao24,
+                "last": item.last if item.last is not None else item.timestamp,
+                "latitude": item.latitude,
+                "longitude": item.longitude,
+                "altitude": item.altitude,
+            }
+            for item in tracks
+            if item.latitude and item.longitude
+        ]
+        rows = [row for row in rows if row["last"] is not None]
+        log.debug("loaded %s tracks with latitude/longitude", len(rows))
 
-        self.insert_many_tracks(tracks)
+        self.insert_many_tracks(rows)
 
-        altitudes = [item for item in tracks if item.altitude]
+        altitudes = [row for row in rows if row["altitude"]]
         log.debug("loaded %s altitudes", len(altitudes))
         self.insert_many_altitudes(altitudes)
 
-    async def load_all_history(self):
+    async def load_all_history(self, concurrency: int | None = None):
+        """tracks are saved as they arrive, while the other requests are in flight"""
         icao24_list: List[str] = await self.jet1090_restful_client.list_identifiers()
-        for icao24 in icao24_list:
-            await self._load_history(icao24)
-        log.info("all history loaded from rs1090")
+        loaded = 0
+        async for icao24, tracks in self.jet1090_restful_client.tracks(icao24_list, concurrency=concurrency):
+            if tracks is None:
+                log.debug("no history for %s", icao24)
+                continue
+            self._save_history(tracks)
+            loaded += 1
+        log.info("all history loaded from rs1090, %s/%s aircraft", loaded, len(icao24_list))
 
     async def load_by_restful_client(self, seconds_interval: int = 5):
-        latest_track_ts: float = 0
+        """saves aircraft that are new or moved since the previous poll"""
+        differ = delta.SnapshotDiffer(key="icao24", version="last")
 
         while True:
-            items: List[rs1090.Jet1090Data] = await self.jet1090_restful_client.all() or []
+            items: Sequence[rs1090.Record] = await self.jet1090_restful_client.all() or []
             log.debug("total: %s", len(items))
 
-            items = [item for item in items if all((item.latitude, item.longitude, item.last))]
+            changes = differ.update(items)
+            log.debug("added: %s, changed: %s, expired: %s", len(changes.added), len(changes.changed), len(changes.removed))
 
-            latest_track_dt_str = datetime.fromtimestamp(latest_track_ts).isoformat()
-            log.debug("filter by latest_track_ts %s (%s)", latest_track_dt_str, latest_track_ts)
+            items = [item for item in items if item.icao24 in changes.added or item.icao24 in changes.changed]
+            items = [item for item in items if all((item.latitude, item.longitude, item.last))]
 
-            items = [item for item in items if item.last > latest_track_ts]
+            self.insert_many_tracks(items)
+            await asyncio.sleep(seconds_interval)
 
-            if items:
-                latest_track_ts = max(item.last for item in items)  # noqa
+    def archive_partitions(self, archive: HistoryArchive) -> int:
+        """writes closed partitions to the archive, again when rows were added since, returns how many
 
-            self.insert_many_tracks(items)
+        Rows are merged into the archived ones, a partition with fewer rows than its file, rows
+        expired from the boundary partition, is skipped, the archive never loses rows.
+        """
+        closed = partition_of(time.time()) - PARTITION_SECONDS  # the previous bucket still gets late messages
+        archived = 0
+        with self.readers.connection() as conn:
+            for table, fields in (
+                (TRAJECTORIES, ["icao24", "last", "latitude", "longitude", "altitude"]),
+                (ALTITUDES, ["icao24", "last", "altitude"]),
+            ):
+                for bucket, name in self._partitions(conn, table, until=closed):
+                    (count,) = conn.execute(f"SELECT count(*) FROM {name}").fetchone()
+                    if count == 0 or count <= (archive.num_rows(table, bucket) or 0):
+                        continue
+                    rows = conn.execute(f"SELECT {', '.join(fields)} FROM {name}").fetchall()
+                    archive.write(table, bucket, dict(zip(fields, map(list, zip(*rows)))))
+                    archived += 1
+        return archived
+
+    async def archive_periodically(self, archive: HistoryArchive, seconds_interval: int = 60):
+        loop = asyncio.get_running_loop()
+        while True:
+            try:
+                archived = await loop.run_in_executor(self.readers.executor, self.archive_partitions, archive)
+                removed = await loop.run_in_executor(self.readers.executor, archive.expire)
+                log.info("history archive, %s partitions written, %s removed", archived, removed)
+            except Exception:  # noqa
+                log.exception("fail to archive history")
             await asyncio.sleep(seconds_interval)
 
-    async def expire_records_periodically(self, seconds_expire: int = 60 * 60 * 2, seconds_interval: int = 3):
+    async def expire_records_periodically(self, seconds_expire: float | None = None, seconds_interval: float = PARTITION_SECONDS / 10):
         while True:
             self.expire_records(seconds_expire)
             await asyncio.sleep(seconds_interval)
@@ -235,10 +660,118 @@ class State:
     icao24: str | None = None
 
 
+class TimeSeriesWriter:
+    """Samples of every aircraft, written to redis timeseries in one pipeline per flush interval
+
+    Keys seen for the first time get their first sample with `TS.ADD`, which creates them with labels,
+    the other samples go to a single `TS.MADD`. Keys are remembered until redis reports them missing.
+    """
+
+    def __init__(self, redis: Redis, flush_ms: float = TS_FLUSH_MS, max_pending: int = TS_MAX_PENDING, retention_msecs: int = TS_RETENTION_MSECS):
+        self.redis = redis
+        self.flush_interval = flush_ms / 1000
+        self.max_pending = max_pending
+        self.retention_msecs = retention_msecs
+
+        self.known: set[str] = set()
+        self.samples: List[tuple[str, int, float]] = []
+        self.labels: dict[str, dict[str, str]] = {}  # of keys not known yet, with samples pending
+        self.task: asyncio.Task | None = None
+
+        self.added = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.errors = 0
+
+    def add(self, key: str, timestamp_ms: int, value: float, labels: dict[str, str]) -> None:
+        if len(self.samples) >= self.max_pending:  # redis is not keeping up
+            self.dropped += 1
+            return
+        self.samples.append((key, timestamp_ms, value))
+        if key not in self.known:
+            self.labels.setdefault(key, labels)
+        self.added += 1
+
+    def start(self) -> None:
+        self.task = asyncio.create_task(self.run())
+
+    async def stop(self) -> None:
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        except RedisError:  # shutting down, the subscriber is cleaned up anyway
+            log.exception("fail to write the last timeseries samples")
+        log.info("timeseries writer stopped, %s", self.stats())
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception:  # noqa
+                self.errors += 1
+                log.exception("fail to write timeseries")
+
+    async def flush(self) -> None:
+        if not self.samples:
+            return
+        samples, self.samples = self.samples, []
+        labels, self.labels = self.labels, {}
+
+        pipe = self.redis.pipeline(transaction=False)
+        created: List[str] = []
+        batched: List[tuple[str, int, float]] = []
+        for key, timestamp_ms, value in samples:
+            if key in labels and key not in self.known:
+                # creates the key when missing, with its labels, samples on a same timestamp replace each other
+                arguments = [key, timestamp_ms, value, "RETENTION", self.retention_msecs, "DUPLICATE_POLICY", "LAST", "ON_DUPLICATE", "LAST"]
+                pipe.execute_command("TS.ADD", *arguments, "LABELS", *(item for pair in labels[key].items() for item in pair))
+                self.known.add(key)
+                created.append(key)
+            else:
+                batched.append((key, timestamp_ms, value))
+        if batched:
+            pipe.execute_command("TS.MADD", *(item for sample in batched for item in sample))
+        results = await pipe.execute(raise_on_error=False)
+        self.flushes += 1
+
+        errors = []
+        for key, result in zip(created, results):
+            if isinstance(result, Exception):
+                errors.append(result)
+                self.known.discard(key)
+        if batched:
+            madd = results[-1]  # a result for every sample, or an error for the command
+            for (key, _, _), result in zip(batched, madd if isinstance(madd, list) else [madd] * len(batched)):
+                if isinstance(result, Exception):
+                    errors.append(result)
+                    self.known.discard(key)  # deleted, it is created again with the next sample
+        if errors:
+            self.errors += len(errors)
+            log.warning("%s timeseries samples not written, e.g. %s", len(errors), errors[0])
+
+    def stats(self) -> dict[str, int]:
+        return {
+            "known": len(self.known),
+            "pending": len(self.samples),
+            "added": self.added,
+            "dropped": self.dropped,
+            "flushes": self.flushes,
+            "errors": self.errors,
+        }
+
+
 class Subscriber(redis_subscriber.Subscriber[State]):
     def __init__(self, name: str, redis_url: str, channels: List[str], history_db: HistoryDB):
         initial_state = State()
         self.history_db = history_db  # maybe put this into `state` ?
+        # a client of its own, samples are buffered until `subscribe` starts the writer
+        self.timeseries = TimeSeriesWriter(Redis.from_url(redis_url))
         super().__init__(name, redis_url, channels, initial_state)
 
     async def message_handler(self, channel: str, data: str, pattern: str, state: State):
@@ -251,16 +784,22 @@ class Subscriber(redis_subscriber.Subscriber[State]):
         if channel == "altitude":
             await self.altitude_handler(message, state)
 
-    async def coordinate_handler(self, message: dict, state: State):
-        ts: TimeSeries = self.redis.ts()
-        retention_msecs = 1000 * 60
+    async def subscribe(self):
+        await super().subscribe()
+        self.timeseries.start()
+
+    async def cleanup(self):
+        await self.timeseries.stop()
+        await self.timeseries.redis.aclose()
+        await super().cleanup()
 
+    async def coordinate_handler(self, message: dict, state: State):
         icao24 = message["icao24"]
         timestamp_ms = int(float(message["timestamp"]) * 1000)
         latitude, longitude = float(message["latitude"]), float(message["longitude"])
         record = {
             "icao24": icao24,
-            "last": timestamp_ms,
+            "last": timestamp_ms / 1000,  # seconds, as expected by `expire_records`
             "latitude": latitude,
             "longitude": longitude,
             "altitude": None,  # no altitude from coordinate message
@@ -269,61 +808,31 @@ class Subscriber(redis_subscriber.Subscriber[State]):
         log.debug("persiste record in db for %s", icao24)
 
         # EXPERIMENTAL: store latitude and longitude in redis timeseries
-        latitude_key, longitude_key = f"latitude:{icao24}", f"longitude:{icao24}"
-        labels = {
-            "type": "latlong",
-            "icao24": icao24,
-        }
-        if not await self.redis.exists(latitude_key):
-            result = await ts.create(latitude_key, retention_msecs=retention_msecs, labels=labels)
-            log.info("add latitude_key %s %s", latitude_key, result)
-
-        if not await self.redis.exists(longitude_key):
-            result = await ts.create(longitude_key, retention_msecs=retention_msecs, labels=labels)
-            log.info("add longitude_key %s %s", longitude_key, result)
-
-        fields = ["timestamp", "icao24", "latitude", "longitude"]
-        message = {k: message[k] for k in fields}
-        values: Sequence = [
-            (latitude_key, timestamp_ms, latitude),
-            (longitude_key, timestamp_ms, longitude),
-        ]
-        await ts.madd(values)
+        labels = {"type": "latlong", "icao24": icao24}
+        self.timeseries.add(f"latitude:{icao24}", timestamp_ms, latitude, labels)
+        self.timeseries.add(f"longitude:{icao24}", timestamp_ms, longitude, labels)
 
     async def altitude_handler(self, message: dict, state: State):
-        ts = self.redis.ts()
-        retention_msecs = 1000 * 60
-
-        icao24 = message["icao24"]
-        timestamp_ms = int(float(message["timestamp"]) * 1000)
-
         if message["altitude"] is None:
             return
 
-        altitude = float(message["altitude"])
-
-        altitude_key = f"altitude:{icao24}"
-        labels = {"type": "altitude", "icao24": icao24}
-        if not await self.redis.exists(altitude_key):
-            result = await ts.create(altitude_key, retention_msecs=retention_msecs, labels=labels)
-            log.info("add key %s %s", altitude_key, result)
-
-        fields = ["timestamp", "icao24", "altitude"]
-        message = {k: message[k] for k in fields}
-        values: Sequence = [(altitude_key, timestamp_ms, altitude)]
-        await ts.madd(values)
+        icao24 = message["icao24"]
+        timestamp_ms = int(float(message["timestamp"]) * 1000)
+        self.timeseries.add(f"altitude:{icao24}", timestamp_ms, float(message["altitude"]), {"type": "altitude", "icao24": icao24})
 
 
 subscriber: Subscriber | None = None
+history_db: HistoryDB | None = None
 load_task: asyncio.Task | None = None
 expire_task: asyncio.Task | None = None
+archive_task: asyncio.Task | None = None
 
 
 async def startup(redis_url: str, channels: List[str]) -> List[asyncio.Task | None]:
     global subscriber, load_task, expire_task
     log.info("history is starting ...")
 
-    global subscriber, load_task, expire_task
+    global subscriber, history_db, load_task, expire_task, archive_task
 
     history_db = HistoryDB(use_memory=False)
     log.info("history db created, use_memory: %s", history_db)
@@ -338,6 +847,11 @@ async def startup(redis_url: str, channels: List[str]) -> List[asyncio.Task | No
     load_task = asyncio.create_task(history_db.load_by_restful_client())
     log.info("tasks created, %s", load_task.get_coro())
 
+    if ARCHIVE_DIRECTORY:
+        archive = HistoryArchive(ARCHIVE_DIRECTORY, PARTITION_SECONDS)
+        archive_task = asyncio.create_task(history_db.archive_periodically(archive))
+        log.info("tasks created, %s, archive: %s", archive_task.get_coro(), ARCHIVE_DIRECTORY)
+
     # subscriber = Subscriber(name="history", redis_url=redis_url, channels=channels, history_db=history_db)
     # await subscriber.subscribe()
     # tangram_log.info("history is up and running, task: %s", subscriber.task.get_coro())
@@ -351,6 +865,11 @@ async def shutdown():
         load_task.cancel()
     if expire_task:
         expire_task.cancel()
+    if archive_task:
+        archive_task.cancel()
+    if history_db:
+        history_db.close()  # commits what is queued
+        log.info("history db closed, %s", history_db.stats())
     log.info("history exits")
 
 
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# coding: utf8
+
+"""Timed messages pushed by jet1090 over its websocket, published to redis as they arrive
+
+jet1090 speaks the phoenix protocol on `/websocket`: the source joins the `jet1090` channel and every
+decoded message comes as an event, its payload being the message (or `{"timed_message": message}`).
+Messages are published to `jet1090-full`, where `filter` and `rate_limiting` pick them up.
+
+When the connection drops, the source reconnects with an exponential backoff, and joins with
+`{"since": <timestamp of the last message>}` so that a server keeping a buffer replays the gap.
+"""
+
+import asyncio
+import logging
+import os
+import random
+from typing import Any
+
+import msgspec
+import redis.asyncio as aioredis
+import websockets
+
+from tangram.publisher import RedisPublisher
+
+log = logging.getLogger(__name__)
+
+JET1090_URL = os.getenv("JET1090_URL", "http://jet1090:8080")
+JET1090_CHANNEL = "jet1090"
+HEARTBEAT_SECONDS = 30
+BACKOFF_INITIAL_SECONDS = 0.5
+BACKOFF_MAX_SECONDS = 30.0
+
+
+def websocket_url(jet1090_url: str) -> str:
+    """`http://jet1090:8080` => `ws://jet1090:8080/websocket`"""
+    if jet1090_url.startswith(("ws://", "wss://")):
+        return jet1090_url
+    return jet1090_url.replace("http", "ws", 1).rstrip("/") + "/websocket"
+
+
+class Jet1090Source:
+    def __init__(self, url: str, publisher: RedisPublisher, topic: str = "jet1090-full", channel: str = JET1090_CHANNEL) -> None:
+        self.url = url
+        self.publisher = publisher
+        self.topic = topic
+        self.channel = channel
+
+        self.last_timestamp: float | None = None  # resume point
+        self.received = 0
+        self.reconnects = 0
+        self._ref = 0
+
+    def _next_ref(self) -> str:
+        self._ref += 1
+        return str(self._ref)
+
+    def message_of(self, payload: Any) -> Any:
+        if isinstance(payload, dict) and isinstance(payload.get("timed_message"), dict):
+            return payload["timed_message"]
+        return payload
+
+    async def run(self) -> None:
+        """until cancelled"""
+        backoff = BACKOFF_INITIAL_SECONDS
+        while True:
+            received = self.received
+            try:
+                await self._session()
+            except asyncio.CancelledError:
+                raise
+            except (OSError, websockets.WebSocketException, asyncio.TimeoutError) as exc:
+                log.warning("jet1090 websocket %s: %s", self.url, exc)
+            except Exception:  # noqa
+                log.exception("jet1090 source fails")
+
+            if self.received > received:  # messages came through, it is worth reconnecting quickly
+                backoff = BACKOFF_INITIAL_SECONDS
+            delay = backoff * random.uniform(0.8, 1.2)
+            self.reconnects += 1
+            log.info("reconnecting to jet1090 in %.1fs, %s", delay, self.stats())
+            await asyncio.sleep(delay)
+            backoff = min(backoff * 2, BACKOFF_MAX_SECONDS)
+
+    async def _session(self) -> None:
+        async with websockets.connect(self.url, max_size=None) as websocket:
+            join_ref = self._next_ref()
+            join_payload = {} if self.last_timestamp is None else {"since": self.last_timestamp}
+            await websocket.send(msgspec.json.encode([join_ref, join_ref, self.channel, "phx_join", join_payload]).decode("utf-8"))
+            log.info("jet1090 websocket %s connected, joining %s %s", self.url, self.channel, join_payload)
+
+            heartbeat = asyncio.create_task(self._heartbeat(websocket))
+            try:
+                async for text in websocket:
+                    if not await self._on_frame(join_ref, text):
+                        break
+            finally:
+                heartbeat.cancel()
+
+    async def _heartbeat(self, websocket: Any) -> None:
+        while True:
+            await asyncio.sleep(HEARTBEAT_SECONDS)
+            await websocket.send(msgspec.json.encode([None, self._next_ref(), "phoenix", "heartbeat", {}]).decode("utf-8"))
+
+    async def _on_frame(self, join_ref: str, text: str | bytes) -> bool:
+        """returns False when the channel is closed on the server side"""
+        try:
+            _, ref, topic, event, payload = msgspec.json.decode(text)
+        except (msgspec.DecodeError, ValueError):
+            log.warning("not a phoenix message from jet1090: %.200s", text)
+            return True
+
+        if event == "phx_reply":
+            if ref == join_ref:
+                status = payload.get("status") if isinstance(payload, dict) else None
+                (log.info if status == "ok" else log.error)("join %s: %s", self.channel, payload)
+            return True
+        if event in ("phx_error", "phx_close"):
+            log.warning("jet1090 channel %s: %s", event, payload)
+            return False  # rejoin through a new connection
+        if topic != self.channel:
+            return True
+
+        message = self.message_of(payload)
+        if not isinstance(message, dict):
+            return True
+        self.received += 1
+        if isinstance(timestamp := message.get("timestamp"), (int, float)):
+            self.last_timestamp = timestamp if self.last_timestamp is None else max(self.last_timestamp, timestamp)
+        await self.publisher.publish(self.topic, msgspec.json.encode(message))
+        return True
+
+    def stats(self) -> dict[str, Any]:
+        return {"received": self.received, "reconnects": self.reconnects, "last_timestamp": self.last_timestamp, **self.publisher.stats()}
+
+
+redis_client: aioredis.Redis | None = None
+publisher: RedisPublisher | None = None
+source: Jet1090Source | None = None
+source_task: asyncio.Task | None = None
+
+
+async def startup(redis_url: str, jet1090_url: str = JET1090_URL, topic: str = "jet1090-full") -> asyncio.Task:
+    global redis_client, publisher, source, source_task
+    log.info("rs1090 source is starting, %s => %s", websocket_url(jet1090_url), topic)
+
+    redis_client = aioredis.from_url(redis_url)
+    publisher = RedisPublisher(redis_client)
+    await publisher.start()
+    source = Jet1090Source(websocket_url(jet1090_url), publisher, topic)
+    source_task = asyncio.create_task(source.run())
+    return source_task
+
+
+async def shutdown() -> None:
+    log.info("rs1090 source is shutting down ...")
+    if source_task:
+        source_task.cancel()
+        try:
+            await source_task
+        except asyncio.CancelledError:
+            pass
+    if publisher:
+        await publisher.stop()
+    if redis_client:
+        await redis_client.aclose()
+    log.info("rs1090 source exits, %s", source.stats() if source else {})
+
+
+async def main(redis_url: str, jet1090_url: str, topic: str) -> None:
+    task = await startup(redis_url, jet1090_url, topic)
+    try:
+        await task
+    finally:
+        await shutdown()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--redis-url", dest="redis_url", default=os.getenv("REDIS_URL", "redis://redis:6379"))
+    parser.add_argument("--jet1090-url", dest="jet1090_url", default=JET1090_URL, help="http(s):// or ws(s):// url of jet1090")
+    parser.add_argument("--redis-topic", dest="topic", default="jet1090-full")
+    args = parser.parse_args()
+    asyncio.run(main(args.redis_url, args.jet1090_url, args.topic))
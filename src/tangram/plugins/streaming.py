@@ -9,6 +9,8 @@ from typing import Any, List
 import httpx
 import redis
 
+from tangram.util.delta import SnapshotDiffer
+
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(message)s")
 log = logging.getLogger(__name__)
 
@@ -29,11 +31,12 @@ def jet1090_all(jet1090_service: str, api_endpoint: str = "/all") -> List[Any]:
         return []
 
 
-def main(jet1090_restful_service: str, redis_url: str, streamping_topic: str):
+def main(jet1090_restful_service: str, redis_url: str, streamping_topic: str, changes_topic: str | None = None):
     url = f"{jet1090_restful_service}/all"
     restful_client = httpx.Client()
 
     redis_client = redis.Redis.from_url(redis_url)
+    differ = SnapshotDiffer(key="icao24", version="last")
 
     log.info("streaming jet1090 to WS clients ...")
     while True:
@@ -44,6 +47,19 @@ def main(jet1090_restful_service: str, redis_url: str, streamping_topic: str):
         # data = [elt for elt in data if elt.get("latitude", None) is not None and elt["latitude"] < 50]
         redis_client.publish(streamping_topic, json.dumps(data))
         log.info("publishing to %s %s (len: %s)...", redis_url, streamping_topic, len(resp.text))
+
+        if changes_topic:  # for stages that process what changed rather than full snapshots
+            changes = differ.update(data)
+            if changes:
+                redis_client.publish(changes_topic, json.dumps({"added": changes.added, "updated": changes.changed, "expired": changes.removed}))
+                log.info(
+                    "publishing to %s %s (added: %s, updated: %s, expired: %s)",
+                    redis_url,
+                    changes_topic,
+                    len(changes.added),
+                    len(changes.changed),
+                    len(changes.removed),
+                )
         time.sleep(1)
 
 
@@ -54,8 +70,9 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--redis-url", dest="redis_url", default=os.getenv("REDIS_URL", "redis://redis:6379"))
     parser.add_argument("--streaming-topic", dest="streaming_topic", default="to:streaming:new-data")
+    parser.add_argument("--changes-topic", dest="changes_topic", default=None, help="also publish added/updated/expired aircraft, e.g. `streaming:changes`")
     parser.add_argument("--jet1090-service", dest="jet1090_service", default=os.getenv("JET1090_URL", "http://jet1090:8080"))
     args = parser.parse_args()
 
     jet1090_service = args.jet1090_service
-    main(jet1090_service, args.redis_url, args.streaming_topic)
+    main(jet1090_service, args.redis_url, args.streaming_topic, args.changes_topic)
@@ -7,12 +7,17 @@ from dataclasses import dataclass, field
 from typing import Iterable, List
 
 import msgspec
+import numpy as np
 
 from tangram.plugins import redis_subscriber
-from tangram.plugins.history import HistoryDB
-from tangram.plugins.common import rs1090
+from tangram.plugins.history import SIMPLIFY_PIXELS, HistoryDB
+from tangram.plugins.common import rs1090, trackstore
+from tangram.util import simplify
 
 jet1090_restful_client = rs1090.Rs1090Client()
+track_cache = rs1090.TrackCache(jet1090_restful_client)  # coordinate messages of the selected aircraft come in bursts
+track_store = trackstore.TrackStore()  # recent positions of every aircraft, from `coordinate` and `altitude`
+level_of_detail = simplify.LevelOfDetail()  # the track grows by a few points per message, but is reused across zoom changes
 logging.basicConfig(level=logging.DEBUG, format="%(asctime)s - %(levelname)s - %(message)s")
 log = logging.getLogger(__name__)
 
@@ -21,6 +26,17 @@ log = logging.getLogger(__name__)
 class State:
     icao24: str | None = None
     trajectory: List[Iterable[float]] = field(default_factory=list)  #  lat, longi
+    zoom: float | None = None  # of the map, trajectories are simplified for it, full resolution when unknown
+
+
+def track_rows(records: Iterable[rs1090.Record]) -> List[tuple]:
+    """(timestamp, latitude, longitude, altitude) of positions from jet1090, items of `/track` have a timestamp and no last"""
+    rows = []
+    for r in records:
+        timestamp = r.last if r.last is not None else r.timestamp
+        if r.latitude is not None and r.longitude is not None and timestamp is not None:
+            rows.append((timestamp, r.latitude, r.longitude, r.altitude))
+    return rows
 
 
 class Subscriber(redis_subscriber.Subscriber[State]):
@@ -35,30 +51,28 @@ class Subscriber(redis_subscriber.Subscriber[State]):
     async def message_handler(self, channel: str, data: str, pattern: str, state: State):
         # log.info("selected: %s, got: %s %s", state.icao24, channel, data)
 
-        if channel == "coordinate" and state.icao24:
-            # log.info("selected: %s, coordinate data: %s", state.icao24, data)
-
+        if channel == "coordinate":
             timed_message = msgspec.json.decode(data)
-            if timed_message["icao24"] == state.icao24:
-                icao24, latitude, longitude = timed_message["icao24"], timed_message["latitude"], timed_message["longitude"]
-                # await self.redis.publish("trajectory", msgspec.json.encode(timed_message))
+            icao24, latitude, longitude = timed_message["icao24"], timed_message["latitude"], timed_message["longitude"]
+            track_store.append(icao24, float(timed_message["timestamp"]), latitude, longitude, timed_message.get("altitude"))
+
+            if icao24 == state.icao24:
+                # log.info("selected: %s, coordinate data: %s", state.icao24, data)
 
                 # Two options here:
                 # 1. iddeally, we just push [lat, lng] point to UI. as long as the trajectory is properly cached
                 # trajectory = [latitude, longitude]
                 #
-                # 2. full trajectory
-                # history_trajectory = [[el["latitude"], el["longitude"]] for el in self.history_db.list_tracks(icao24)]
-                # log.info("loaded history from %s", self.history_db.get_db_file())
-                #
-                # 3. fetch from jet1090 service
-                records = await jet1090_restful_client.icao24_track(icao24) or []
-                history_trajectory = [[r.latitude, r.longitude] for r in records if r.latitude is not None and r.longitude is not None]
-
-                trajectory = history_trajectory  # + [[latitude, longitude]]
+                # 2. full trajectory, from the track store, loaded from history or jet1090 when the aircraft is selected
+                trajectory = await self.trajectory(icao24, state.zoom)
                 await self.redis.publish(f"to:trajectory-{state.icao24}:new-data", msgspec.json.encode(trajectory))
                 log.info("redis `trajectory`, icao24: %s - latitude: %s, longitude: %s, len: %s", state.icao24, latitude, longitude, len(trajectory))
 
+        if channel == "altitude":
+            timed_message = msgspec.json.decode(data)
+            if timed_message.get("altitude") is not None and timed_message["icao24"] in track_store:
+                track_store.set_altitude(timed_message["icao24"], float(timed_message["timestamp"]), float(timed_message["altitude"]))
+
         # Channels publish events. The topics are in the format of from:{channel}:{event}.
         if channel == "from:system:select":
             log.info("system select, data: %s", data)
@@ -66,9 +80,36 @@ class Subscriber(redis_subscriber.Subscriber[State]):
             payload = msgspec.json.decode(data)
             icao24 = payload["icao24"]
             state.icao24 = icao24
-            state.trajectory = [[el["latitude"], el["longitude"]] for el in self.history_db.list_tracks(icao24)]
+            state.zoom = payload.get("zoom", state.zoom)
+            state.trajectory = await self.trajectory(icao24, state.zoom)
             log.info("select a different plane: %s", state.icao24)
 
+        if channel == "from:system:zoom":
+            state.zoom = msgspec.json.decode(data).get("zoom")
+            log.debug("map zoom: %s", state.zoom)
+
+    async def load(self, icao24: str) -> None:
+        """the earlier positions of an aircraft, merged into the track store, from history, or jet1090 when history has none"""
+        tracks = await self.history_db.read(self.history_db.list_tracks, icao24)
+        rows = [(el["timestamp"], el["latitude"], el["longitude"], el["altitude"]) for el in tracks]
+        if not rows:
+            rows = track_rows(await track_cache.icao24_track(icao24) or [])
+        track_store.replace(icao24, np.array(rows, dtype=np.float64).reshape(-1, 4))  # None altitudes are NaN
+        log.info("track of %s loaded, %s points, %s", icao24, len(rows), track_store.stats())
+
+    async def trajectory(self, icao24: str, zoom: float | None) -> List[List[float]]:
+        """[latitude, longitude] points, simplified for the zoom level"""
+        if not track_store.loaded(icao24):
+            await self.load(icao24)
+        rows = track_store.track(icao24)
+        if rows is None or len(rows) == 0:
+            return []
+        if zoom is not None and len(rows) > 2:
+            tolerance = simplify.tolerance_for_zoom(zoom, SIMPLIFY_PIXELS, float(np.mean(rows[:, trackstore.LATITUDE])))
+            version = (len(rows), rows[-1, trackstore.TIMESTAMP])
+            rows = rows[level_of_detail.simplify(icao24, version, rows[:, trackstore.LATITUDE], rows[:, trackstore.LONGITUDE], tolerance)]
+        return rows[:, [trackstore.LATITUDE, trackstore.LONGITUDE]].tolist()
+
 
 subscriber: Subscriber | None = None
 
@@ -77,7 +118,7 @@ async def startup(redis_url: str):
     global subscriber
 
     log.info("trajectory is starting ...")
-    channels = ["coordinate*", "from:system:*"]
+    channels = ["coordinate*", "altitude", "from:system:*"]
     subscriber = Subscriber("trajectory", redis_url=redis_url, channels=channels)
     await subscriber.subscribe()
 
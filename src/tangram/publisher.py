@@ -0,0 +1,122 @@
+"""Publication to redis from a background task, in pipelined batches
+
+It depends on redis only, so that plugins publishing high rate streams use it without the websocket
+server, i.e. without `tangram.channels`.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, List
+
+import redis.asyncio as aioredis
+import redis.exceptions
+
+from tangram import metrics
+
+log = logging.getLogger(__name__)
+
+# messages are published in pipelined batches, of at most N messages, after waiting a few ms
+PUBLISH_BATCH_SIZE = int(os.getenv("TANGRAM_PUBLISH_BATCH_SIZE", "64"))
+PUBLISH_INTERVAL_MS = float(os.getenv("TANGRAM_PUBLISH_INTERVAL_MS", "2"))
+PUBLISH_QUEUE_SIZE = int(os.getenv("TANGRAM_PUBLISH_QUEUE_SIZE", "10000"))
+
+
+class RedisPublisher:
+    """Publishes messages to redis from a background task, in pipelined batches.
+
+    A batch goes out when it holds `batch_size` messages, or `interval` seconds after its first message,
+    so a slow redis never blocks the producer, e.g. the websocket receive path. When the queue is full,
+    only the producer waits.
+    """
+
+    def __init__(
+        self,
+        redis_client: aioredis.Redis,
+        batch_size: int = PUBLISH_BATCH_SIZE,
+        interval: float = PUBLISH_INTERVAL_MS / 1000,
+        maxsize: int = PUBLISH_QUEUE_SIZE,
+        latency: metrics.Histogram | None = None,
+    ) -> None:
+        self.redis = redis_client
+        self.latency = latency  # seconds from enqueueing to redis acknowledging, observed per message when given
+        self.batch_size = batch_size
+        self.interval = interval
+        self.queue: asyncio.Queue[tuple[str, str | bytes, float]] = asyncio.Queue(maxsize)
+        self.task: asyncio.Task | None = None
+
+        self.published = 0
+        self.batches = 0
+        self.errors = 0
+        self.latency_last = 0.0  # seconds, from enqueueing to redis acknowledging the batch
+        self.latency_max = 0.0
+        self.latency_total = 0.0
+
+    async def start(self) -> None:
+        self.task = asyncio.create_task(self._run())
+        log.info("redis publisher started, batch: %s, interval: %ss", self.batch_size, self.interval)
+
+    async def stop(self, timeout: float = 5.0) -> None:
+        """publishes the messages still queued, waiting at most `timeout` seconds for redis, then stops"""
+        if self.task and not self.task.done():
+            try:
+                await asyncio.wait_for(self.queue.join(), timeout)
+            except TimeoutError:
+                log.warning("redis publisher stopping, %s messages not published in %ss", self.queue.qsize(), timeout)
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        log.info("redis publisher stopped, %s", self.stats())
+
+    async def publish(self, topic: str, data: str | bytes) -> None:
+        await self.queue.put((topic, data, time.perf_counter()))
+
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            if self.queue.qsize() < self.batch_size - 1:
+                await asyncio.sleep(self.interval)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            await self._flush(batch)
+            for _ in batch:
+                self.queue.task_done()  # for `stop`, published or given up
+
+    async def _flush(self, batch: List[tuple[str, str | bytes, float]]) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for topic, data, _ in batch:
+            pipe.publish(topic, data)
+        try:
+            await pipe.execute()
+        except redis.exceptions.RedisError:
+            self.errors += len(batch)
+            log.exception("fail to publish %s messages", len(batch))
+            return
+
+        now = time.perf_counter()
+        for _, _, enqueued in batch:
+            latency = now - enqueued
+            if self.latency is not None:
+                self.latency.observe(latency)
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+        self.latency_last = now - batch[-1][2]
+        self.published += len(batch)
+        self.batches += 1
+
+    def stats(self) -> dict[str, Any]:
+        return {
+            "pending": self.queue.qsize(),
+            "published": self.published,
+            "batches": self.batches,
+            "errors": self.errors,
+            "latency_last": self.latency_last,
+            "latency_max": self.latency_max,
+            "latency_mean": self.latency_total / self.published if self.published else 0.0,
+        }
@@ -17,6 +17,7 @@ class TangramSettings(BaseSettings):
     host: str
     port: int
     reload: bool
+    workers: int = 1
     log_dir: pathlib.Path
     log_config: Any
     redis_url: str
@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field
+from itertools import zip_longest
+from typing import Any, Iterable, List, Mapping
+
+import msgspec
+from pydantic import BaseModel
+
+Record = dict[str, Any]
+MISSING: Any = object()  # a field absent from a record, unlike a field set to None
+
+
+@dataclass
+class SnapshotDelta:
+    """what changed between two snapshots keyed by icao24"""
+
+    added: dict[str, Record] = field(default_factory=dict)  # key -> full record
+    removed: List[str] = field(default_factory=list)  # keys
+    changed: dict[str, Record] = field(default_factory=dict)  # key -> {field: new value}, None for a removed field
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+
+def index_snapshot(items: Iterable[Any], key: str = "icao24") -> dict[str, Record]:
+    """records by key, items without the key are left out"""
+    return {item[key]: item for item in items if isinstance(item, dict) and key in item}
+
+
+class SnapshotDiffer:
+    """Turns successive snapshots, e.g. `/all` polls, into changes: added, changed (only the changed fields) and removed (expired).
+
+    The previous snapshot is kept as one tuple of values per key, not as records. A record whose `version`
+    (e.g. `last`) has not moved since the previous snapshot is taken as unchanged without comparing its fields,
+    so beyond one lookup per record, the work grows with the number of changes.
+    Records are mappings, msgspec structs (then decoded into dicts only when added), or pydantic models (dumped into dicts).
+    """
+
+    def __init__(self, key: str = "icao24", version: str | None = "last") -> None:
+        self.key = key
+        self.version = version
+        self.fields: List[str] = [version] if version else []  # order of the values in the tuples
+        self._positions: dict[str, int] = {name: i for i, name in enumerate(self.fields)}
+        self._previous: dict[Any, tuple[Any, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._previous)
+
+    def _struct_fields(self, item: msgspec.Struct) -> None:
+        if tuple(self.fields) != item.__struct_fields__:
+            self.fields = list(item.__struct_fields__)
+            self._positions = {name: i for i, name in enumerate(self.fields)}
+            self._previous = {}  # another record type, everything is new
+
+    def _values(self, item: Mapping[str, Any]) -> tuple[Any, ...]:
+        for name in item.keys() - self._positions.keys():
+            self._positions[name] = len(self.fields)
+            self.fields.append(name)
+        return tuple(item.get(name, MISSING) for name in self.fields)
+
+    def _changed(self, before: tuple[Any, ...], after: tuple[Any, ...]) -> Record:
+        return {
+            name: None if value is MISSING else value
+            for name, old, value in zip_longest(self.fields, before, after, fillvalue=MISSING)
+            if old is not value and old != value and not (old is MISSING and value is MISSING)
+        }
+
+    def update(self, items: Iterable[Any]) -> SnapshotDelta:
+        """the next snapshot, becoming the previous one"""
+        previous, delta = self._previous, SnapshotDelta()
+        current: dict[Any, tuple[Any, ...]] = {}
+        version = self._positions.get(self.version) if self.version else None
+        for item in items:
+            if isinstance(item, BaseModel):  # e.g. `Jet1090Data`, with the pydantic decoder
+                item = item.model_dump()
+            if isinstance(item, msgspec.Struct):
+                if not current:
+                    self._struct_fields(item)
+                    previous, version = self._previous, self._positions.get(self.version) if self.version else None
+                key = getattr(item, self.key, None)
+                item_version = getattr(item, self.version, None) if self.version else None
+            elif isinstance(item, Mapping):
+                key = item.get(self.key)
+                item_version = item.get(self.version) if self.version else None
+            else:
+                raise TypeError(f"records are mappings, msgspec structs or pydantic models, not {type(item).__name__}")
+            if key is None:
+                continue
+
+            before = previous.get(key)
+            if before is not None and version is not None and item_version is not None and before[version] == item_version:
+                current[key] = before
+                continue
+
+            values = msgspec.structs.astuple(item) if isinstance(item, msgspec.Struct) else self._values(item)
+            current[key] = values
+            if before is None:
+                delta.added[key] = msgspec.to_builtins(item) if isinstance(item, msgspec.Struct) else dict(item)
+            elif changed := self._changed(before, values):
+                delta.changed[key] = changed
+
+        delta.removed = [key for key in previous if key not in current]
+        self._previous = current
+        return delta
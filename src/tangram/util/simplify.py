@@ -0,0 +1,114 @@
+"""Level of detail for trajectories, with Douglas-Peucker significance computed once per track
+
+Instead of simplifying for one tolerance, every point gets the largest tolerance at which
+Douglas-Peucker keeps it. Simplifying at any tolerance, or zoom level, is then a comparison,
+and a track is only processed again when new points are appended to it.
+
+Distances are in degrees, longitudes scaled by the cosine of the mean latitude, so that a tolerance
+from `tolerance_for_zoom` at that latitude is comparable with the size of a pixel on a web mercator map.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Sequence
+
+import numpy as np
+
+TILE_SIZE = 256  # pixels
+
+
+def tolerance_for_zoom(zoom: float, pixels: float = 1.0, latitude: float = 0.0) -> float:
+    """degrees covered by `pixels` at a web mercator zoom level, around `latitude`, e.g. the mean latitude of a track
+
+    Away from the equator, a pixel covers fewer degrees of latitude, by the cosine of the latitude.
+    """
+    return pixels * 360 / (TILE_SIZE * 2**zoom) * math.cos(math.radians(latitude))
+
+
+def _projected(latitude: Sequence[float] | np.ndarray, longitude: Sequence[float] | np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    y = np.asarray(latitude, dtype=np.float64)
+    x = np.unwrap(np.asarray(longitude, dtype=np.float64), period=360)  # continuous across the antimeridian
+    return x * math.cos(math.radians(float(np.mean(y)))) if len(y) else x, y
+
+
+def significance(latitude: Sequence[float] | np.ndarray, longitude: Sequence[float] | np.ndarray) -> np.ndarray:
+    """the largest tolerance at which every point is kept, infinite for both ends
+
+    A point splitting a segment is only kept when the segment itself is split, its significance is
+    capped by the one of its parent, so that points kept at a tolerance are kept at all smaller ones.
+    """
+    x, y = _projected(latitude, longitude)
+    n = len(x)
+    result = np.zeros(n, dtype=np.float64)
+    if n == 0:
+        return result
+    result[0] = result[-1] = np.inf
+
+    # all segments of a level of the recursion at once, as many rounds as the depth of the recursion
+    firsts, lasts, caps = np.array([0]), np.array([n - 1]), np.array([np.inf])
+    while (keep := lasts - firsts >= 2).any():
+        firsts, lasts, caps = firsts[keep], lasts[keep], caps[keep]
+        counts = lasts - firsts - 1  # points inside every segment
+        offsets = np.concatenate(([0], np.cumsum(counts)[:-1]))
+        segment = np.repeat(np.arange(len(firsts)), counts)
+        inside = np.arange(int(counts.sum())) - offsets[segment] + firsts[segment] + 1
+
+        x0, y0 = x[firsts][segment], y[firsts][segment]
+        dx, dy = (x[lasts] - x[firsts])[segment], (y[lasts] - y[firsts])[segment]
+        px, py = x[inside] - x0, y[inside] - y0
+        length = np.hypot(dx, dy)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            # distance to the line through both ends, or to the point for loops
+            distances = np.where(length > 0, np.abs(px * dy - py * dx) / length, np.hypot(px, py))
+
+        largest = np.maximum.reduceat(distances, offsets)
+        candidates = np.flatnonzero(distances == largest[segment])
+        _, first = np.unique(segment[candidates], return_index=True)  # the first point at the largest distance
+        splits = inside[candidates[first]]
+        values = np.minimum(largest, caps)
+        result[splits] = values
+
+        firsts, lasts, caps = np.concatenate((firsts, splits)), np.concatenate((splits, lasts)), np.concatenate((values, values))
+    return result
+
+
+def simplify(latitude: Sequence[float] | np.ndarray, longitude: Sequence[float] | np.ndarray, tolerance: float) -> np.ndarray:
+    """indices of the points kept, in order"""
+    return np.flatnonzero(significance(latitude, longitude) > tolerance) if tolerance > 0 else np.arange(len(latitude))
+
+
+class LevelOfDetail:
+    """significance of many tracks, kept until their version changes, least recently used ones are evicted first
+
+    Thread safe, it is shared by the threads querying the history.
+    """
+
+    def __init__(self, maxsize: int = 1024) -> None:
+        self.maxsize = maxsize
+        self.cache: OrderedDict[Hashable, tuple[Any, np.ndarray]] = OrderedDict()  # key -> (version, significance)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def significance(self, key: Hashable, version: Any, latitude: Sequence[float] | np.ndarray, longitude: Sequence[float] | np.ndarray) -> np.ndarray:
+        """`version` changes when points change, e.g. the number of points and the last timestamp"""
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is not None and cached[0] == version:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+        values = significance(latitude, longitude)  # without the lock, may be computed twice for the same track
+        with self.lock:
+            self.misses += 1
+            self.cache[key] = (version, values)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.maxsize:
+                self.cache.popitem(last=False)
+        return values
+
+    def simplify(self, key: Hashable, version: Any, latitude: Sequence[float] | np.ndarray, longitude: Sequence[float] | np.ndarray, tolerance: float) -> np.ndarray:
+        if tolerance <= 0:
+            return np.arange(len(latitude))
+        return np.flatnonzero(self.significance(key, version, latitude, longitude) > tolerance)
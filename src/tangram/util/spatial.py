@@ -0,0 +1,76 @@
+import math
+from dataclasses import dataclass
+from typing import Any, Iterator, List, Mapping
+
+Record = dict[str, Any]
+
+
+@dataclass(frozen=True)
+class BoundingBox:
+    """west, south, east and north in degrees, west > east when crossing the antimeridian"""
+
+    west: float
+    south: float
+    east: float
+    north: float
+
+    @classmethod
+    def from_list(cls, bbox: List[float]) -> "BoundingBox":
+        west, south, east, north = (float(value) for value in bbox)
+        return cls(west, max(south, -90.0), east, min(north, 90.0))
+
+    def expanded(self, margin: float) -> "BoundingBox":
+        """grown by a fraction of its size on every side"""
+        dy = (self.north - self.south) * margin
+        if self.east - self.west >= 360:  # a zoomed out map, the modulo would make a narrow box of it
+            return BoundingBox(-180.0, max(self.south - dy, -90.0), 180.0, min(self.north + dy, 90.0))
+        width = (self.east - self.west) % 360 or 360
+        dx = width * margin
+        if width + 2 * dx >= 360:
+            return BoundingBox(-180.0, max(self.south - dy, -90.0), 180.0, min(self.north + dy, 90.0))
+        west, east = (self.west - dx + 180) % 360 - 180, (self.east + dx + 180) % 360 - 180
+        return BoundingBox(west, max(self.south - dy, -90.0), east, min(self.north + dy, 90.0))
+
+    def parts(self) -> Iterator["BoundingBox"]:
+        """boxes that do not cross the antimeridian"""
+        if self.west <= self.east:
+            yield self
+        else:
+            yield BoundingBox(self.west, self.south, 180.0, self.north)
+            yield BoundingBox(-180.0, self.south, self.east, self.north)
+
+
+class GridIndex:
+    """Positions bucketed in a regular lat/lon grid, for bounding box queries.
+
+    The index is built once per snapshot and queried by every client, a query touches only
+    the cells overlapping the box, or scans the records when the box covers more cells than there are records.
+    """
+
+    def __init__(self, records: Mapping[str, Record], cell_degrees: float = 1.0) -> None:
+        self.cell_degrees = cell_degrees
+        self.records = records
+        self.cells: dict[tuple[int, int], List[str]] = {}
+        for key, record in records.items():
+            latitude, longitude = record.get("latitude"), record.get("longitude")
+            if latitude is None or longitude is None:
+                continue
+            self.cells.setdefault(self._cell(latitude, longitude), []).append(key)
+
+    def _cell(self, latitude: float, longitude: float) -> tuple[int, int]:
+        return math.floor(latitude / self.cell_degrees), math.floor(longitude / self.cell_degrees)
+
+    def query(self, bbox: BoundingBox) -> set[str]:
+        """keys of the records positioned inside the box"""
+        found: set[str] = set()
+        for part in bbox.parts():
+            (row_min, col_min), (row_max, col_max) = self._cell(part.south, part.west), self._cell(part.north, part.east)
+            if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self.records):
+                candidates = (key for keys in self.cells.values() for key in keys)
+            else:
+                candidates = (key for row in range(row_min, row_max + 1) for col in range(col_min, col_max + 1) for key in self.cells.get((row, col), ()))
+            for key in candidates:
+                record = self.records[key]
+                if part.south <= record["latitude"] <= part.north and part.west <= record["longitude"] <= part.east:
+                    found.add(key)
+        return found
@@ -0,0 +1,168 @@
+"""Compressed chunks of track rows, (timestamp, latitude, longitude, altitude), in the spirit of Gorilla
+
+Values are quantized, timestamps to the millisecond, positions to 1e-6 degree (about 10 cm), altitudes
+to the foot. Timestamps are encoded as delta-of-deltas, other columns as deltas, all zigzag varints,
+so that a regularly reported, smoothly moving aircraft takes a few bytes per point. Missing values
+(NaN) are kept in a bitmap and encoded as repetitions of the previous value.
+
+Everything is vectorized with NumPy, chunks are encoded and decoded whole, and read one at a time.
+"""
+
+import struct
+from typing import Iterator, List
+
+import numpy as np
+
+COLUMNS = 4
+SCALES = np.array([1e3, 1e6, 1e6, 1.0])  # timestamp in ms, degrees in 1e-6, altitude in feet
+HEADER = struct.Struct("<I4I")  # rows, then the size in bytes of every encoded column
+
+
+def _zigzag(values: np.ndarray) -> np.ndarray:
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _unzigzag(values: np.ndarray) -> np.ndarray:
+    return (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+
+
+def _varints(values: np.ndarray) -> bytes:
+    """LEB128, 7 bits per byte, the high bit set on every byte but the last of a value"""
+    if len(values) == 0:
+        return b""
+    bits = np.zeros(len(values), dtype=np.int64)
+    nonzero = values > 0
+    bits[nonzero] = np.floor(np.log2(values[nonzero].astype(np.float64))).astype(np.int64) + 1
+    bits[nonzero & (values >= np.uint64(1 << 53))] = 64  # float64 rounding, rare enough to take the longest encoding
+    sizes = np.maximum(1, (bits + 6) // 7)
+    offsets = np.cumsum(sizes) - sizes
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(int(sizes.max())):
+        present = sizes > k
+        byte = (values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (sizes[present] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[offsets[present] + k] = (byte | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def _unvarints(data: bytes) -> np.ndarray:
+    raw = np.frombuffer(data, dtype=np.uint8)
+    if len(raw) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    last = (raw & 0x80) == 0
+    group = np.concatenate(([0], np.cumsum(last)[:-1]))  # the value every byte belongs to
+    starts = np.flatnonzero(np.concatenate(([True], last[:-1])))
+    position = np.arange(len(raw)) - starts[group]
+    parts = (raw & 0x7F).astype(np.uint64) << (7 * position).astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+def encode_chunk(rows: np.ndarray) -> bytes:
+    """(n, 4) float64 rows, ordered by time, into bytes"""
+    rows = np.asarray(rows, dtype=np.float64).reshape(-1, COLUMNS)
+    missing = np.isnan(rows)
+    filled = rows.copy()
+    if missing.any():  # carried forward, so that deltas are zero
+        index = np.where(missing, 0, np.arange(len(rows))[:, None])
+        np.maximum.accumulate(index, axis=0, out=index)
+        filled = np.where(missing, rows[index, np.arange(COLUMNS)], rows)
+        filled[np.isnan(filled)] = 0  # missing from the first row
+    quantized = np.rint(filled * SCALES).astype(np.int64)
+
+    deltas = np.diff(quantized, axis=0, prepend=np.zeros((1, COLUMNS), dtype=np.int64))
+    deltas[2:, 0] = np.diff(deltas[1:, 0])  # delta-of-delta for timestamps, after the first timestamp and the first interval
+    columns = [_varints(_zigzag(deltas[:, column])) for column in range(COLUMNS)]
+    bitmap = np.packbits(missing.ravel()).tobytes() if missing.any() else b""
+    return HEADER.pack(len(rows), *(len(column) for column in columns)) + b"".join(columns) + bitmap
+
+
+def decode_chunk(data: bytes) -> np.ndarray:
+    """(n, 4) float64 rows"""
+    n, *sizes = HEADER.unpack_from(data)
+    rows = np.empty((n, COLUMNS), dtype=np.float64)
+    offset = HEADER.size
+    for column, size in enumerate(sizes):
+        deltas = _unzigzag(_unvarints(data[offset : offset + size]))
+        offset += size
+        if column == 0:
+            deltas[1:] = np.cumsum(deltas[1:])
+        rows[:, column] = np.cumsum(deltas) / SCALES[column]
+    if offset < len(data):
+        missing = np.unpackbits(np.frombuffer(data, dtype=np.uint8, offset=offset), count=n * COLUMNS).astype(bool)
+        rows[missing.reshape(n, COLUMNS)] = np.nan
+    return rows
+
+
+class CompressedTrack:
+    """sealed chunks of `chunk_points` rows, and the rows of the chunk being filled"""
+
+    def __init__(self, chunk_points: int = 1024) -> None:
+        self.chunk_points = chunk_points
+        self.chunks: List[bytes] = []
+        self.bounds: List[tuple[float, float]] = []  # first and last timestamps of every chunk
+        self.pending: List[tuple[float, float, float, float]] = []
+        self.sealed_rows = 0
+
+    def __len__(self) -> int:
+        return self.sealed_rows + len(self.pending)
+
+    @property
+    def nbytes(self) -> int:
+        """encoded chunks, and pending rows counted as float64"""
+        return sum(len(chunk) for chunk in self.chunks) + len(self.pending) * COLUMNS * 8
+
+    def append(self, row: tuple[float, float, float, float]) -> int:
+        """returns the change in `nbytes`"""
+        self.pending.append(row)
+        if len(self.pending) < self.chunk_points:
+            return COLUMNS * 8
+        rows = np.array(self.pending, dtype=np.float64)
+        chunk = encode_chunk(rows)
+        self.chunks.append(chunk)
+        self.bounds.append((rows[0, 0], rows[-1, 0]))
+        self.sealed_rows += len(rows)
+        self.pending = []
+        return len(chunk) - (len(rows) - 1) * COLUMNS * 8
+
+    def extend(self, rows: np.ndarray) -> int:
+        """many rows at once, ordered by time and after the ones already there, returns the change in `nbytes`"""
+        before = self.nbytes
+        rows = np.asarray(rows, dtype=np.float64).reshape(-1, COLUMNS)
+        if self.pending:
+            rows = np.concatenate((np.array(self.pending, dtype=np.float64), rows))
+            self.pending = []
+        full = len(rows) - len(rows) % self.chunk_points
+        for start in range(0, full, self.chunk_points):
+            chunk = rows[start : start + self.chunk_points]
+            self.chunks.append(encode_chunk(chunk))
+            self.bounds.append((chunk[0, 0], chunk[-1, 0]))
+            self.sealed_rows += len(chunk)
+        self.pending = [tuple(row) for row in rows[full:].tolist()]
+        return self.nbytes - before
+
+    def expire(self, before: float) -> int:
+        """drops the chunks entirely older than `before`, returns the change in `nbytes`"""
+        count = 0
+        while count < len(self.bounds) and self.bounds[count][1] < before:
+            count += 1
+        if count == 0:
+            return 0
+        released = sum(len(chunk) for chunk in self.chunks[:count])
+        self.sealed_rows -= count * self.chunk_points  # sealed chunks are full
+        del self.chunks[:count], self.bounds[:count]
+        return -released
+
+    def iter_chunks(self, since: float | None = None) -> Iterator[np.ndarray]:
+        """decoded one chunk at a time, oldest first, skipping chunks before `since`"""
+        for (_, last), chunk in zip(self.bounds, self.chunks):
+            if since is None or last >= since:
+                yield decode_chunk(chunk)
+        if self.pending:
+            yield np.array(self.pending, dtype=np.float64)
+
+    def array(self, since: float | None = None) -> np.ndarray:
+        parts = list(self.iter_chunks(since))
+        rows = np.concatenate(parts) if parts else np.empty((0, COLUMNS), dtype=np.float64)
+        if since is not None:
+            rows = rows[np.searchsorted(rows[:, 0], since, side="left") :]
+        return rows
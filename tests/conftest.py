@@ -0,0 +1,13 @@
+import os
+import tempfile
+
+import pytest
+
+# `tangram.util.logging` requires it at import time
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="tangram-tests-"))
+
+
+@pytest.fixture
+def anyio_backend():
+    """tests marked with `pytest.mark.anyio` run on asyncio, as the services do"""
+    return "asyncio"
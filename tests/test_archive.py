@@ -0,0 +1,34 @@
+import pytest
+
+from tangram.util.spatial import BoundingBox
+
+pytest.importorskip("pyarrow")
+
+from tangram.plugins.common.archive import HistoryArchive
+
+
+def positions(icao24: str, longitudes: list[float], start: float = 0.0) -> dict[str, list]:
+    return {
+        "icao24": [icao24] * len(longitudes),
+        "last": [start + i for i in range(len(longitudes))],
+        "latitude": [10.0] * len(longitudes),
+        "longitude": longitudes,
+        "altitude": [None] * len(longitudes),
+    }
+
+
+def test_query_box_across_antimeridian(tmp_path):
+    archive = HistoryArchive(tmp_path, partition_seconds=600)
+    archive.write("trajectories", 0, positions("abc123", [178.0, 179.5, -179.5, -178.0, 0.0]))
+
+    rows = archive.rows(bbox=BoundingBox(179.0, 0.0, -179.0, 20.0))
+    assert [row["longitude"] for row in rows] == [179.5, -179.5]
+    assert len(archive.rows(bbox=BoundingBox(-1.0, 0.0, 1.0, 20.0))) == 1
+
+
+def test_write_merges_without_losing_rows(tmp_path):
+    archive = HistoryArchive(tmp_path, partition_seconds=600)
+    archive.write("trajectories", 0, positions("abc123", [1.0, 2.0, 3.0]))
+    # the boundary partition after expiry, fewer rows, and a late one
+    assert archive.write("trajectories", 0, {key: values[1:] for key, values in positions("abc123", [1.0, 2.0, 3.0, 4.0]).items()}) == 4
+    assert [row["last"] for row in archive.rows()] == [0.0, 1.0, 2.0, 3.0]
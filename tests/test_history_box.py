@@ -0,0 +1,54 @@
+import random
+import time
+
+import pytest
+from history_rtree import flights, scan
+
+from tangram.plugins.history import HistoryDB
+from tangram.util.spatial import BoundingBox
+
+
+@pytest.fixture
+def db():
+    random.seed(0)
+    db = HistoryDB(use_memory=True)
+    db.insert_many_tracks(flights(6000, 60, 2 * 3600 - 60))  # about twelve partitions
+    now = time.time()
+    db.insert_many_tracks(  # across the antimeridian
+        [{"icao24": "aa0000", "last": now - 600 + i, "latitude": -17.0, "longitude": (359.85 + i / 100) % 360 - 180, "altitude": None} for i in range(31)]
+    )
+    db.flush()
+    yield db
+    db.close()
+
+
+def test_partitions(db):
+    with db.readers.connection() as conn:
+        assert len(db._partitions(conn, "trajectories")) > 5
+
+
+@pytest.mark.parametrize("minutes", [20, 90])
+def test_indexed_boxes_match_a_scan(db, minutes):
+    since = time.time() - minutes * 60
+    for _ in range(10):
+        west, south = random.uniform(-5, 12), random.uniform(40, 52)
+        bbox = BoundingBox(west, south, west + 3, south + 3)
+        found, expected = db.list_aircraft_in(bbox, since), scan(db, bbox, since)
+        assert [(row["icao24"], row["count"]) for row in found] == [(row["icao24"], row["count"]) for row in expected]
+        for row, other in zip(found, expected):
+            assert row["first"] == pytest.approx(other["first"], abs=1e-3)
+            assert row["last"] == pytest.approx(other["last"], abs=1e-3)
+
+        positions = db.list_positions_in(bbox, since)
+        assert len(positions) == sum(row["count"] for row in expected)
+        assert all(bbox.south <= row["latitude"] <= bbox.north and bbox.west <= row["longitude"] <= bbox.east for row in positions)
+
+
+def test_box_across_the_antimeridian(db):
+    since = time.time() - 3600
+    [aircraft] = db.list_aircraft_in(BoundingBox(179.8, -18, -179.8, -16), since)
+    assert aircraft["icao24"] == "aa0000"
+    positions = db.list_positions_in(BoundingBox(179.8, -18, -179.8, -16), since)
+    assert aircraft["count"] == len(positions) > 0
+    assert all(row["longitude"] >= 179.8 or row["longitude"] <= -179.8 for row in positions)
+    assert db.list_aircraft_in(BoundingBox(-179.8, -18, 179.8, -16), since) == []  # the rest of the world, not this aircraft
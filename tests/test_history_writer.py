@@ -0,0 +1,50 @@
+import sqlite3
+
+import pytest
+
+from tangram.plugins.history import HistoryWriter
+
+INSERT = "INSERT INTO points (id, value) VALUES (?, ?)"
+
+
+@pytest.fixture
+def database(tmp_path):
+    path = str(tmp_path / "history.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE points (id INTEGER PRIMARY KEY, value TEXT)")
+    return path
+
+
+def count(path: str) -> int:
+    with sqlite3.connect(path) as conn:
+        return conn.execute("SELECT COUNT(*) FROM points").fetchone()[0]
+
+
+def test_queued_rows_are_committed_in_groups(database):
+    writer = HistoryWriter(sqlite3.connect(database, check_same_thread=False), commit_ms=60_000, commit_rows=25)
+    for batch in range(10):
+        writer.executemany(INSERT, [(batch * 10 + i, "x") for i in range(10)])
+    writer.start()
+    assert writer.flush(timeout=5)  # not waiting for the commit interval
+    assert count(database) == 100
+    assert writer.stats() == {"pending": 0, "rows": 100, "commits": 4, "errors": 0}  # groups of 30, 30, 30 and 10 rows
+    writer.stop()
+
+
+def test_failed_statements_are_counted(database):
+    writer = HistoryWriter(sqlite3.connect(database, check_same_thread=False), commit_ms=60_000)
+    writer.executemany(INSERT, [(1, "a"), (2, "b")])
+    writer.executemany(INSERT, [(2, "duplicate")])
+    writer.execute("INSERT INTO missing VALUES (1)")
+    writer.executemany(INSERT, [(3, "c")])
+    writer.start()
+    assert writer.flush(timeout=5)
+    assert writer.stats()["errors"] == 2
+    assert count(database) == 3  # the good statements of the failed group are retried on their own
+
+    writer.executemany(INSERT, [(4, "d")])
+    assert writer.flush(timeout=5)
+    assert writer.is_alive()
+    assert count(database) == 4
+    writer.stop()
+    assert not writer.is_alive()
@@ -0,0 +1,31 @@
+from tangram import metrics
+
+
+def test_worker_label_on_every_sample():
+    registry = metrics.Registry({"worker": "host:1"})
+    registry.counter("messages_total", "Messages", ["channel"]).inc("system")
+    registry.gauge("clients", "Clients").set(3)
+    registry.histogram("latency_seconds", "Latency", buckets=[0.1]).observe(0.05)
+
+    samples = [line for line in registry.render().splitlines() if not line.startswith("#")]
+    assert samples == [
+        'messages_total{worker="host:1",channel="system"} 1',
+        'clients{worker="host:1"} 3',
+        'latency_seconds_bucket{worker="host:1",le="0.1"} 1',
+        'latency_seconds_bucket{worker="host:1",le="+Inf"} 1',
+        'latency_seconds_sum{worker="host:1"} 0.05',
+        'latency_seconds_count{worker="host:1"} 1',
+    ]
+
+
+def test_remove_series():
+    registry = metrics.Registry()
+    counter = registry.counter("messages_total", "Messages", ["channel"])
+    histogram = registry.histogram("latency_seconds", "Latency", ["channel"])
+    for channel in ("system", "trajectory-abc123"):
+        counter.inc(channel)
+        histogram.observe(0.01, channel)
+    counter.remove("trajectory-abc123")
+    histogram.remove("trajectory-abc123")
+    assert "trajectory-abc123" not in registry.render()
+    assert 'messages_total{channel="system"} 1' in registry.render()
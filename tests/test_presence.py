@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+import redis.asyncio as aioredis
+from fake_redis import FakeRedis
+
+from tangram.channels import Hub, PresenceRegistry
+
+pytestmark = pytest.mark.anyio
+
+
+class WebSocket:
+    """never written to, joins and leaves only"""
+
+
+@pytest.fixture
+async def redis_client():
+    server = await FakeRedis().serve()
+    client = aioredis.from_url(f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}?protocol=2")
+    yield client
+    await client.aclose()
+    server.close()
+
+
+def worker(redis_client, worker_id: str, *clients: tuple[str, str], lease: int = 30) -> PresenceRegistry:
+    hub = Hub()
+    for client_id, channel in clients:
+        hub.connect(client_id, WebSocket())
+        hub.add(client_id, channel)
+    return PresenceRegistry(redis_client, hub, worker_id, lease=lease)
+
+
+async def test_workers_see_each_other(redis_client):
+    first = worker(redis_client, "host:1", ("a", "system"))
+    second = worker(redis_client, "host:2", ("b", "system"), ("c", "trajectory-abc123"))
+    for registry in (first, second):
+        await registry.renew()
+    await first.load()
+
+    assert first.channel_clients() == {"system": {"a", "b"}, "trajectory-abc123": {"c"}}
+    assert first.client_worker("b") == "host:2"
+    assert first.client_worker("a") == "host:1"
+    assert await redis_client.zrangebyscore("tangram:presence", "-inf", "+inf") == [b"host:1", b"host:2"]
+
+
+async def test_expired_and_stopped_workers_are_dropped(redis_client):
+    first = worker(redis_client, "host:1", ("a", "system"))
+    dead = worker(redis_client, "host:2", ("b", "system"), lease=1)
+    stopped = worker(redis_client, "host:3", ("c", "system"))
+    for registry in (first, dead, stopped):
+        await registry.renew()
+
+    await stopped.stop()
+    await asyncio.sleep(1.1)  # the lease of `dead` ends, it is never renewed
+    await first.renew()
+    await first.load()
+
+    assert first.channel_clients() == {"system": {"a"}}
+    assert await redis_client.zrangebyscore("tangram:presence", "-inf", "+inf") == [b"host:1"]
+    assert not await redis_client.exists("tangram:presence:host:3")
@@ -0,0 +1,22 @@
+import pytest
+import redis.asyncio as aioredis
+from fake_redis import FakeRedis
+
+from tangram.publisher import RedisPublisher
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_stop_publishes_queued_messages():
+    server = await FakeRedis().serve()
+    client = aioredis.from_url(f"redis://127.0.0.1:{server.sockets[0].getsockname()[1]}?protocol=2")
+    publisher = RedisPublisher(client, batch_size=8, interval=0.05)
+    await publisher.start()
+    for i in range(100):
+        await publisher.publish("to:system:tick", str(i))
+    await publisher.stop()
+
+    assert publisher.stats()["published"] == 100
+    assert publisher.stats()["pending"] == 0
+    await client.aclose()
+    server.close()
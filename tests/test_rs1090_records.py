@@ -0,0 +1,33 @@
+import json
+import random
+
+import msgspec
+import pytest
+from rs1090_decoding import all_response, msgspec_path, pydantic_path, track_response
+
+from tangram.plugins.common import rs1090
+
+
+@pytest.mark.parametrize("response", [all_response, track_response])
+def test_same_records_as_pydantic(response):
+    random.seed(0)
+    content = response(300)
+    assert rs1090.encode_records(msgspec_path(content)) == rs1090.encode_records(pydantic_path(content))
+
+
+@pytest.mark.parametrize(
+    "item",
+    [
+        {"icao24": "39c902", "timestamp": 1.0, "bds50": None, "bds60": None},
+        {"icao24": "39c902", "timestamp": 1.0, "bds50": {}},
+        {"icao24": "39c902", "timestamp": 1.0, "bds50": {"roll": 1.5, "track": None, "track_rate": 0.1}},
+        {"icao24": "39c902", "timestamp": 1.0, "track": 90.0, "bds50": {"track": None, "groundspeed": 420}},
+        {"icao24": "39c902", "timestamp": 1.0, "heading": 10.0, "bds60": {"heading": 12.0, "IAS": 280, "Mach": None}},
+        {"icao24": "39c902", "timestamp": 1.0, "bds50": {"TAS": 430}, "bds60": {"IAS": 280, "vrate_inertial": -32}},
+    ],
+)
+def test_flattened_reports(item):
+    content = json.dumps([item]).encode("utf-8")
+    [record] = rs1090.records_decoder.decode(content)
+    assert record.bds50 is msgspec.UNSET and record.bds60 is msgspec.UNSET
+    assert rs1090.encode_records([record]) == rs1090.encode_records(pydantic_path(content))
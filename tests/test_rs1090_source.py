@@ -0,0 +1,50 @@
+import asyncio
+import socket
+
+import msgspec
+import pytest
+
+from tangram.plugins import rs1090_source
+from tangram.plugins.common.rs1090.fake_server import FakeJet1090
+from tangram.plugins.rs1090_source import Jet1090Source
+
+pytestmark = pytest.mark.anyio
+
+
+class StubPublisher:
+    def __init__(self) -> None:
+        self.messages: list[dict] = []
+
+    async def publish(self, topic: str, data: bytes) -> None:
+        self.messages.append(msgspec.json.decode(data))
+
+    def stats(self) -> dict:
+        return {"published": len(self.messages)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def test_reconnects_and_replays_without_gaps(monkeypatch):
+    monkeypatch.setattr(rs1090_source, "BACKOFF_INITIAL_SECONDS", 0.05)
+    port = free_port()
+    fake = FakeJet1090(aircraft=20, rate=500)
+    server = asyncio.create_task(fake.serve(port=port, disconnect_every=0.3))
+    await asyncio.sleep(0.1)
+
+    publisher = StubPublisher()
+    source = Jet1090Source(f"ws://127.0.0.1:{port}/websocket", publisher)  # type: ignore[arg-type]
+    task = asyncio.create_task(source.run())
+    await asyncio.sleep(1.5)
+    task.cancel()
+    server.cancel()
+    await asyncio.gather(task, server, return_exceptions=True)
+
+    assert source.reconnects >= 2
+    received = sorted(message["timestamp"] for message in publisher.messages)
+    assert len(received) == len(set(received)), "replayed messages are not duplicated"
+    produced = [timestamp for timestamp, _ in fake.buffer if received[0] <= timestamp <= received[-1]]
+    assert received == produced, "messages produced while disconnected are replayed"
@@ -0,0 +1,70 @@
+import itertools
+import math
+
+import numpy as np
+import pytest
+
+from tangram.util.simplify import LevelOfDetail, significance, simplify, tolerance_for_zoom
+
+
+def douglas_peucker(x: list[float], y: list[float], tolerance: float) -> list[int]:
+    """the textbook recursion"""
+    kept = {0, len(x) - 1}
+
+    def split(first: int, last: int) -> None:
+        if last - first < 2:
+            return
+        dx, dy = x[last] - x[first], y[last] - y[first]
+        length = math.hypot(dx, dy)
+        largest, index = -1.0, first
+        for i in range(first + 1, last):
+            px, py = x[i] - x[first], y[i] - y[first]
+            distance = abs(px * dy - py * dx) / length if length > 0 else math.hypot(px, py)
+            if distance > largest:
+                largest, index = distance, i
+        if largest > tolerance:
+            kept.add(index)
+            split(first, index)
+            split(index, last)
+
+    split(0, len(x) - 1)
+    return sorted(kept)
+
+
+def track(n: int, latitude: float, seed: int) -> tuple[np.ndarray, np.ndarray]:
+    rng = np.random.default_rng(seed)
+    heading = np.cumsum(rng.normal(0, 0.2, n))
+    return latitude + np.cumsum(0.01 * np.cos(heading)), 2.0 + np.cumsum(0.01 * np.sin(heading))
+
+
+@pytest.mark.parametrize("seed", range(5))
+@pytest.mark.parametrize("zoom", [3, 6, 9, 12])
+def test_same_points_as_douglas_peucker(seed, zoom):
+    latitudes, longitudes = track(400, 45.0 + 5 * seed, seed)
+    tolerance = tolerance_for_zoom(zoom, 1.0, float(np.mean(latitudes)))
+    x = (longitudes * math.cos(math.radians(float(np.mean(latitudes))))).tolist()
+    assert simplify(latitudes, longitudes, tolerance).tolist() == douglas_peucker(x, latitudes.tolist(), tolerance)
+
+
+def test_nested_tolerances():
+    latitudes, longitudes = track(1000, 60.0, 0)
+    values = significance(latitudes, longitudes)
+    kept = [set(np.flatnonzero(values > tolerance_for_zoom(zoom)).tolist()) for zoom in range(2, 14)]
+    assert all(coarse <= fine for coarse, fine in itertools.pairwise(kept))
+    assert values[0] == values[-1] == np.inf
+
+
+def test_tolerance_at_latitude():
+    assert tolerance_for_zoom(0, 1.0) == pytest.approx(360 / 256)
+    assert tolerance_for_zoom(5, 2.0, 60.0) == pytest.approx(tolerance_for_zoom(5, 1.0, 0.0))  # cos(60°) = 1/2
+
+
+def test_level_of_detail_reuses_significance():
+    latitudes, longitudes = track(300, 48.0, 1)
+    level_of_detail = LevelOfDetail(maxsize=1)
+    for zoom in range(4, 10):
+        tolerance = tolerance_for_zoom(zoom, 1.0, 48.0)
+        assert level_of_detail.simplify("a", 1, latitudes, longitudes, tolerance).tolist() == simplify(latitudes, longitudes, tolerance).tolist()
+    assert (level_of_detail.hits, level_of_detail.misses) == (5, 1)
+    level_of_detail.simplify("b", 1, latitudes, longitudes, 1e-3)
+    assert list(level_of_detail.cache) == ["b"]
@@ -0,0 +1,106 @@
+import random
+
+from tangram.channels import Frame, SnapshotStream, Subscription
+
+
+def snapshots(count: int, seed: int = 0):
+    """aircraft moving, appearing and expiring"""
+    rng = random.Random(seed)
+    aircraft = {f"{i:06x}": {"icao24": f"{i:06x}", "last": 0.0, "latitude": 45.0 + i % 10, "longitude": i % 20 - 5.0} for i in range(50)}
+    for step in range(1, count + 1):
+        for record in rng.sample(list(aircraft.values()), 20):
+            record.update(last=float(step), latitude=record["latitude"] + rng.uniform(-0.5, 0.5), altitude=rng.choice([None, 30000]))
+        for icao24 in rng.sample(sorted(aircraft), 3):
+            del aircraft[icao24]
+        for i in range(3):
+            icao24 = f"{step:03x}{i:03x}"
+            aircraft[icao24] = {"icao24": icao24, "last": float(step), "latitude": rng.uniform(40, 55), "longitude": rng.uniform(-10, 10)}
+        yield Frame.encode(None, None, "system", "streaming:new-data", [dict(record) for record in aircraft.values()])
+
+
+def apply(state: dict, frame: Frame, seq: int | None) -> tuple[dict, int]:
+    """what a client does with the frames it receives"""
+    payload = frame.payload
+    if payload["type"] == "keyframe":
+        return {record["icao24"]: record for record in payload["data"]}, payload["seq"]
+    assert payload["base"] == seq
+    state = dict(state)
+    for icao24 in payload["removed"]:
+        del state[icao24]
+    for icao24, changed in payload["changed"].items():
+        state[icao24] = {**state[icao24], **changed}
+    state.update((record["icao24"], record) for record in payload["added"])
+    return state, payload["seq"]
+
+
+def without_none(records: dict) -> dict:
+    return {key: {name: value for name, value in record.items() if value is not None} for key, record in records.items()}
+
+
+def test_new_subscriber_gets_a_keyframe():
+    stream = SnapshotStream("system", "streaming:new-data")
+    for frame in snapshots(3):
+        stream.push(frame)
+    frame = stream.frame_for(Subscription("system", delta=True))
+    assert frame is not None
+    assert frame.payload["type"] == "keyframe"
+    assert frame.payload["seq"] == 3
+    assert {record["icao24"] for record in frame.payload["data"]} == set(stream.snapshot)
+
+
+def test_deltas_apply_to_the_previous_frame():
+    stream = SnapshotStream("system", "streaming:new-data", keyframe_interval=1000)
+    subscription = Subscription("system", delta=True)
+    state: dict = {}
+    seq = None
+    types = []
+    for frame in snapshots(20):
+        stream.push(frame)
+        sent = stream.frame_for(subscription)
+        assert sent is not None
+        assert stream.frame_for(subscription) is None  # already in sync
+        types.append(sent.payload["type"])
+        state, seq = apply(state, sent, seq)
+        assert without_none(state) == without_none(stream.snapshot)
+    assert types == ["keyframe"] + ["delta"] * 19
+
+
+def test_missed_snapshot_forces_a_keyframe():
+    stream = SnapshotStream("system", "streaming:new-data", keyframe_interval=1000)
+    subscription = Subscription("system", delta=True)
+    types = []
+    for step, frame in enumerate(snapshots(6)):
+        stream.push(frame)
+        if step == 3:  # e.g. dropped by the send queue
+            continue
+        sent = stream.frame_for(subscription)
+        assert sent is not None
+        types.append(sent.payload["type"])
+    assert types == ["keyframe", "delta", "delta", "keyframe", "delta"]
+
+
+def test_periodic_keyframes():
+    stream = SnapshotStream("system", "streaming:new-data", keyframe_interval=3)
+    subscription = Subscription("system", delta=True)
+    types = []
+    for frame in snapshots(8):
+        stream.push(frame)
+        sent = stream.frame_for(subscription)
+        assert sent is not None
+        types.append(sent.payload["type"])
+    assert types == ["keyframe", "delta", "delta", "delta", "keyframe", "delta", "delta", "delta"]
+
+
+def test_viewport_deltas():
+    stream = SnapshotStream("system", "streaming:new-data", keyframe_interval=1000)
+    subscription = Subscription.from_join("system", {"delta": True, "bbox": [-2, 44, 4, 50], "zoom": 6})
+    assert subscription.viewport is not None
+    state: dict = {}
+    seq = None
+    for frame in snapshots(10):
+        stream.push(frame)
+        sent = stream.frame_for(subscription)
+        assert sent is not None
+        state, seq = apply(state, sent, seq)
+        visible = stream.index.query(subscription.viewport.bbox)
+        assert without_none(state) == without_none({key: stream.snapshot[key] for key in visible})
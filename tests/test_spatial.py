@@ -0,0 +1,14 @@
+from tangram.util.spatial import BoundingBox
+
+
+def test_expanded_zoomed_out_viewport():
+    # the map at zoom 0 or 1 shows the world more than once, bounds go beyond ±180
+    bbox = BoundingBox.from_list([-200, -60, 200, 80]).expanded(0.1)
+    assert (bbox.west, bbox.east) == (-180.0, 180.0)
+    assert (bbox.south, bbox.north) == (-74.0, 90.0)
+
+
+def test_expanded_across_antimeridian():
+    bbox = BoundingBox(170.0, 0.0, -170.0, 10.0).expanded(0.5)
+    assert (bbox.west, bbox.east) == (160.0, -160.0)
+    assert list(bbox.parts()) == [BoundingBox(160.0, -5.0, 180.0, 15.0), BoundingBox(-180.0, -5.0, -160.0, 15.0)]
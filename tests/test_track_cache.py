@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from tangram.plugins.common.rs1090 import TrackCache
+
+pytestmark = pytest.mark.anyio
+
+
+class StubClient:
+    """counts the requests, each one taking `delay` seconds"""
+
+    def __init__(self, delay: float = 0.05) -> None:
+        self.delay = delay
+        self.calls: list[str] = []
+
+    async def icao24_track(self, identifier: str):
+        self.calls.append(identifier)
+        await asyncio.sleep(self.delay)
+        return None if identifier == "missing" else [{"icao24": identifier, "call": len(self.calls)}]
+
+
+async def test_concurrent_misses_make_one_request():
+    client = StubClient()
+    cache = TrackCache(client, ttl=10)  # type: ignore[arg-type]
+    tracks = await asyncio.gather(*(cache.icao24_track("39c4a1") for _ in range(20)))
+    assert client.calls == ["39c4a1"]
+    assert all(track is tracks[0] for track in tracks)
+    assert (cache.misses, cache.coalesced, cache.stats()["inflight"]) == (1, 19, 0)
+
+    assert await cache.icao24_track("39c4a1") is tracks[0]
+    assert cache.hits == 1
+
+
+async def test_expiry():
+    client = StubClient(delay=0)
+    cache = TrackCache(client, ttl=0.05)  # type: ignore[arg-type]
+    first = await cache.icao24_track("39c4a1")
+    assert await cache.icao24_track("39c4a1") is first
+    await asyncio.sleep(0.1)
+    assert await cache.icao24_track("39c4a1") != first
+    assert client.calls == ["39c4a1", "39c4a1"]
+
+
+async def test_failures_are_not_cached():
+    client = StubClient(delay=0)
+    cache = TrackCache(client, ttl=10)  # type: ignore[arg-type]
+    assert await cache.icao24_track("missing") is None
+    assert await cache.icao24_track("missing") is None
+    assert client.calls == ["missing", "missing"]
+    assert cache.stats()["size"] == 0
+
+
+async def test_least_recently_used_are_evicted():
+    client = StubClient(delay=0)
+    cache = TrackCache(client, ttl=10, maxsize=2)  # type: ignore[arg-type]
+    await cache.icao24_track("a")
+    await cache.icao24_track("b")
+    await cache.icao24_track("a")  # b is now the least recently used
+    await cache.icao24_track("c")
+    assert cache.evictions == 1
+    await cache.icao24_track("a")
+    await cache.icao24_track("b")
+    assert client.calls == ["a", "b", "c", "b"]
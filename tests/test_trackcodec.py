@@ -0,0 +1,59 @@
+import numpy as np
+
+from tangram.util.trackcodec import CompressedTrack, decode_chunk, encode_chunk
+
+
+def track(n: int = 500, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    timestamps = 1_700_000_000 + np.cumsum(rng.uniform(0.4, 1.2, n))
+    latitudes = 43.6 + np.cumsum(rng.normal(0, 1e-3, n))
+    longitudes = 1.4 + np.cumsum(rng.normal(0, 1e-3, n))
+    altitudes = 30000 + np.cumsum(rng.choice([-25.0, 0.0, 25.0], n))
+    return np.column_stack([timestamps, latitudes, longitudes, altitudes])
+
+
+def assert_round_trip(rows: np.ndarray) -> None:
+    decoded = decode_chunk(encode_chunk(rows))
+    assert decoded.shape == rows.shape
+    np.testing.assert_array_equal(np.isnan(decoded), np.isnan(rows))
+    np.testing.assert_allclose(decoded[:, 0], rows[:, 0], rtol=0, atol=5e-4)  # milliseconds
+    np.testing.assert_allclose(decoded[:, 1:3], rows[:, 1:3], rtol=0, atol=5e-7)  # 1e-6 degree
+    np.testing.assert_allclose(decoded[:, 3], rows[:, 3], rtol=0, atol=0.5)  # feet
+
+
+def test_round_trip():
+    assert_round_trip(track())
+
+
+def test_nan_altitudes():
+    rows = track()
+    rows[0, 3] = np.nan  # before any altitude
+    rows[10:40, 3] = np.nan
+    rows[-1, 3] = np.nan
+    rows[100, 1:3] = np.nan
+    assert_round_trip(rows)
+
+
+def test_non_monotonic_timestamps():
+    rows = track()
+    rows[[20, 21]] = rows[[21, 20]]
+    rows[300, 0] -= 10
+    assert_round_trip(rows)
+
+
+def test_empty_and_single_row_chunks():
+    assert_round_trip(np.empty((0, 4)))
+    assert_round_trip(track(1))
+
+
+def test_compressed_track():
+    rows = track(2500)
+    compressed = CompressedTrack(chunk_points=1024)
+    compressed.extend(rows[:1500])
+    for row in rows[1500:]:
+        compressed.append(tuple(row))
+    assert len(compressed) == len(rows)
+    assert compressed.nbytes < rows.nbytes / 2
+    np.testing.assert_allclose(compressed.array(), rows, rtol=0, atol=5e-4)
+    since = rows[1800, 0]
+    np.testing.assert_allclose(compressed.array(since=since), rows[1800:], rtol=0, atol=5e-4)
@@ -0,0 +1,35 @@
+import json
+
+from tangram.plugins.common import rs1090
+from tangram.plugins.trajectory import track_rows
+
+# like jet1090 `/track?icao24=39c902`, positions interleaved with BDS 5,0 and 6,0 reports, no `last`
+TRACK = [
+    {"icao24": "39c902", "df": 17, "timestamp": 1716550000.1, "idx": 0, "latitude": 48.7, "longitude": 2.3, "altitude": 34000},
+    {
+        "icao24": "39c902",
+        "df": 20,
+        "timestamp": 1716550000.6,
+        "idx": 1,
+        "bds50": {"roll": 0.3, "track": 91.2, "groundspeed": 420, "TAS": 430, "track_rate": 0.1},
+    },
+    {
+        "icao24": "39c902",
+        "df": 21,
+        "timestamp": 1716550001.2,
+        "idx": 2,
+        "bds60": {"heading": 90.5, "IAS": 280, "Mach": 0.78, "vrate_barometric": 0, "vrate_inertial": 32},
+    },
+    {"icao24": "39c902", "df": 17, "timestamp": 1716550001.7, "idx": 3, "latitude": 48.71, "longitude": 2.32},
+]
+
+
+def test_track_rows_from_track_payload():
+    records = rs1090.records_decoder.decode(json.dumps(TRACK).encode())
+    assert all(record.last is None for record in records)
+    assert track_rows(records) == [(1716550000.1, 48.7, 2.3, 34000.0), (1716550001.7, 48.71, 2.32, None)]
+
+
+def test_track_rows_prefers_last():
+    records = rs1090.records_decoder.decode(json.dumps([{**TRACK[0], "last": 1716550002.0}]).encode())
+    assert track_rows(records)[0][0] == 1716550002.0